@@ -0,0 +1,147 @@
+"""
+Login storm: many students signing in at once.
+
+Creates a throwaway file-backed test database with ``--logins`` students,
+then fires that many concurrent POSTs at ``login_view`` through the full
+middleware stack, one thread per student, and reports how many got in,
+how many were asked to retry (503 + Retry-After) and the latency spread.
+Run from the project root:
+
+    python benchmarks/login_storm.py --logins 500
+    python benchmarks/login_storm.py --logins 500 --no-admission
+    python benchmarks/login_storm.py --logins 500 --retry --hasher fast
+
+``--hasher fast`` swaps PBKDF2 for MD5 so the queueing behaviour can be
+seen in seconds; leave it out to measure real password cost.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fileshare.settings')
+
+import django
+
+django.setup()
+
+from django.conf import settings
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import setup_test_environment
+
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+def build_students(count):
+    from django.contrib.auth.hashers import make_password
+    from core.models import Role, User
+    from student.models import Student
+    from teacher.models import Batch
+
+    role = Role.objects.get_or_create(role_name='Student')[0]
+    batch = Batch.objects.create(batch_code='STORM')
+    # Every student shares a password so setup hashes only once
+    password = make_password('storm-password')
+    users = User.objects.bulk_create([
+        User(username=f'storm{i}', role=role, batch=batch, password=password)
+        for i in range(count)
+    ])
+    Student.objects.bulk_create([
+        Student(user=user, student_code=f'STORM-{i:05d}', name=user.username, batch=batch)
+        for i, user in enumerate(users)
+    ])
+    return [user.username for user in users]
+
+
+def sign_in(username, start, retry, retry_scale, max_attempts):
+    """One student's sign-in; returns (outcome, seconds from the start signal, attempts)"""
+    start.wait()
+    started = time.perf_counter()
+    client = Client()
+    attempts = 0
+    try:
+        while True:
+            attempts += 1
+            response = client.post('/', {'username': username, 'password': 'storm-password'})
+            if response.status_code == 503 and retry and attempts < max_attempts:
+                time.sleep(int(response.get('Retry-After', 1)) * retry_scale)
+                continue
+            if response.status_code == 302:
+                outcome = 'signed in'
+            elif response.status_code == 503:
+                outcome = 'asked to retry'
+            else:
+                outcome = f'HTTP {response.status_code}'
+            return outcome, time.perf_counter() - started, attempts
+    finally:
+        connections.close_all()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--logins', type=int, default=500)
+    parser.add_argument('--hasher', choices=['default', 'fast'], default='default')
+    parser.add_argument('--no-admission', action='store_true', help="Let every request in at once")
+    parser.add_argument('--retry', action='store_true', help="Clients honour Retry-After and try again")
+    parser.add_argument('--retry-scale', type=float, default=0.1, help="Multiply Retry-After by this when sleeping")
+    parser.add_argument('--max-attempts', type=int, default=20)
+    args = parser.parse_args()
+
+    from core.admission import reset_queues
+
+    if args.hasher == 'fast':
+        settings.PASSWORD_HASHERS = FAST_HASHERS
+    if args.no_admission:
+        settings.ADMISSION_QUEUES = {'login': {'slots': args.logins, 'max_waiting': 0}}
+    reset_queues()
+
+    setup_test_environment()
+    settings.ALLOWED_HOSTS = ['testserver']
+    if connection.vendor == 'sqlite':
+        # A file, not shared-cache memory, so each thread gets its own connection
+        db_dir = tempfile.mkdtemp()
+        connection.settings_dict['TEST']['NAME'] = os.path.join(db_dir, 'login_storm.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        usernames = build_students(args.logins)
+        connections.close_all()
+
+        start = threading.Event()
+        with ThreadPoolExecutor(max_workers=args.logins) as pool:
+            futures = [
+                pool.submit(sign_in, username, start, args.retry, args.retry_scale, args.max_attempts)
+                for username in usernames
+            ]
+            began = time.perf_counter()
+            start.set()
+            results = [future.result() for future in futures]
+            wall = time.perf_counter() - began
+
+        outcomes = Counter(outcome for outcome, _, _ in results)
+        latencies = [seconds for outcome, seconds, _ in results if outcome == 'signed in']
+        print(f"{args.logins} concurrent sign-ins in {wall:.1f}s "
+              f"(hasher={args.hasher}, admission={'off' if args.no_admission else 'on'}, retry={'on' if args.retry else 'off'})")
+        for outcome, count in outcomes.most_common():
+            print(f"  {outcome:>15}: {count}")
+        print(f"  {'attempts':>15}: {sum(attempts for _, _, attempts in results)}")
+        if latencies:
+            print(f"  signed-in latency p50 {statistics.median(latencies):.2f}s, "
+                  f"p95 {percentile(latencies, 0.95):.2f}s, max {max(latencies):.2f}s")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Share latency against batch size.
+
+Creates a throwaway test database, fills batches of increasing size and
+times ``Upload.save()`` for a new file shared with each batch, which is
+where the notification fan-out happens. Run from the project root:
+
+    python benchmarks/share_latency.py --sizes 10 100 1000 --repeat 3
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fileshare.settings')
+
+import django
+
+django.setup()
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.utils import timezone
+
+
+def build_batch(size, roles):
+    from core.models import User
+    from student.models import Student
+    from teacher.models import Batch
+
+    batch = Batch.objects.create(batch_code=f'BENCH{size}')
+    users = User.objects.bulk_create([
+        User(username=f'bench{size}_{i}', role=roles['Student'], batch=batch)
+        for i in range(size)
+    ])
+    Student.objects.bulk_create([
+        Student(user=user, student_code=f'BENCH{size}-{i:05d}', name=user.username, batch=batch)
+        for i, user in enumerate(users)
+    ])
+    return batch
+
+
+def time_share(batch, teacher):
+    from teacher.models import Upload
+
+    today = timezone.now().date()
+    upload = Upload(
+        teacher=teacher, batch=batch, subject='Physics', topic='Benchmark',
+        from_date=today, to_date=today,
+    )
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        with transaction.atomic():  # As in the atomic share_file view
+            upload.save()
+        elapsed = time.perf_counter() - started
+    return elapsed, len(queries.captured_queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    from core.models import Role, User
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        roles = {name: Role.objects.get_or_create(role_name=name)[0] for name in ('Teacher', 'Student')}
+        teacher = User.objects.create(username='bench_teacher', first_name='Bench', role=roles['Teacher'])
+
+        print(f"{'students':>9} {'median ms':>10} {'max ms':>8} {'queries':>8}")
+        for size in args.sizes:
+            batch = build_batch(size, roles)
+            timings = [time_share(batch, teacher) for _ in range(args.repeat)]
+            durations = [elapsed * 1000 for elapsed, _ in timings]
+            print(f"{size:>9} {statistics.median(durations):>10.1f} {max(durations):>8.1f} {timings[-1][1]:>8}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
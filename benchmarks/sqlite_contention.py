@@ -0,0 +1,153 @@
+"""
+SQLite contention: concurrent readers and read-then-write transactions.
+
+Runs the same workload against a fresh file-backed test database once per
+profile and reports lock errors and latency for each:
+
+    legacy  rollback journal, no pragmas, deferred BEGIN (the old setup)
+    tuned   SQLITE_PRAGMAS from settings and BEGIN IMMEDIATE for writes
+    queued  tuned, with writers taking turns through core.writer
+
+Writers mimic a POST to an atomic view: read a little, then insert.
+Readers mimic page views. Run from the project root:
+
+    python benchmarks/sqlite_contention.py
+    python benchmarks/sqlite_contention.py --readers 16 --writers 16 --seconds 10
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fileshare.settings')
+
+import django
+
+django.setup()
+
+from django.conf import settings
+from django.db import OperationalError, connection, connections, transaction
+
+from core.sqlite import DEFAULT_PRAGMAS, WRITE_TRANSACTION_MODE, transaction_mode
+from core.writer import WriterBusy, reset_scheduler, write_transaction
+
+PROFILES = ('legacy', 'tuned', 'queued')
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def read(NotificationBody):
+    list(NotificationBody.objects.order_by('-id').values('id', 'title')[:20])
+
+
+def write(NotificationBody, begin):
+    with begin():
+        # The read takes a shared lock that a deferred BEGIN must later upgrade
+        NotificationBody.objects.filter(digest_key='bench').count()
+        NotificationBody.objects.create(title='bench', message='x' * 200, digest_key='bench')
+
+
+@contextmanager
+def deferred():
+    with transaction.atomic():
+        yield
+
+
+@contextmanager
+def immediate():
+    with transaction_mode(WRITE_TRANSACTION_MODE), transaction.atomic():
+        yield
+
+
+BEGIN = {'legacy': deferred, 'tuned': immediate, 'queued': write_transaction}
+
+
+def worker(kind, profile, deadline, start, results):
+    from core.models import NotificationBody
+
+    if kind == 'read':
+        op = lambda: read(NotificationBody)
+    else:
+        op = lambda: write(NotificationBody, BEGIN[profile])
+    start.wait()
+    try:
+        while time.perf_counter() < deadline[0]:
+            began = time.perf_counter()
+            try:
+                op()
+                outcome = 'ok'
+            except OperationalError as e:
+                outcome = 'locked' if 'locked' in str(e) else 'error'
+            except WriterBusy:
+                outcome = 'turned away'
+            results.append((kind, outcome, time.perf_counter() - began))
+    finally:
+        connections.close_all()
+
+
+def run(profile, args):
+    settings.SQLITE_PRAGMAS = {} if profile == 'legacy' else args.pragmas
+    reset_scheduler()
+    db_dir = tempfile.mkdtemp()
+    connection.settings_dict['TEST']['NAME'] = os.path.join(db_dir, f'{profile}.sqlite3')
+    # The legacy setup only had the driver's busy wait
+    connection.settings_dict['OPTIONS']['timeout'] = args.timeout
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        connections.close_all()
+        start = threading.Event()
+        deadline = [0.0]
+        results = []
+        threads = [
+            threading.Thread(target=worker, args=(kind, profile, deadline, start, results))
+            for kind in ['read'] * args.readers + ['write'] * args.writers
+        ]
+        for thread in threads:
+            thread.start()
+        deadline[0] = time.perf_counter() + args.seconds
+        start.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    print(f"{profile}: {args.readers} readers, {args.writers} writers, {args.seconds}s")
+    for kind in ('read', 'write'):
+        rows = [(outcome, seconds) for k, outcome, seconds in results if k == kind]
+        outcomes = Counter(outcome for outcome, _ in rows)
+        latencies = [seconds * 1000 for outcome, seconds in rows if outcome == 'ok']
+        line = (f"  {kind:>5}: {outcomes['ok']} ok, {outcomes['locked']} locked, "
+                f"{outcomes['turned away']} turned away, {outcomes['error']} other errors")
+        if latencies:
+            line += (f"; p50 {statistics.median(latencies):.1f}ms, p99 {percentile(latencies, 0.99):.1f}ms, "
+                     f"max {max(latencies):.1f}ms")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--timeout', type=float, default=settings.DATABASES['default'].get('OPTIONS', {}).get('timeout', 5))
+    parser.add_argument('--profile', choices=PROFILES, action='append', help="Run only these profiles")
+    args = parser.parse_args()
+    if connection.vendor != 'sqlite':
+        parser.error(f"The default database is {connection.vendor}; this benchmark needs SQLite")
+    args.pragmas = getattr(settings, 'SQLITE_PRAGMAS', DEFAULT_PRAGMAS)
+
+    for profile in args.profile or PROFILES:
+        run(profile, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# core/admission.py
+"""
+Admission queues for bursty, expensive views.
+
+At the start of a class hundreds of students sign in within a minute, and
+every sign-in burns a PBKDF2 verification. Rather than letting all of them
+pile onto the workers at once, ``core.decorators.admission_queue`` admits a
+fixed number at a time per process and queues the rest first come, first
+served. A request that would wait longer than ``max_wait`` seconds, or
+arrives when ``max_waiting`` are already queued, is turned away at once with
+a ``Retry-After`` estimate instead of holding a worker.
+
+Queues are configured by name in ``ADMISSION_QUEUES``::
+
+    ADMISSION_QUEUES = {'login': {'slots': 4, 'max_waiting': 100, 'max_wait': 5}}
+"""
+import math
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+DEFAULT_SLOTS = 4
+DEFAULT_MAX_WAITING = 100
+DEFAULT_MAX_WAIT = 5
+MAX_RETRY_AFTER = 60
+
+
+class _Ticket:
+    """A queued request; its own condition so a handoff wakes only that request"""
+    __slots__ = ('cond', 'admitted')
+
+    def __init__(self, lock):
+        self.cond = threading.Condition(lock)
+        self.admitted = False
+
+
+class AdmissionQueue:
+    """A FIFO queue in front of ``slots`` concurrent requests"""
+
+    def __init__(self, slots=DEFAULT_SLOTS, max_waiting=DEFAULT_MAX_WAITING, max_wait=DEFAULT_MAX_WAIT):
+        self.slots = max(1, slots)
+        self.max_waiting = max_waiting
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiting = deque()
+        self._lock = threading.Lock()
+        # Moving average of seconds per admitted request, for Retry-After
+        self._service_time = 1.0
+
+    def retry_after(self, position):
+        """Seconds until a request ``position`` places back is likely to get in"""
+        estimate = math.ceil((position + 1) * self._service_time / self.slots)
+        return max(1, min(MAX_RETRY_AFTER, estimate))
+
+    def acquire(self, max_wait=None):
+        """Wait for a slot in arrival order. Returns None once admitted, else a Retry-After."""
+        with self._lock:
+            if self.active < self.slots and not self._waiting:
+                self.active += 1
+                return None
+            if len(self._waiting) >= self.max_waiting:
+                return self.retry_after(len(self._waiting))
+
+            ticket = _Ticket(self._lock)
+            self._waiting.append(ticket)
+            deadline = time.monotonic() + (self.max_wait if max_wait is None else max_wait)
+            while not ticket.admitted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    position = self._waiting.index(ticket)
+                    self._waiting.remove(ticket)
+                    return self.retry_after(position)
+                ticket.cond.wait(remaining)
+            return None
+
+    def release(self, elapsed):
+        with self._lock:
+            self._service_time = 0.8 * self._service_time + 0.2 * elapsed
+            if self._waiting:
+                # Hand the slot straight to the next in line, so nobody can jump the queue
+                ticket = self._waiting.popleft()
+                ticket.admitted = True
+                ticket.cond.notify()
+            else:
+                self.active -= 1
+
+    def waiting(self):
+        with self._lock:
+            return len(self._waiting)
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_queue(name):
+    """The process-wide queue called ``name``, built from ``ADMISSION_QUEUES`` on first use"""
+    with _queues_lock:
+        if name not in _queues:
+            options = getattr(settings, 'ADMISSION_QUEUES', {}).get(name, {})
+            _queues[name] = AdmissionQueue(**options)
+        return _queues[name]
+
+
+def reset_queues():
+    """Forget every queue so the next use re-reads the settings"""
+    with _queues_lock:
+        _queues.clear()
@@ -0,0 +1,173 @@
+# core/analytics.py
+"""
+Daily rollups behind the admin analytics charts.
+
+``manage.py rollup_analytics`` folds new source rows into small daily
+tables, so the chart endpoints never scan ``Upload`` or ``User``:
+
+* ``DailyUploadStat``: uploads per day, batch, subject and teacher (with the
+  batch's branch), read from ``Upload`` rows with an id above the
+  ``uploads`` watermark. Ids are handed out at INSERT but become visible at
+  COMMIT, so a lower id can appear after a higher one; the watermark only
+  passes uploads older than ``UPLOAD_SETTLE``, by which time every earlier
+  id has committed, and stops at the first one that is not.
+* ``DailyActiveStudent``: one row per student per day they signed in, read
+  from ``User.last_login`` values newer than the ``logins`` watermark. Only
+  the latest sign-in survives in ``last_login``, so rollups should run at
+  least daily for the figures to be complete.
+
+Each rollup moves its watermark in the same transaction as the rows it
+writes, so a failed run leaves nothing half counted and the next run picks
+up where the last good one stopped. Deleting an upload does not take it
+back out of the rollup: the charts count upload events.
+"""
+from datetime import timedelta
+
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncWeek
+from django.utils import timezone
+
+from .writer import write_transaction
+
+UPLOADS_WATERMARK = 'uploads'
+LOGINS_WATERMARK = 'logins'
+DEFAULT_BATCH_SIZE = 5000
+# Rows this recent may still be committing, or have earlier rows that are;
+# they wait for the next run. Uploads save their file inside the transaction.
+UPLOAD_SETTLE = timedelta(minutes=1)
+LOGIN_SETTLE = timedelta(seconds=5)
+
+UPLOAD_GROUPS = {
+    'subject': 'subject',
+    'batch': 'batch__batch_code',
+    'teacher': 'teacher__username',
+    'branch': 'branch',
+}
+# Rollup rows are already daily, so a day period is the column itself
+PERIODS = {'day': F, 'week': TruncWeek}
+
+
+def _watermark(name):
+    from .models import RollupWatermark
+
+    # select_for_update serialises concurrent runs where the database supports it
+    watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=name)
+    return watermark
+
+
+def rollup_uploads(batch_size=DEFAULT_BATCH_SIZE):
+    """Fold uploads newer than the watermark into DailyUploadStat. Returns uploads counted."""
+    from teacher.models import Upload
+    from .models import DailyUploadStat
+
+    counted = 0
+    until = timezone.now() - UPLOAD_SETTLE
+    while True:
+        with write_transaction():
+            watermark = _watermark(UPLOADS_WATERMARK)
+            rows = list(
+                Upload.objects.filter(id__gt=watermark.last_id).order_by('id')
+                .values_list('id', 'uploaded_at')[:batch_size]
+            )
+            # Up to the first unsettled upload; ids after it wait with it
+            ids = []
+            for upload_id, uploaded_at in rows:
+                if uploaded_at > until:
+                    break
+                ids.append(upload_id)
+            if not ids:
+                break
+            groups = (
+                Upload.objects.filter(id__gte=ids[0], id__lte=ids[-1])
+                .annotate(day=TruncDate('uploaded_at'))
+                .values('day', 'batch_id', 'teacher_id', 'subject', 'batch__branch')
+                .annotate(n=Count('id'))
+            )
+            for group in groups:
+                key = {
+                    'day': group['day'], 'batch_id': group['batch_id'],
+                    'teacher_id': group['teacher_id'], 'subject': group['subject'],
+                }
+                updated = DailyUploadStat.objects.filter(**key).update(uploads=F('uploads') + group['n'])
+                if not updated:
+                    DailyUploadStat.objects.create(**key, branch=group['batch__branch'] or '', uploads=group['n'])
+                counted += group['n']
+            watermark.last_id = ids[-1]
+            watermark.save(update_fields=['last_id', 'updated_at'])
+        if len(ids) < batch_size:
+            break
+    return counted
+
+
+def rollup_logins(batch_size=DEFAULT_BATCH_SIZE):
+    """Record students who signed in since the watermark. Returns new student-days."""
+    from .models import DailyActiveStudent, User
+
+    recorded = 0
+    until = timezone.now() - LOGIN_SETTLE
+    while True:
+        with write_transaction():
+            watermark = _watermark(LOGINS_WATERMARK)
+            logins = User.objects.filter(role__role_name='Student', last_login__lte=until)
+            if watermark.last_at is not None:
+                logins = logins.filter(last_login__gt=watermark.last_at)
+            rows = list(logins.order_by('last_login').values_list('id', 'batch_id', 'last_login')[:batch_size])
+            if not rows:
+                break
+            active = {
+                (timezone.localdate(last_login), user_id): batch_id for user_id, batch_id, last_login in rows
+            }
+            # A student already counted for that day keeps their first row
+            seen = set(DailyActiveStudent.objects.filter(
+                user_id__in={user_id for _, user_id in active}, day__in={day for day, _ in active},
+            ).values_list('day', 'user_id'))
+            new = [
+                DailyActiveStudent(day=day, user_id=user_id, batch_id=batch_id)
+                for (day, user_id), batch_id in active.items() if (day, user_id) not in seen
+            ]
+            DailyActiveStudent.objects.bulk_create(new, ignore_conflicts=True)
+            recorded += len(new)
+            watermark.last_at = rows[-1][2]
+            watermark.save(update_fields=['last_at', 'updated_at'])
+        if len(rows) < batch_size:
+            break
+    return recorded
+
+
+def run_rollups(batch_size=DEFAULT_BATCH_SIZE):
+    return {
+        'uploads': rollup_uploads(batch_size),
+        'logins': rollup_logins(batch_size),
+    }
+
+
+def _since(days):
+    return timezone.localdate() - timedelta(days=days - 1)
+
+
+def upload_series(group='subject', period='week', days=90):
+    """Uploads per ``period`` and ``group`` over the last ``days``, from the rollup table"""
+    from .models import DailyUploadStat
+
+    return [
+        {'period': row['period'].isoformat(), 'key': row['key'] or '', 'count': row['count']}
+        for row in DailyUploadStat.objects.filter(day__gte=_since(days))
+        .annotate(period=PERIODS[period]('day'), key=F(UPLOAD_GROUPS[group]))
+        .values('period', 'key')
+        .annotate(count=Sum('uploads'))
+        .order_by('period', 'key')
+    ]
+
+
+def active_student_series(period='week', days=90):
+    """Distinct active students per ``period`` and batch over the last ``days``"""
+    from .models import DailyActiveStudent
+
+    return [
+        {'period': row['period'].isoformat(), 'key': row['key'] or '', 'count': row['count']}
+        for row in DailyActiveStudent.objects.filter(day__gte=_since(days))
+        .annotate(period=PERIODS[period]('day'), key=F('batch__batch_code'))
+        .values('period', 'key')
+        .annotate(count=Count('user', distinct=True))
+        .order_by('period', 'key')
+    ]
@@ -0,0 +1,108 @@
+"""
+Authentication backend that loads everything a page needs about the user.
+
+``get_user`` runs once per request (``AuthenticationMiddleware`` memoises the
+result on the request) and fetches the user together with their role, batch
+and student profile, so ``request.user.role`` and ``request.user.student`` do
+not cost a query each time a view or context processor reads them.
+
+``authenticate`` verifies passwords in ``core.hashing``'s sign-in process pool, so
+PBKDF2 does not tie up the web worker's CPU during a login storm.
+
+Set ``AUTH_USER_CACHE_TTL`` to also keep loaded users in a small per-process
+cache for that many seconds. Saves to a user or their student profile drop
+the entry in this process; other processes see the change once it expires.
+"""
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from .hashing import hash_password, needs_rehash, verify_password
+
+USER_CACHE_MAX_ENTRIES = 1000
+
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+
+
+def user_queryset():
+    """Users with the relations every page reads"""
+    return get_user_model()._default_manager.select_related(
+        'role', 'batch', 'student', 'student__batch'
+    )
+
+
+def get_student(user):
+    """The user's student profile, or None, without a query when preloaded"""
+    return getattr(user, 'student', None)
+
+
+def forget_user(user_id):
+    """Drop ``user_id`` from this process' user cache"""
+    with _user_cache_lock:
+        _user_cache.pop(str(user_id), None)
+
+
+def clear_user_cache():
+    with _user_cache_lock:
+        _user_cache.clear()
+
+
+_dummy_hash = None
+
+
+def _unknown_user_hash():
+    # Checked against when the username does not exist, so a miss costs as
+    # long as a wrong password and does not reveal which usernames exist
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password('')
+    return _dummy_hash
+
+
+class RoleAwareModelBackend(ModelBackend):
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = user_queryset().get(**{UserModel.USERNAME_FIELD: username})
+        except UserModel.DoesNotExist:
+            verify_password(password, _unknown_user_hash())
+            return None
+        if not verify_password(password, user.password) or not self.user_can_authenticate(user):
+            return None
+        if needs_rehash(user.password):
+            user.password = hash_password(password)
+            user.save(update_fields=['password'])
+        return user
+
+    def get_user(self, user_id):
+        ttl = getattr(settings, 'AUTH_USER_CACHE_TTL', 0)
+        key = str(user_id)  # The session stores the pk as a string
+        if ttl:
+            with _user_cache_lock:
+                entry = _user_cache.get(key)
+            if entry and entry[0] > time.monotonic():
+                # Each request gets its own copy to modify
+                return copy.deepcopy(entry[1])
+
+        try:
+            user = user_queryset().get(pk=user_id)
+        except get_user_model().DoesNotExist:
+            return None
+        if not self.user_can_authenticate(user):
+            return None
+
+        if ttl:
+            with _user_cache_lock:
+                if len(_user_cache) >= USER_CACHE_MAX_ENTRIES:
+                    _user_cache.clear()
+                _user_cache[key] = (time.monotonic() + ttl, copy.deepcopy(user))
+        return user
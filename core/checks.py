@@ -0,0 +1,31 @@
+# core/checks.py
+"""
+System checks for settings that only go wrong once several processes run.
+
+Registered for ``manage.py check --deploy`` so a single runserver process
+keeps working with the in-process cache.
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_session_cache(app_configs, **kwargs):
+    """``core.session_store`` must not cache sessions in a per-process cache"""
+    if settings.SESSION_ENGINE != 'core.session_store':
+        return []
+    alias = getattr(settings, 'SESSION_CACHE_ALIAS', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend not in LOCAL_CACHE_BACKENDS:
+        return []
+    return [Error(
+        f"SESSION_ENGINE 'core.session_store' uses cache '{alias}' ({backend}), which is local to one process.",
+        hint="Set CACHE_REDIS_URL, or point SESSION_CACHE_ALIAS at a shared cache; otherwise "
+             "logout and revoked sessions stay valid in the other workers.",
+        id='core.E001',
+    )]
@@ -0,0 +1,171 @@
+# core/counters.py
+"""
+Per-user notification read state (``NotificationState``) and the
+site-wide dashboard totals (``DashboardStats``).
+
+A notification is unread while it is newer than the user's
+``last_seen_at`` cursor, so marking everything read is a single-row write
+(``mark_all_seen``) however large the backlog. ``unread_count`` caches how
+many are unread. Like ``teacher/counters.py``, every change to it is a
+single ``UPDATE ... SET n = n + delta`` so concurrent writers cannot lose
+updates. Single-row creates and deletes go through the signal handlers in
+``core/signals.py``; ``Notification.notify`` calls ``adjust_unread_counts``
+directly. ``manage.py reconcile_counters`` recomputes everything from
+scratch.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+# Keeps IN (...) lists well under SQLite's bound-parameter limit
+CHUNK_SIZE = 500
+
+
+def adjust_unread_counts(user_ids, delta):
+    """Add ``delta`` to the unread counter of every user in ``user_ids``"""
+    from .models import NotificationState
+
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    if not user_ids or not delta:
+        return
+    for start in range(0, len(user_ids), CHUNK_SIZE):
+        chunk = user_ids[start:start + CHUNK_SIZE]
+        if delta > 0:
+            NotificationState.objects.bulk_create(
+                [NotificationState(user_id=user_id) for user_id in chunk],
+                ignore_conflicts=True,
+            )
+        NotificationState.objects.filter(user_id__in=chunk).update(
+            unread_count=Greatest(F('unread_count') + delta, Value(0))
+        )
+
+
+def adjust_unread_if_unseen(user_id, created_at, delta):
+    """Adjust the counter only if a notification from ``created_at`` is still unread"""
+    from .models import NotificationState
+
+    NotificationState.objects.filter(
+        Q(last_seen_at__isnull=True) | Q(last_seen_at__lt=created_at), user_id=user_id
+    ).update(unread_count=Greatest(F('unread_count') + delta, Value(0)))
+
+
+def mark_all_seen(user, body_ids=None):
+    """Move the user's cursor to the newest notification they were shown: one UPDATE whatever the backlog
+
+    ``body_ids`` are the notification bodies the page displayed; without
+    them the cursor moves to the user's newest notification. Returns the
+    new cursor, or None if there was nothing to mark.
+    """
+    from .models import Notification, NotificationState
+
+    with transaction.atomic():
+        # Read in the same transaction as the UPDATE, from the rows
+        # themselves: anything that landed after the page was drawn, or
+        # commits with an earlier timestamp, stays unread
+        shown = Notification.objects.filter(user_id=user.pk)
+        if body_ids is not None:
+            shown = shown.filter(body_id__in=list(body_ids)[:CHUNK_SIZE])
+        cursor = shown.aggregate(newest=Max('created_at'))['newest']
+        if cursor is None:
+            return None
+        newer = Notification.objects.filter(user=OuterRef('user'), created_at__gt=cursor).values('user').annotate(n=Count('id')).values('n')
+        # The cursor only moves forward; another tab may have seen more
+        updated = NotificationState.objects.filter(
+            Q(last_seen_at__isnull=True) | Q(last_seen_at__lt=cursor), user_id=user.pk
+        ).update(last_seen_at=cursor, unread_count=Coalesce(Subquery(newer), Value(0)))
+        if not updated:
+            NotificationState.objects.get_or_create(user_id=user.pk, defaults={
+                'last_seen_at': cursor,
+                'unread_count': Notification.objects.filter(user_id=user.pk, created_at__gt=cursor).count(),
+            })
+    return cursor
+
+
+def get_state(user):
+    """The user's NotificationState, unsaved and empty if they have none yet"""
+    from .models import NotificationState
+
+    return NotificationState.objects.filter(user_id=user.pk).first() or NotificationState(user_id=user.pk)
+
+
+def unread_count(user):
+    """The user's unread notifications, read from the counter row"""
+    return get_state(user).unread_count
+
+
+def reconcile_unread_counters():
+    """Recompute every user's unread counter. Returns the number of users corrected."""
+    from .models import Notification, NotificationState, User
+
+    unread = Notification.objects.filter(user=OuterRef('pk')).filter(
+        Q(user__notification_state__last_seen_at__isnull=True)
+        | Q(created_at__gt=F('user__notification_state__last_seen_at'))
+    ).values('user').annotate(n=Count('id')).values('n')
+    users = User.objects.annotate(
+        actual_unread=Coalesce(Subquery(unread), Value(0)),
+        # Users without a state row count as zero unread
+        stored_unread=Coalesce('notification_state__unread_count', Value(0)),
+    ).exclude(stored_unread=F('actual_unread'))
+
+    corrected = 0
+    for user in users.only('id'):
+        NotificationState.objects.update_or_create(
+            user_id=user.id, defaults={'unread_count': user.actual_unread}
+        )
+        corrected += 1
+    return corrected
+
+
+# Site-wide totals for the dashboard, kept in the DashboardStats row.
+# User changes arrive through core/signals.py, batches and uploads through
+# teacher/signals.py; reads never write.
+
+DASHBOARD_STATS_PK = 1
+ROLE_STAT_FIELDS = {'Teacher': 'total_teachers', 'Student': 'total_students'}
+
+
+def role_stat_field(role_name):
+    """The DashboardStats field counting users with ``role_name``, if any"""
+    return ROLE_STAT_FIELDS.get(role_name)
+
+
+def adjust_dashboard_stats(**deltas):
+    """Add each ``field=delta`` to the DashboardStats row"""
+    from .models import DashboardStats
+
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    updated = DashboardStats.objects.filter(pk=DASHBOARD_STATS_PK).update(
+        **{field: Greatest(F(field) + delta, Value(0)) for field, delta in deltas.items()}
+    )
+    if not updated:
+        # No row yet: count from scratch, which includes this change
+        reconcile_dashboard_stats()
+
+
+def get_dashboard_stats():
+    """The DashboardStats row, read only; unsaved zeros if it does not exist yet"""
+    from .models import DashboardStats
+
+    return DashboardStats.objects.filter(pk=DASHBOARD_STATS_PK).first() or DashboardStats(pk=DASHBOARD_STATS_PK)
+
+
+def reconcile_dashboard_stats():
+    """Recount the dashboard totals. Returns 1 if the row was corrected, else 0."""
+    from .models import DashboardStats, User
+    from teacher.models import Batch, Upload
+
+    by_role = dict(
+        User.objects.filter(role__role_name__in=ROLE_STAT_FIELDS)
+        .values('role__role_name').annotate(n=Count('id')).values_list('role__role_name', 'n')
+    )
+    actual = {field: by_role.get(role_name, 0) for role_name, field in ROLE_STAT_FIELDS.items()}
+    actual['total_batches'] = Batch.objects.count()
+    actual['total_sent_files'] = Upload.objects.count()
+
+    stored = DashboardStats.objects.filter(pk=DASHBOARD_STATS_PK).values(*actual).first()
+    if stored == actual:
+        return 0
+    DashboardStats.objects.update_or_create(pk=DASHBOARD_STATS_PK, defaults=actual)
+    return 1
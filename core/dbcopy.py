@@ -0,0 +1,168 @@
+# core/dbcopy.py
+"""
+Copy every table from the SQLite database into PostgreSQL, and verify it.
+
+Used by ``manage.py migrate_sqlite_to_postgres``. Each model's table is
+streamed in primary-key order, ``batch_size`` rows at a time, so memory
+stays flat however large the table. Values are read through the model
+fields on the SQLite side and prepared for the target as the ORM would,
+then inserted with plain SQL so ``auto_now`` fields and signals leave
+them alone.
+
+The source is read inside one transaction, which gives a consistent
+snapshot under WAL while the site keeps running. The target is written in
+one transaction too. Django creates PostgreSQL foreign keys ``DEFERRABLE
+INITIALLY DEFERRED``, so tables can go in any order, and a failed copy
+leaves the target as it was. Afterwards sequences are moved past the
+copied ids, and ``verify`` checksums every table on both sides.
+
+Rows written to SQLite after the snapshot are not copied. To switch over,
+stop writes, run the copy, then start the site with ``POSTGRES_DB`` set.
+"""
+import hashlib
+import json
+from datetime import datetime, timezone
+
+from django.apps import apps
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.migrations.recorder import MigrationRecorder
+
+SOURCE_ALIAS = 'sqlite_source'
+DEFAULT_BATCH_SIZE = 2000
+
+
+class CopyError(Exception):
+    """The source and target cannot be copied between as they stand"""
+
+
+def register_source(path, alias=SOURCE_ALIAS):
+    """Make the SQLite file at ``path`` available as database ``alias``"""
+    databases = connections.configure_settings({
+        DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS],
+        alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(path)},
+    })
+    connections.settings[alias] = databases[alias]
+    return alias
+
+
+def copyable_models():
+    """Every concrete model with its own table, including many-to-many tables"""
+    return [
+        model for model in apps.get_models(include_auto_created=True)
+        if model._meta.managed and not model._meta.proxy
+    ]
+
+
+def check_migrations(source, target):
+    """Raise CopyError unless both databases have the same migrations applied"""
+    applied = {
+        alias: set(MigrationRecorder(connections[alias]).applied_migrations())
+        for alias in (source, target)
+    }
+    if applied[source] != applied[target]:
+        missing = sorted(f'{app}.{name}' for app, name in applied[source] ^ applied[target])
+        raise CopyError(
+            f"Schemas differ; migrate both databases to the same state first. "
+            f"Applied on only one side: {', '.join(missing[:10])}"
+        )
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _rows(model, using, batch_size):
+    fields = model._meta.local_concrete_fields
+    return model._base_manager.using(using).order_by('pk').values_list(
+        *[field.attname for field in fields]
+    ).iterator(chunk_size=batch_size)
+
+
+def copy_model(model, source, target, batch_size=DEFAULT_BATCH_SIZE):
+    """Stream one table from ``source`` into ``target``. Returns rows copied."""
+    connection = connections[target]
+    quote = connection.ops.quote_name
+    fields = model._meta.local_concrete_fields
+    sql = (
+        f"INSERT INTO {quote(model._meta.db_table)} "
+        f"({', '.join(quote(field.column) for field in fields)}) "
+        f"VALUES ({', '.join(['%s'] * len(fields))})"
+    )
+    copied = 0
+    with connection.cursor() as cursor:
+        for batch in _batches(_rows(model, source, batch_size), batch_size):
+            cursor.executemany(sql, [
+                [field.get_db_prep_save(value, connection=connection) for field, value in zip(fields, row)]
+                for row in batch
+            ])
+            copied += len(batch)
+    return copied
+
+
+def copy_database(source, target=DEFAULT_DB_ALIAS, batch_size=DEFAULT_BATCH_SIZE, log=None):
+    """Replace everything in ``target`` with a snapshot of ``source``. Returns ``{label: rows}``."""
+    log = log or (lambda message: None)
+    models = copyable_models()
+    source_tables = set(connections[source].introspection.table_names())
+    missing = [model._meta.db_table for model in models if model._meta.db_table not in source_tables]
+    if missing:
+        raise CopyError(f"Tables missing from the source: {', '.join(missing)}")
+
+    target_connection = connections[target]
+    copied = {}
+    with transaction.atomic(using=source), transaction.atomic(using=target):
+        # migrate filled content types and permissions; the source's copies replace them
+        flush = target_connection.ops.sql_flush(
+            no_style(), [model._meta.db_table for model in models], allow_cascade=True,
+        )
+        with target_connection.cursor() as cursor:
+            for sql in flush:
+                cursor.execute(sql)
+        for model in models:
+            copied[model._meta.label] = copy_model(model, source, target, batch_size)
+            log(f"{model._meta.label}: {copied[model._meta.label]} rows")
+        with target_connection.cursor() as cursor:
+            for sql in target_connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+    return copied
+
+
+def _normalise(value):
+    # Backends return the same data in different shapes: timezones, JSON key order, bytes
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True, default=str)
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).hex()
+    return str(value)
+
+
+def table_checksum(model, using, batch_size=DEFAULT_BATCH_SIZE):
+    """``(rows, checksum)`` for one table, independent of row order and backend"""
+    count = 0
+    total = 0
+    for row in _rows(model, using, batch_size):
+        digest = hashlib.sha256(repr(tuple(_normalise(value) for value in row)).encode()).digest()
+        total = (total + int.from_bytes(digest, 'big')) % (1 << 256)
+        count += 1
+    return count, f'{total:064x}'
+
+
+def verify(source, target=DEFAULT_DB_ALIAS, batch_size=DEFAULT_BATCH_SIZE):
+    """``[(label, source rows, target rows, matches), ...]`` for every table"""
+    results = []
+    with transaction.atomic(using=source), transaction.atomic(using=target):
+        for model in copyable_models():
+            source_count, source_sum = table_checksum(model, source, batch_size)
+            target_count, target_sum = table_checksum(model, target, batch_size)
+            results.append((model._meta.label, source_count, target_count, source_sum == target_sum))
+    return results
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import re
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.http import HttpResponse, JsonResponse
+from django.template.loader import render_to_string
+from django.urls import URLPattern, URLResolver
+
+from .admission import get_queue
+from .writer import WriterBusy, write_transaction
+
+logger = logging.getLogger(__name__)
+
+# Transaction policies; every routed view declares one (enforced in core/tests.py)
+READ_ONLY = 'read_only'  # No transaction; writes are logged, or raise in strict mode
+AUTOCOMMIT = 'autocommit'  # No transaction; the view opens its own where it writes
+ATOMIC = 'atomic'  # The whole view in one transaction; unsafe methods queue for the write slot
+POLICIES = (READ_ONLY, AUTOCOMMIT, ATOMIC)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+_write_sql = re.compile(r'\s*(INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+
+class ReadOnlyViolation(AssertionError):
+    """Raised in strict mode when a read-only view writes to the database"""
+
+
+def query_budget(max_queries):
+    """Declare how many SQL queries a view may run per request.
+
+    Read by ``core.middleware.QueryBudgetMiddleware``; it takes precedence
+    over ``settings.QUERY_BUDGETS`` and ``settings.QUERY_BUDGET_DEFAULT``.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapped_view(*args, **kwargs):
+            return view_func(*args, **kwargs)
+        wrapped_view.query_budget = max_queries
+        return wrapped_view
+    return decorator
+
+
+def admission_queue(name, reason="The server is busy right now.", methods=('POST',)):
+    """Admit ``methods`` requests through the ``core.admission`` queue ``name``.
+
+    Requests turned away get a 503 with ``Retry-After`` that starts with
+    ``reason``: JSON for AJAX
+    callers, otherwise a small page that reloads once the wait is over.
+    Neither touches the session, so turning a request away costs no write.
+    Other methods pass straight through.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapped_view(request, *args, **kwargs):
+            if request.method not in methods:
+                return view_func(request, *args, **kwargs)
+            queue = get_queue(name)
+            retry_after = queue.acquire()
+            if retry_after is not None:
+                return busy_response(request, retry_after, reason)
+            started = time.monotonic()
+            try:
+                return view_func(request, *args, **kwargs)
+            finally:
+                queue.release(time.monotonic() - started)
+        return wrapped_view
+    return decorator
+
+
+def busy_response(request, retry_after, reason):
+    """503 with ``Retry-After`` that leaves the session alone"""
+    message = f"{reason} Please try again in {retry_after} seconds."
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        response = JsonResponse({'status': 'error', 'message': message, 'retry_after': retry_after}, status=503)
+    else:
+        response = HttpResponse(render_to_string('busy.html', {
+            'message': message, 'retry_after': retry_after, 'retry_url': request.path,
+        }), status=503)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def transaction_policy(policy):
+    """Declare and apply how a view uses database transactions.
+
+    ``READ_ONLY`` and ``AUTOCOMMIT`` views run in autocommit, so a long
+    render or a streamed file holds no transaction open. ``ATOMIC`` views
+    run in one transaction, rolled back if the view raises; for unsafe
+    methods it is a ``core.writer.write_transaction``, turned away with a
+    503 when the write queue is full.
+    """
+    if policy not in POLICIES:
+        raise ImproperlyConfigured(f"Unknown transaction policy {policy!r}; expected one of {', '.join(POLICIES)}")
+
+    def decorator(view_func):
+        if policy == AUTOCOMMIT:
+            wrapped_view = view_func
+        elif asyncio.iscoroutinefunction(view_func):
+            raise ImproperlyConfigured(f"{view_func.__qualname__}: async views can only be {AUTOCOMMIT}")
+        elif policy == READ_ONLY:
+            @wraps(view_func)
+            def wrapped_view(request, *args, **kwargs):
+                with connection.execute_wrapper(_read_only_guard(request)):
+                    return view_func(request, *args, **kwargs)
+        else:
+            @wraps(view_func)
+            def wrapped_view(request, *args, **kwargs):
+                if request.method in SAFE_METHODS:
+                    with transaction.atomic():
+                        return view_func(request, *args, **kwargs)
+                try:
+                    with write_transaction():
+                        return view_func(request, *args, **kwargs)
+                except WriterBusy as e:
+                    return busy_response(request, e.retry_after, "The server is busy saving other changes.")
+        wrapped_view.transaction_policy = policy
+        return wrapped_view
+    return decorator
+
+
+read_only_view = transaction_policy(READ_ONLY)
+autocommit_view = transaction_policy(AUTOCOMMIT)
+atomic_view = transaction_policy(ATOMIC)
+
+
+def _read_only_guard(request):
+    def guard(execute, sql, params, many, context):
+        if _write_sql.match(sql):
+            message = f"Read-only view {request.path} ran a write: {sql[:100]}"
+            if getattr(settings, 'TRANSACTION_POLICY_STRICT', False):
+                raise ReadOnlyViolation(message)
+            logger.warning(message)
+        return execute(sql, params, many, context)
+    return guard
+
+
+def default_transaction_policy(policy, urlpatterns):
+    """Apply ``policy`` to every view in ``urlpatterns`` that does not declare its own.
+
+    For a URL namespace whose views mostly share a policy; used at the
+    bottom of an app's ``urls.py``.
+    """
+    apply = transaction_policy(policy)
+    for pattern in urlpatterns:
+        if isinstance(pattern, URLResolver):
+            default_transaction_policy(policy, pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and not hasattr(pattern.callback, 'transaction_policy'):
+            pattern.callback = apply(pattern.callback)
+    return urlpatterns
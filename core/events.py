@@ -0,0 +1,206 @@
+"""
+Publish/subscribe for pushing events to browsers over Server-Sent Events.
+
+Events are addressed to channels: ``user:<id>`` for one user and
+``batch:<id>`` for every student in a batch. ``publish`` is called from
+ordinary (sync) request code and delivers once the current transaction
+commits; ``core.views.event_stream`` subscribes one async queue per open
+connection.
+
+``EVENTS_BROKER`` picks the backend:
+
+* ``core.events.LocalBroker`` (default) delivers within this process only,
+  which is all a single ASGI worker needs.
+* ``core.events.RedisBroker`` relays every event through one Redis pub/sub
+  channel so all workers see it. Any redis-py compatible client works, so a
+  ``fakeredis`` server can stand in for Redis locally and under test.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_QUEUE_SIZE = 100
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def batch_channel(batch_id):
+    return f'batch:{batch_id}'
+
+
+def channels_for(user):
+    """Channels a signed-in user listens on"""
+    from .backends import get_student
+
+    channels = [user_channel(user.pk)]
+    student = get_student(user)
+    if student is not None and student.batch_id:
+        channels.append(batch_channel(student.batch_id))
+    return channels
+
+
+class Subscription:
+    """One listener's queue, fed from any thread and read on its event loop"""
+
+    def __init__(self, broker, channels, loop, maxsize=SUBSCRIPTION_QUEUE_SIZE):
+        self.broker = broker
+        self.channels = tuple(channels)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        # Set when events were dropped; the client should reload its state
+        self.overflowed = False
+
+    def deliver(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The loop has closed; the connection is gone
+            self.broker.unsubscribe(self)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """In-process broker: delivers to subscribers of this process only"""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, channels):
+        """Register a subscription; must be called from the listener's event loop"""
+        subscription = Subscription(self, channels, asyncio.get_running_loop())
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                listeners = self._subscribers.get(channel)
+                if listeners is not None:
+                    listeners.discard(subscription)
+                    if not listeners:
+                        del self._subscribers[channel]
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({s for listeners in self._subscribers.values() for s in listeners})
+
+    def publish(self, channels, event, data):
+        self.deliver(channels, event, data)
+
+    def deliver(self, channels, event, data):
+        """Hand an event to the local subscribers of ``channels``"""
+        with self._lock:
+            targets = set()
+            for channel in channels:
+                targets.update(self._subscribers.get(channel, ()))
+        if not targets:
+            return
+        message = {'id': next(self._ids), 'event': event, 'data': data}
+        for subscription in targets:
+            subscription.deliver(message)
+
+
+class RedisBroker(LocalBroker):
+    """Relays events between processes through a single Redis pub/sub channel"""
+
+    def __init__(self, client=None, url=None, channel=None):
+        super().__init__()
+        if client is None:
+            url = url or getattr(settings, 'EVENTS_REDIS_URL', None)
+            if not url:
+                raise ImproperlyConfigured("RedisBroker needs EVENTS_REDIS_URL or a client")
+            try:
+                import redis
+            except ImportError:
+                raise ImproperlyConfigured("RedisBroker needs the 'redis' package installed")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.channel = channel or getattr(settings, 'EVENTS_REDIS_CHANNEL', 'fileshare:events')
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def subscribe(self, channels):
+        self._ensure_listener()
+        return super().subscribe(channels)
+
+    def publish(self, channels, event, data):
+        payload = json.dumps({'channels': list(channels), 'event': event, 'data': data})
+        self.client.publish(self.channel, payload)
+
+    def _ensure_listener(self):
+        with self._listener_lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='events-redis', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        for message in pubsub.listen():
+            try:
+                payload = json.loads(message['data'])
+                self.deliver(payload['channels'], payload['event'], payload['data'])
+            except Exception as e:
+                logger.error(f"Dropping malformed event from Redis: {str(e)}")
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """The broker configured by ``EVENTS_BROKER``, created on first use"""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            path = getattr(settings, 'EVENTS_BROKER', 'core.events.LocalBroker')
+            _broker = import_string(path)()
+        return _broker
+
+
+def publish(channels, event, data):
+    """Send ``event`` to ``channels`` once the current transaction commits"""
+    channels = list(channels)
+    if not channels:
+        return
+
+    def send():
+        try:
+            get_broker().publish(channels, event, data)
+        except Exception as e:
+            # Push is best effort; a failed publish must never fail the request
+            logger.error(f"Could not publish {event} event: {str(e)}", exc_info=True)
+
+    transaction.on_commit(send)
+
+
+def format_sse(message):
+    """Encode a broker message as a Server-Sent Events frame"""
+    return f"id: {message['id']}\nevent: {message['event']}\ndata: {json.dumps(message['data'])}\n\n"
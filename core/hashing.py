@@ -0,0 +1,140 @@
+# core/hashing.py
+"""
+Password hashing for bulk account provisioning.
+
+PBKDF2 is deliberately slow, so hashing a few thousand passwords one by one
+inside a transaction holds SQLite's write lock for minutes. ``hash_passwords``
+spreads the work over a process pool instead, and callers do it before they
+open their transaction. Small batches are hashed inline, where starting
+workers would cost more than it saves.
+
+Sign-in goes through ``verify_password``, which checks passwords in a
+second, separate pool: a login storm queues on a bounded number of
+processes instead of saturating every web worker thread, and a bulk import
+filling the first pool cannot hold up sign-ins. A pool whose worker died is
+replaced, and the work is done inline meanwhile.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, get_hasher, identify_hasher, make_password
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = os.cpu_count() or 2
+INLINE_LIMIT = 20  # Batches this small are hashed in the calling process
+
+
+def _init_worker(settings_module):
+    # Workers start from a fresh interpreter, without Django configured
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def _hash_chunk(passwords):
+    return [make_password(password) for password in passwords]
+
+
+BULK_POOL = 'bulk'  # hash_passwords
+SIGN_IN_POOL = 'sign_in'  # verify_password, hash_password
+
+WORKER_SETTINGS = {
+    BULK_POOL: 'PASSWORD_HASHING_WORKERS',
+    SIGN_IN_POOL: 'PASSWORD_SIGN_IN_WORKERS',
+}
+
+_executors = {}
+_executor_lock = threading.Lock()
+
+
+def _start_method():
+    # Forking a threaded server can copy a lock another thread holds (the
+    # view flush, the extraction pool, the event broker) into the child,
+    # where nothing will ever release it. Workers start clean instead.
+    return 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def worker_count(pool=BULK_POOL):
+    return getattr(settings, WORKER_SETTINGS[pool], None) or DEFAULT_WORKERS
+
+
+def get_executor(pool=BULK_POOL):
+    """The process pool ``pool``, shared by every caller in this process"""
+    with _executor_lock:
+        executor = _executors.get(pool)
+        if executor is None:
+            executor = _executors[pool] = ProcessPoolExecutor(
+                max_workers=worker_count(pool),
+                mp_context=multiprocessing.get_context(_start_method()),
+                initializer=_init_worker,
+                initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'fileshare.settings'),),
+            )
+        return executor
+
+
+def reset_executor(pool, executor):
+    """Drop ``executor`` if it is still ``pool``'s, so the next caller starts a fresh one"""
+    with _executor_lock:
+        if _executors.get(pool) is executor:
+            del _executors[pool]
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def hash_passwords(passwords):
+    """Hashes for ``passwords``, in order; ready to assign to ``User.password``"""
+    passwords = list(passwords)
+    if len(passwords) <= INLINE_LIMIT:
+        return _hash_chunk(passwords)
+    executor = get_executor(BULK_POOL)
+    # A few chunks per worker keeps them all busy without per-password overhead
+    size = max(1, len(passwords) // (worker_count(BULK_POOL) * 4))
+    chunks = [passwords[start:start + size] for start in range(0, len(passwords), size)]
+    try:
+        return [hashed for chunk in executor.map(_hash_chunk, chunks) for hashed in chunk]
+    except Exception as e:
+        if isinstance(e, BrokenProcessPool):
+            reset_executor(BULK_POOL, executor)
+        logger.error(f"Password hashing pool failed, hashing inline: {str(e)}", exc_info=True)
+        return _hash_chunk(passwords)
+
+
+def _offload(func, *args):
+    """Run ``func`` in the sign-in pool and wait for it; inline if the pool is off or broken"""
+    if not getattr(settings, 'PASSWORD_HASHING_OFFLOAD', True):
+        return func(*args)
+    executor = get_executor(SIGN_IN_POOL)
+    try:
+        return executor.submit(func, *args).result()
+    except BrokenProcessPool as e:
+        # A worker died (e.g. killed for memory); later calls get a new pool
+        reset_executor(SIGN_IN_POOL, executor)
+        logger.error(f"Password hashing pool broken, hashing inline: {str(e)}")
+    except RuntimeError as e:
+        # Shut down, e.g. while the interpreter exits
+        logger.error(f"Password hashing pool unavailable, hashing inline: {str(e)}")
+    return func(*args)
+
+
+def verify_password(password, encoded):
+    """``check_password`` in the sign-in pool: the request thread waits, but the CPU work happens elsewhere"""
+    return _offload(check_password, password, encoded)
+
+
+def hash_password(password):
+    return _offload(make_password, password)
+
+
+def needs_rehash(encoded):
+    """True when ``encoded`` uses an outdated hasher or too few iterations"""
+    preferred = get_hasher('default')
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
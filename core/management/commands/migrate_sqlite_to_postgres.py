@@ -0,0 +1,64 @@
+import os
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.dbcopy import DEFAULT_BATCH_SIZE, CopyError, check_migrations, copy_database, register_source, verify
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy every table from the SQLite database into PostgreSQL in batches, then "
+        "compare row counts and checksums. Replaces all data in the target. Stop "
+        "writes to the site before the final run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=str(settings.SQLITE_PATH), help="SQLite file to copy from")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help="PostgreSQL database alias to copy into")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="Rows read and inserted at a time")
+        parser.add_argument('--skip-migrate', action='store_true', help="Assume the target schema is already migrated")
+        parser.add_argument('--verify-only', action='store_true', help="Only compare the two databases")
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive',
+                            help="Do not ask before replacing the target's data")
+
+    def handle(self, *args, **options):
+        target = options['database']
+        connection = connections[target]
+        if connection.vendor != 'postgresql':
+            raise CommandError(f"Database '{target}' is {connection.vendor}, not PostgreSQL; set POSTGRES_DB")
+        if not os.path.isfile(options['source']):
+            raise CommandError(f"No SQLite database at {options['source']}")
+        source = register_source(options['source'])
+        batch_size = max(1, options['batch_size'])
+
+        try:
+            if not options['verify_only']:
+                if not options['skip_migrate']:
+                    call_command('migrate', database=target, interactive=False, verbosity=options['verbosity'])
+                check_migrations(source, target)
+                if options['interactive']:
+                    answer = input(
+                        f"This replaces all data in PostgreSQL database '{connection.settings_dict['NAME']}' "
+                        f"with {options['source']}. Type 'yes' to continue: "
+                    )
+                    if answer != 'yes':
+                        raise CommandError("Copy cancelled")
+                copied = copy_database(source, target, batch_size, log=self.stdout.write)
+                self.stdout.write(self.style.SUCCESS(f"Copied {sum(copied.values())} rows from {len(copied)} tables"))
+
+            results = verify(source, target, batch_size)
+        except CopyError as e:
+            raise CommandError(str(e))
+        finally:
+            connections[source].close()
+
+        mismatched = [label for label, _, _, matches in results if not matches]
+        for label, source_count, target_count, matches in results:
+            line = f"{label}: {source_count} -> {target_count} rows"
+            self.stdout.write(line if matches else self.style.ERROR(f"{line}, checksum differs"))
+        if mismatched:
+            raise CommandError(f"{len(mismatched)} table(s) differ: {', '.join(mismatched)}")
+        self.stdout.write(self.style.SUCCESS(f"All {len(results)} tables match"))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from core.retention import DEFAULT_BATCH_SIZE, prune_notifications
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive read notifications older than the retention period and cap each "
+        "user's history, in small transactions. Safe to run at any time, e.g. "
+        "nightly from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Archive read notifications older than this (default NOTIFICATION_RETENTION_DAYS)")
+        parser.add_argument('--max-per-user', type=int, default=None,
+                            help="Notifications kept per user (default NOTIFICATION_MAX_PER_USER)")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="Rows per transaction")
+        parser.add_argument('--pause', type=float, default=0.05, help="Seconds to sleep between transactions")
+        parser.add_argument('--archive-file', default=None,
+                            help="Append archived rows to this JSON-lines file (.gz to compress) instead of the archive table")
+        parser.add_argument('--dry-run', action='store_true', help="Only count what would be archived")
+
+    def handle(self, *args, **options):
+        stats = prune_notifications(
+            days=options['days'],
+            max_per_user=options['max_per_user'],
+            batch_size=max(1, options['batch_size']),
+            pause=max(0, options['pause']),
+            archive_path=options['archive_file'],
+            dry_run=options['dry_run'],
+        )
+        reclaimed = stats['expired'] + stats['over_cap']
+        verb = "Would archive" if options['dry_run'] else "Archived"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {reclaimed} notification(s): {stats['expired']} past retention, "
+            f"{stats['over_cap']} over the per-user cap"
+        ))
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"Deleted {stats['bodies']} unreferenced notification bodies"))
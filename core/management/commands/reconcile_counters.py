@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from core.counters import reconcile_dashboard_stats, reconcile_unread_counters
+from teacher.counters import reconcile_batch_counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute denormalised counters from the source tables and fix any "
+        "drift. Safe to run at any time, e.g. nightly from cron."
+    )
+
+    def handle(self, *args, **options):
+        corrected = reconcile_batch_counters()
+        self.stdout.write(self.style.SUCCESS(f"Batch counters: {corrected} batch(es) corrected"))
+        corrected = reconcile_unread_counters()
+        self.stdout.write(self.style.SUCCESS(f"Unread notification counters: {corrected} user(s) corrected"))
+        corrected = reconcile_dashboard_stats()
+        self.stdout.write(self.style.SUCCESS(f"Dashboard totals: {'corrected' if corrected else 'already correct'}"))
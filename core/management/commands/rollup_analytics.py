@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from core.analytics import DEFAULT_BATCH_SIZE, run_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold new uploads and sign-ins into the daily analytics tables. Only rows "
+        "past each rollup's watermark are read, so it is cheap to run often, e.g. "
+        "hourly from cron; run it at least daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="Source rows per transaction")
+
+    def handle(self, *args, **options):
+        counts = run_rollups(batch_size=max(1, options['batch_size']))
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {counts['uploads']} upload(s) and {counts['logins']} new active student-day(s)"
+        ))
@@ -3,10 +3,19 @@ from django.conf import settings
 from django.contrib.sessions.exceptions import SessionInterrupted
 from django.contrib import messages
 from django.shortcuts import redirect
-from django.db import OperationalError
+from django.db import connections
+from collections import Counter
+from contextlib import ExitStack
+import logging
 import os
+import re
 import time
 
+from .decorators import SAFE_METHODS
+from .sqlite import WRITE_TRANSACTION_MODE, transaction_mode
+
+logger = logging.getLogger(__name__)
+
 class SessionHandlerMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
@@ -14,35 +23,121 @@ class SessionHandlerMiddleware:
     def __call__(self, request):
         # Try to access the session early to catch any issues
         try:
-            # Force session read
+            # Marks the session as read; writes are left to core.session_store
             request.session.accessed = True
-            request.session.modified = True
         except SessionInterrupted:
             # If session is interrupted, clear it and redirect to login
             messages.error(request, "Your session has expired. Please log in again.")
             return redirect('core:login')
 
-        max_retries = 3
-        retry_count = 0
-        
-        while retry_count < max_retries:
+        # Lock waits are handled by core.writer; a failed request is not re-run
+        try:
+            return self.get_response(request)
+        except SessionInterrupted:
+            messages.error(request, "Your session has expired. Please log in again.")
+            return redirect('core:login')
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in strict mode when a view runs more queries than its budget"""
+
+class QueryBudgetMiddleware:
+    """
+    Per-request query accounting for finding N+1 patterns.
+
+    Opt-in with ``QUERY_BUDGET_ENABLED``. Records the query count, the time
+    spent in the database and repeated query shapes for every request, and
+    reports them in a ``Server-Timing`` header. A request that exceeds its
+    budget (``@query_budget``, ``QUERY_BUDGETS[view_name]`` or
+    ``QUERY_BUDGET_DEFAULT``) is logged, or fails with ``QueryBudgetExceeded``
+    when ``QUERY_BUDGET_STRICT`` is set, as it is under test.
+    """
+    _in_list = re.compile(r'IN \((?:%s, )*%s\)')
+    # Transaction bookkeeping (atomic view savepoints etc.) is not counted
+    _transaction_control = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT', 'BEGIN')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    @classmethod
+    def fingerprint(cls, sql):
+        """Query shape with parameter lists collapsed, so N+1 loops group together"""
+        return cls._in_list.sub('IN (...)', sql)
+
+    def __call__(self, request):
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', False):
+            return self.get_response(request)
+
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            if sql.startswith(self._transaction_control):
+                return execute(sql, params, many, context)
+            start = time.perf_counter()
             try:
-                response = self.get_response(request)
-                return response
-            except OperationalError as e:
-                if 'database is locked' in str(e):
-                    # Wait a bit before retrying
-                    time.sleep(0.1 * (retry_count + 1))
-                    retry_count += 1
-                    continue
-                raise
-            except SessionInterrupted:
-                messages.error(request, "Your session has expired. Please log in again.")
-                return redirect('core:login')
-        
-        # If we get here, we've exceeded our retries
-        messages.error(request, "The server is currently busy. Please try again.")
-        return redirect('core:home')
+                return execute(sql, params, many, context)
+            finally:
+                queries.append((self.fingerprint(sql), time.perf_counter() - start))
+
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(record))
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - start) * 1000
+
+        db_ms = sum(duration for _, duration in queries) * 1000
+        response['Server-Timing'] = ', '.join(filter(None, [
+            response.get('Server-Timing'),
+            f'db;dur={db_ms:.1f};desc="{len(queries)} queries"',
+            f'app;dur={total_ms:.1f}',
+        ]))
+
+        view_name = request.resolver_match.view_name if request.resolver_match else request.path
+        threshold = getattr(settings, 'QUERY_BUDGET_DUPLICATE_THRESHOLD', 5)
+        repeated = [(sql, n) for sql, n in Counter(sql for sql, _ in queries).most_common() if n >= threshold]
+        for sql, n in repeated:
+            logger.warning(f"Possible N+1 in {view_name}: {n} x {sql[:200]}")
+
+        budget = self._budget_for(request, view_name)
+        if budget is not None and len(queries) > budget:
+            message = (
+                f"{view_name} ran {len(queries)} queries (budget {budget}) in {db_ms:.1f}ms; "
+                f"most repeated: {repeated[:3] or 'none'}"
+            )
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, 'query_budget', None)
+        return None
+
+    def _budget_for(self, request, view_name):
+        budget = getattr(request, 'query_budget', None)
+        if budget is None:
+            budget = getattr(settings, 'QUERY_BUDGETS', {}).get(view_name)
+        if budget is None:
+            budget = getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+        return budget
+
+class WriteTransactionMiddleware:
+    """
+    Begin transactions opened while handling an unsafe request (POST etc.)
+    with ``BEGIN IMMEDIATE`` (``core/sqlite.py``), so they take SQLite's
+    write lock up front instead of failing to upgrade half way. Queueing
+    for the write slot is left to the view's transaction policy
+    (``core.decorators.transaction_policy``) and ``write_transaction``.
+    Safe methods only read and pass straight through.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method in SAFE_METHODS:
+            return self.get_response(request)
+        with transaction_mode(WRITE_TRANSACTION_MODE):
+            return self.get_response(request)
 
 class FontMiddleware:
     def __init__(self, get_response):
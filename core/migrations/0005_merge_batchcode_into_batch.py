@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def merge_batch_codes(apps, schema_editor):
+    """Fold BatchCode rows and User.batchcode strings into teacher.Batch"""
+    db_alias = schema_editor.connection.alias
+    BatchCode = apps.get_model('core', 'BatchCode')
+    Batch = apps.get_model('teacher', 'Batch')
+    User = apps.get_model('core', 'User')
+    Student = apps.get_model('student', 'Student')
+
+    batches = {batch.batch_code: batch for batch in Batch.objects.using(db_alias)}
+
+    for code in BatchCode.objects.using(db_alias):
+        batch = batches.get(code.batch_code)
+        if batch is None:
+            batch = Batch.objects.using(db_alias).create(batch_code=code.batch_code)
+            batches[code.batch_code] = batch
+        batch.class_name = code.class_name or ''
+        batch.academic_year = code.academic_year or ''
+        batch.branch = code.branch or ''
+        batch.username = code.username
+        batch.password = code.password
+        batch.save(update_fields=['class_name', 'academic_year', 'branch', 'username', 'password'])
+
+    for user in User.objects.using(db_alias).exclude(batchcode__isnull=True).exclude(batchcode=''):
+        code = user.batchcode.strip()
+        batch = batches.get(code)
+        if batch is None:
+            batch = Batch.objects.using(db_alias).create(batch_code=code)
+            batches[code] = batch
+        User.objects.using(db_alias).filter(id=user.id).update(batch=batch)
+
+    # Students are authoritative for their own batch
+    for student in Student.objects.using(db_alias).filter(batch__isnull=False, user__isnull=False):
+        User.objects.using(db_alias).filter(id=student.user_id).update(batch_id=student.batch_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_batchcode_password_batchcode_username'),
+        ('teacher', '0009_batch_details'),
+        ('student', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='users', to='teacher.batch'),
+        ),
+        migrations.RunPython(merge_batch_codes, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='user',
+            name='batchcode',
+        ),
+        migrations.DeleteModel(
+            name='BatchCode',
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def move_text_to_bodies(apps, schema_editor):
+    """One body per distinct (title, message); rows keep their own read state"""
+    db_alias = schema_editor.connection.alias
+    Notification = apps.get_model('core', 'Notification')
+    NotificationBody = apps.get_model('core', 'NotificationBody')
+
+    bodies = {}
+    for notification in Notification.objects.using(db_alias).order_by('created_at').iterator():
+        key = (notification.title, notification.message)
+        body = bodies.get(key)
+        if body is None:
+            body = NotificationBody.objects.using(db_alias).create(title=notification.title, message=notification.message)
+            NotificationBody.objects.using(db_alias).filter(id=body.id).update(created_at=notification.created_at)
+            bodies[key] = body
+        Notification.objects.using(db_alias).filter(id=notification.id).update(body=body)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_merge_batchcode_into_batch'),
+        ('teacher', '0009_batch_details'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationBody',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200)),
+                ('message', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('upload', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='notification_bodies', to='teacher.upload')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='body',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='recipients', to='core.notificationbody'),
+        ),
+        migrations.RunPython(move_text_to_bodies, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='notification',
+            name='title',
+        ),
+        migrations.RemoveField(
+            model_name='notification',
+            name='message',
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='body',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipients', to='core.notificationbody'),
+        ),
+    ]
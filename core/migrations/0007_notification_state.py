@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_unread(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    Notification = apps.get_model('core', 'Notification')
+    NotificationState = apps.get_model('core', 'NotificationState')
+    unread = Notification.objects.using(db_alias).filter(is_read=False).values('user').annotate(n=Count('id'))
+    NotificationState.objects.using(db_alias).bulk_create(
+        [NotificationState(user_id=row['user'], unread_count=row['n']) for row in unread],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_notification_body'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationState',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_state', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', 'created_at'], name='notification_user_read_idx'),
+        ),
+        migrations.RunPython(count_unread, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_notification_archive'),
+        ('teacher', '0009_batch_details'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationbody',
+            name='digest_key',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='notificationbody',
+            name='items',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='notificationbody',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='notificationbody',
+            index=models.Index(fields=['digest_key', 'updated_at'], name='notification_body_digest_idx'),
+        ),
+    ]
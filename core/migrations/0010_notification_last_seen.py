@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:01
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+
+
+def read_flags_to_cursor(apps, schema_editor):
+    """Place each user's cursor just before their oldest unread notification.
+
+    Users with nothing unread get a cursor at their newest notification.
+    Unread counts are then recomputed against the cursor.
+    """
+    db_alias = schema_editor.connection.alias
+    Notification = apps.get_model('core', 'Notification')
+    NotificationState = apps.get_model('core', 'NotificationState')
+
+    oldest_unread = dict(
+        Notification.objects.using(db_alias).filter(is_read=False).values('user').annotate(t=Min('created_at')).values_list('user', 't')
+    )
+    newest = Notification.objects.using(db_alias).values('user').annotate(t=Max('created_at'), n=Count('id'))
+    for row in newest.iterator():
+        user_id = row['user']
+        if user_id in oldest_unread:
+            last_seen = oldest_unread[user_id] - timedelta(microseconds=1)
+        else:
+            last_seen = row['t']
+        unread = Notification.objects.using(db_alias).filter(user_id=user_id, created_at__gt=last_seen).count()
+        NotificationState.objects.using(db_alias).update_or_create(
+            user_id=user_id, defaults={'last_seen_at': last_seen, 'unread_count': unread}
+        )
+    # Users without notifications have seen everything so far
+    NotificationState.objects.using(db_alias).filter(last_seen_at__isnull=True).update(last_seen_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_notification_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationstate',
+            name='last_seen_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(read_flags_to_cursor, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='notification_user_read_idx',
+        ),
+        migrations.RemoveField(
+            model_name='notification',
+            name='is_read',
+        ),
+    ]
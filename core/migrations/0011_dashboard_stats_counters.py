@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:12
+
+from django.db import migrations, models
+
+
+def count_totals(apps, schema_editor):
+    """Replace the placeholder figures with real totals in a single pk=1 row"""
+    db_alias = schema_editor.connection.alias
+    DashboardStats = apps.get_model('core', 'DashboardStats')
+    User = apps.get_model('core', 'User')
+    Batch = apps.get_model('teacher', 'Batch')
+    Upload = apps.get_model('teacher', 'Upload')
+
+    DashboardStats.objects.using(db_alias).exclude(pk=1).delete()
+    DashboardStats.objects.using(db_alias).update_or_create(pk=1, defaults={
+        'total_teachers': User.objects.using(db_alias).filter(role__role_name='Teacher').count(),
+        'total_students': User.objects.using(db_alias).filter(role__role_name='Student').count(),
+        'total_batches': Batch.objects.using(db_alias).count(),
+        'total_sent_files': Upload.objects.using(db_alias).count(),
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_notification_last_seen'),
+        ('teacher', '0009_batch_details'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dashboardstats',
+            name='total_batches',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='dashboardstats',
+            name='total_sent_files',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='dashboardstats',
+            name='total_students',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='dashboardstats',
+            name='total_teachers',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def map_live_sessions(apps, schema_editor):
+    """Decode live sessions once so their owners can be found by key from now on"""
+    from django.contrib.sessions.backends.db import SessionStore
+
+    db_alias = schema_editor.connection.alias
+
+    Session = apps.get_model('sessions', 'Session')
+    User = apps.get_model('core', 'User')
+    UserSession = apps.get_model('core', 'UserSession')
+
+    decoder = SessionStore()
+    user_ids = set(User.objects.using(db_alias).values_list('id', flat=True))
+    rows = []
+    for session in Session.objects.using(db_alias).filter(expire_date__gt=timezone.now()).iterator():
+        user_id = decoder.decode(session.session_data).get('_auth_user_id')
+        if user_id is not None and int(user_id) in user_ids:
+            rows.append(UserSession(user_id=int(user_id), session_key=session.session_key))
+    UserSession.objects.using(db_alias).bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_analytics_rollups'),
+        ('sessions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_key', models.CharField(max_length=40, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(map_live_sessions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_user_sessions'),
+        ('teacher', '0009_batch_details'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='notificationbody',
+            name='notification_body_digest_idx',
+        ),
+        migrations.AddIndex(
+            model_name='notificationbody',
+            index=models.Index(fields=['digest_key', 'created_at'], name='notif_body_digest_created_idx'),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from datetime import timedelta
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 
@@ -12,30 +13,13 @@ class Role(models.Model):
     def __str__(self):
         return self.role_name
 
-class BatchCode(models.Model):
-    BRANCH_CHOICES = (
-        ("Nehru nagar", "Nehru nagar"),
-        ("Gandhipuram", "Gandhipuram"),
-    )
-    
-    batch_code = models.CharField(max_length=20, unique=True)
-    class_name = models.CharField(max_length=50)
-    academic_year = models.CharField(max_length=20)
-    branch = models.CharField(max_length=50, choices=BRANCH_CHOICES)
-    username = models.CharField(max_length=100, null=True, blank=True)
-    password = models.CharField(max_length=100, null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
-
-    def __str__(self):
-        return f"{self.batch_code} - {self.class_name} ({self.branch})"
-
 class User(AbstractUser):
     first_name = models.CharField(max_length=50)  # Changed to first_name for AbstractUser compatibility
     last_name = models.CharField(max_length=50)   # Changed to last_name
     username = models.CharField(max_length=50, unique=True)
     # email = models.EmailField(unique=True)
     # phone_number = models.CharField(max_length=15, unique=True)
-    batchcode = models.CharField(max_length=10)
+    batch = models.ForeignKey('teacher.Batch', on_delete=models.SET_NULL, null=True, blank=True, related_name='users')
     role = models.ForeignKey(Role, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -43,39 +27,192 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so the dashboard counters can follow a role change on save
+        instance._loaded_role_id = instance.__dict__.get('role_id')
+        # and the search index a rename
+        instance._loaded_name = tuple(instance.__dict__.get(field) for field in ('first_name', 'last_name', 'username'))
+        return instance
+
 class DashboardStats(models.Model):
-    total_teachers = models.IntegerField(default=50)
-    total_students = models.IntegerField(default=1200)
-    total_batches = models.IntegerField(default=30)
-    total_sent_files = models.IntegerField(default=450)
+    """Site-wide totals in a single row (pk=1), maintained by core/counters.py"""
+    total_teachers = models.IntegerField(default=0)
+    total_students = models.IntegerField(default=0)
+    total_batches = models.IntegerField(default=0)
+    total_sent_files = models.IntegerField(default=0)
 
     def __str__(self):
         return "Dashboard Statistics"
 
-class Notification(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+class NotificationBody(models.Model):
+    """Text of a notification, stored once however many users receive it"""
     title = models.CharField(max_length=200)
     message = models.TextField()
-    is_read = models.BooleanField(default=False)
+    upload = models.ForeignKey('teacher.Upload', on_delete=models.SET_NULL, null=True, blank=True, related_name='notification_bodies')
+    # Digests: bodies with the same key inside the window are merged
+    digest_key = models.CharField(max_length=100, blank=True, default='')
+    items = models.JSONField(default=list, blank=True)  # What a digest covers, newest last
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['digest_key', 'created_at'], name='notif_body_digest_created_idx'),
+        ]
+
+    def __str__(self):
+        return self.title
+
+DIGEST_TOPICS_SHOWN = 5
+
+class Notification(models.Model):
+    """One recipient of a NotificationBody.
+
+    There is no per-row read flag: a notification is unread while it is
+    newer than the user's ``NotificationState.last_seen_at``.
+    """
+    FANOUT_BATCH_SIZE = 500
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    body = models.ForeignKey(NotificationBody, on_delete=models.CASCADE, related_name='recipients')
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Newest-first history for one user, and "newer than last_seen_at"
+            models.Index(fields=['user', '-created_at'], name='notification_user_recent_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.user.username}"
 
+    @property
+    def title(self):
+        return self.body.title
+
+    @property
+    def message(self):
+        return self.body.message
+
+    @classmethod
+    def notify(cls, users, title, message, upload=None):
+        """Send one notification to many users: one body row plus a bulk insert
+        
+        Args:
+            users: User instances or user ids
+            title: Notification title
+            message: Notification text
+            upload: Optional upload the notification is about
+        """
+        user_ids = {getattr(user, 'pk', user) for user in users}
+        user_ids.discard(None)
+        if not user_ids:
+            return None
+        body = NotificationBody.objects.create(title=title, message=message, upload=upload)
+        cls.objects.bulk_create(
+            [cls(user_id=user_id, body=body) for user_id in user_ids],
+            batch_size=cls.FANOUT_BATCH_SIZE,
+        )
+        # bulk_create sends no signals, so the unread counters are bumped here
+        from .counters import adjust_unread_counts
+        adjust_unread_counts(user_ids, 1)
+
+        cls._publish(body, user_ids)
+        return body
+
+    @classmethod
+    def _publish(cls, body, user_ids):
+        from .events import publish, user_channel
+        publish([user_channel(user_id) for user_id in user_ids], 'notification', {
+            'body_id': body.id,
+            'title': body.title,
+            'message': body.message,
+            'created_at': body.updated_at.isoformat(),
+        })
+
+    @classmethod
+    def notify_digest(cls, users, digest_key, item, render, upload=None):
+        """Like notify(), but merge into a recent body with the same ``digest_key``
+        
+        Within ``NOTIFICATION_DIGEST_WINDOW_SECONDS`` of the digest's first
+        event, ``item`` is appended to it, its text is re-rendered in place
+        and every recipient's row moves back to the top as unread, instead
+        of a new notification being written per event. The window does not
+        slide, so a steady stream of events starts a new digest each window
+        and ``items`` stays bounded.
+        
+        Args:
+            users: User instances or user ids
+            digest_key: What may be merged, e.g. one teacher's uploads to one batch
+            item: Description of this event, kept in ``NotificationBody.items``
+            render: Callable taking the list of items and returning (title, message)
+            upload: Optional upload the notification is about
+        """
+        from django.conf import settings
+        from django.utils import timezone
+        from .counters import adjust_unread_counts
+
+        user_ids = {getattr(user, 'pk', user) for user in users}
+        user_ids.discard(None)
+        if not user_ids:
+            return None
+
+        window = getattr(settings, 'NOTIFICATION_DIGEST_WINDOW_SECONDS', 0)
+        body = None
+        if window:
+            since = timezone.now() - timedelta(seconds=window)
+            body = NotificationBody.objects.select_for_update().filter(
+                digest_key=digest_key, created_at__gte=since
+            ).order_by('-created_at').first()
+        if body is None:
+            title, message = render([item])
+            body = NotificationBody.objects.create(
+                title=title, message=message, upload=upload, digest_key=digest_key, items=[item]
+            )
+            cls.objects.bulk_create(
+                [cls(user_id=user_id, body=body) for user_id in user_ids],
+                batch_size=cls.FANOUT_BATCH_SIZE,
+            )
+            adjust_unread_counts(user_ids, 1)
+            cls._publish(body, user_ids)
+            return body
+
+        body.items = body.items + [item]
+        body.title, body.message = render(body.items)
+        body.save(update_fields=['items', 'title', 'message', 'updated_at'])
+
+        rows = cls.objects.filter(body=body, user_id__in=user_ids)
+        existing = set(rows.values_list('user_id', flat=True))
+        # Rows the user has already seen become unread again when moved up
+        reread = list(rows.filter(
+            created_at__lte=models.F('user__notification_state__last_seen_at')
+        ).values_list('user_id', flat=True))
+        rows.update(created_at=body.updated_at)
+        # Students who joined since, or deleted the digest, get a fresh row
+        missing = user_ids - existing
+        cls.objects.bulk_create(
+            [cls(user_id=user_id, body=body) for user_id in missing],
+            batch_size=cls.FANOUT_BATCH_SIZE,
+        )
+        adjust_unread_counts(reread + list(missing), 1)
+        cls._publish(body, user_ids)
+        return body
+
     @classmethod
-    def create_file_notification(cls, user, subject, topic, teacher_name, batch_code=None, is_batch_upload=False):
+    def create_file_notification(cls, users, subject, topic, teacher_name, batch_code=None, is_batch_upload=False, upload=None):
         """Create a notification for a new file upload
         
         Args:
-            user: The user to notify
+            users: The users (or user ids) to notify
             subject: The subject of the file
             topic: The topic/name of the file
             teacher_name: Name of the teacher who shared the file
             batch_code: Optional batch code if the file is shared with a batch
             is_batch_upload: True if file is uploaded to a batch, False if shared individually
+            upload: The upload the notification is about
         """
         title = f"New {subject} File Available"
         
@@ -87,5 +224,108 @@ class Notification(models.Model):
             message = f"A new file '{topic}' has been shared with you by {teacher_name}"
             if batch_code:
                 message += f" (Batch: {batch_code})"
+
+        # A burst of uploads from one teacher to one batch becomes one digest
+        if is_batch_upload and upload is not None and upload.batch_id:
+            def render(items):
+                if len(items) == 1:
+                    return title, message
+                subjects = sorted({item['subject'] for item in items})
+                topics = [f"'{item['topic']}'" for item in items[-DIGEST_TOPICS_SHOWN:]]
+                more = len(items) - len(topics)
+                listed = ', '.join(topics) + (f" and {more} earlier" if more else '')
+                return (
+                    f"{len(items)} New {' / '.join(subjects)} Files Available"[:200],
+                    f"{teacher_name} shared {len(items)} files for your batch ({batch_code}): {listed}",
+                )
+            return cls.notify_digest(
+                users,
+                digest_key=f"upload:{upload.teacher_id}:{upload.batch_id}",
+                item={'upload_id': upload.pk, 'subject': subject, 'topic': topic},
+                render=render,
+                upload=upload,
+            )
                 
-        return cls.objects.create(user=user, title=title, message=message)
\ No newline at end of file
+        return cls.notify(users, title, message, upload=upload)
+
+
+class NotificationState(models.Model):
+    """Per-user read cursor and unread counter, kept in step by core.counters"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='notification_state')
+    # Notifications created after this are unread; None means nothing seen yet
+    last_seen_at = models.DateTimeField(null=True, blank=True)
+    unread_count = models.PositiveIntegerField(default=0)
+
+    def is_unread(self, notification):
+        return self.last_seen_at is None or notification.created_at > self.last_seen_at
+
+    def __str__(self):
+        return f"{self.user.username}: {self.unread_count} unread"
+
+class NotificationArchive(models.Model):
+    """Pruned notifications, compacted to one row per original body"""
+    body_id = models.PositiveBigIntegerField(unique=True)
+    title = models.CharField(max_length=200)
+    message = models.TextField()
+    created_at = models.DateTimeField()
+    recipients = models.JSONField(default=list)  # User ids the body was sent to
+    archived_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.title} ({len(self.recipients)} recipients)"
+
+class RollupWatermark(models.Model):
+    """How far an analytics rollup in core.analytics has read its source table"""
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.PositiveBigIntegerField(default=0)
+    last_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_id or self.last_at}"
+
+class DailyUploadStat(models.Model):
+    """Uploads per day for one batch, subject and teacher"""
+    day = models.DateField()
+    batch = models.ForeignKey('teacher.Batch', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    teacher = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    subject = models.CharField(max_length=50)
+    branch = models.CharField(max_length=50, blank=True, default='')  # The batch's branch at upload time
+    uploads = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['day', 'batch', 'subject', 'teacher'], name='daily_upload_stat_key_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.subject}: {self.uploads}"
+
+class DailyActiveStudent(models.Model):
+    """A student who signed in on ``day``, with their batch at the time"""
+    day = models.DateField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    batch = models.ForeignKey('teacher.Batch', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'user'], name='daily_active_student_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'batch'], name='daily_active_day_batch_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.user_id}"
+
+class UserSession(models.Model):
+    """Which session keys belong to a user, so old sessions can be revoked by key"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='user_sessions')
+    session_key = models.CharField(max_length=40, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.session_key[:8]}…"
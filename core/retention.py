@@ -0,0 +1,191 @@
+# core/retention.py
+"""
+Notification retention: archive and delete old or excess notifications.
+
+Two rules, applied by ``manage.py prune_notifications``:
+
+* read notifications (at or before the user's ``last_seen_at``) older than
+  ``NOTIFICATION_RETENTION_DAYS`` are archived;
+* each user keeps at most ``NOTIFICATION_MAX_PER_USER`` notifications, and
+  anything older than that (read or not) is archived.
+
+Archived rows are folded into ``NotificationArchive``, one row per original
+body with the recipient ids in a list, or appended to a JSON-lines file.
+Work happens in small transactions with a pause in between so SQLite's
+write lock is never held for long. Bodies left without recipients are
+deleted at the end.
+"""
+import gzip
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .writer import write_transaction
+
+DEFAULT_RETENTION_DAYS = 90
+DEFAULT_MAX_PER_USER = 200
+DEFAULT_BATCH_SIZE = 500
+ORPHAN_GRACE = timedelta(hours=1)
+
+
+def _expired_filter(days):
+    # Read means at or before the user's last_seen_at cursor
+    return Q(
+        created_at__lt=timezone.now() - timedelta(days=days),
+        created_at__lte=F('user__notification_state__last_seen_at'),
+    )
+
+
+def expired_ids(days):
+    """Ids of read notifications older than ``days``"""
+    from .models import Notification
+
+    return Notification.objects.filter(_expired_filter(days)).order_by('id').values_list('id', flat=True)
+
+
+def over_cap_ids(max_per_user, days=None):
+    """Ids beyond each user's newest ``max_per_user`` notifications.
+
+    With ``days``, rows the retention rule would remove are left out first.
+    """
+    from .models import Notification
+
+    remaining = Notification.objects.all()
+    if days is not None:
+        remaining = remaining.exclude(_expired_filter(days))
+    users = remaining.values('user').annotate(n=Count('id')).filter(n__gt=max_per_user)
+    for row in users.iterator():
+        yield from remaining.filter(user_id=row['user']).order_by('-created_at', '-id').values_list('id', flat=True)[max_per_user:]
+
+
+def _chunks(ids, size):
+    chunk = []
+    for notification_id in ids:
+        chunk.append(notification_id)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _archive_to_table(notifications):
+    from .models import NotificationArchive
+
+    by_body = {}
+    for notification in notifications:
+        by_body.setdefault(notification.body_id, []).append(notification)
+
+    existing = NotificationArchive.objects.in_bulk(list(by_body), field_name='body_id')
+    new, changed = [], []
+    for body_id, rows in by_body.items():
+        user_ids = [row.user_id for row in rows]
+        archive = existing.get(body_id)
+        if archive is None:
+            body = rows[0].body
+            new.append(NotificationArchive(
+                body_id=body_id, title=body.title, message=body.message,
+                created_at=body.created_at, recipients=sorted(set(user_ids)),
+            ))
+        else:
+            archive.recipients = sorted(set(archive.recipients) | set(user_ids))
+            archive.archived_at = timezone.now()
+            changed.append(archive)
+    NotificationArchive.objects.bulk_create(new)
+    NotificationArchive.objects.bulk_update(changed, ['recipients', 'archived_at'])
+
+
+def _archive_to_file(notifications, archive_file):
+    for notification in notifications:
+        archive_file.write(json.dumps({
+            'user_id': notification.user_id,
+            'title': notification.body.title,
+            'message': notification.body.message,
+            'created_at': notification.created_at.isoformat(),
+        }) + '\n')
+
+
+def archive_batch(ids, archive_file=None):
+    """Archive and delete one batch of notifications. Returns rows deleted."""
+    from .models import Notification
+
+    with write_transaction():
+        notifications = list(Notification.objects.filter(id__in=ids).select_related('body'))
+        if not notifications:
+            return 0
+        if archive_file is None:
+            _archive_to_table(notifications)
+        else:
+            _archive_to_file(notifications, archive_file)
+        # post_delete keeps the unread counters right for capped unread rows
+        deleted, _ = Notification.objects.filter(id__in=[n.id for n in notifications]).delete()
+    return deleted
+
+
+def delete_orphan_bodies(batch_size=DEFAULT_BATCH_SIZE, pause=0):
+    """Delete bodies that no longer have any recipient. Returns rows deleted."""
+    from .models import NotificationBody
+
+    # Recent bodies may still be getting their recipient rows written
+    cutoff = timezone.now() - ORPHAN_GRACE
+    orphans = NotificationBody.objects.filter(
+        recipients__isnull=True, created_at__lt=cutoff
+    ).order_by('id').values_list('id', flat=True)
+    deleted = 0
+    while True:
+        with write_transaction():
+            ids = list(orphans[:batch_size])
+            if not ids:
+                break
+            deleted += NotificationBody.objects.filter(id__in=ids).delete()[0]
+        if pause:
+            time.sleep(pause)
+    return deleted
+
+
+def open_archive_file(path):
+    """Append-mode text file for archived rows; ``.gz`` paths are compressed"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'at', encoding='utf-8')
+    return open(path, 'a', encoding='utf-8')
+
+
+def prune_notifications(days=None, max_per_user=None, batch_size=DEFAULT_BATCH_SIZE,
+                        pause=0.05, archive_path=None, dry_run=False):
+    """Apply the retention rules. Returns counts of what was (or would be) reclaimed."""
+    if days is None:
+        days = getattr(settings, 'NOTIFICATION_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+    if max_per_user is None:
+        max_per_user = getattr(settings, 'NOTIFICATION_MAX_PER_USER', DEFAULT_MAX_PER_USER)
+
+    stats = {'expired': 0, 'over_cap': 0, 'bodies': 0}
+    if dry_run:
+        stats['expired'] = expired_ids(days).count()
+        stats['over_cap'] = sum(1 for _ in over_cap_ids(max_per_user, days))
+        return stats
+
+    archive_file = open_archive_file(archive_path) if archive_path else None
+    try:
+        rules = (
+            ('expired', lambda: expired_ids(days)),
+            # Found after expiry, so users are only capped on what is left
+            ('over_cap', lambda: over_cap_ids(max_per_user, days)),
+        )
+        for rule, find_ids in rules:
+            # Ids are collected first: deleting while paging would skip rows
+            for chunk in _chunks(list(find_ids()), batch_size):
+                stats[rule] += archive_batch(chunk, archive_file)
+                if archive_file is not None:
+                    archive_file.flush()
+                if pause:
+                    time.sleep(pause)
+    finally:
+        if archive_file is not None:
+            archive_file.close()
+
+    stats['bodies'] = delete_orphan_bodies(batch_size, pause)
+    return stats
@@ -0,0 +1,42 @@
+# core/session_store.py
+"""
+Session engine that writes only when it has to (``SESSION_ENGINE =
+'core.session_store'``).
+
+Reads go to the cache first and fall back to the database, as with
+Django's ``cached_db`` engine. A session is written when its data changes,
+or when its sliding expiry was last pushed out more than
+``SESSION_REFRESH_SECONDS`` ago. Everything else costs no write, so page
+views and pdf.js range requests no longer each UPDATE ``django_session``
+the way ``SESSION_SAVE_EVERY_REQUEST`` did. Sessions therefore last between
+``SESSION_COOKIE_AGE - SESSION_REFRESH_SECONDS`` and ``SESSION_COOKIE_AGE``
+after the last request.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+REFRESHED_KEY = '_session_refreshed'
+DEFAULT_REFRESH_SECONDS = 300
+
+
+def refresh_seconds():
+    return getattr(settings, 'SESSION_REFRESH_SECONDS', DEFAULT_REFRESH_SECONDS)
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = 'core.session_store'
+
+    def load(self):
+        data = super().load()
+        # Only real sessions slide; a new or empty one has nothing to keep alive
+        if data and self.session_key:
+            refreshed = data.get(REFRESHED_KEY, 0)
+            if time.time() - refreshed >= refresh_seconds():
+                self.modified = True
+        return data
+
+    def save(self, must_create=False):
+        self._get_session(no_load=must_create)[REFRESHED_KEY] = int(time.time())
+        super().save(must_create=must_create)
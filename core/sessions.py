@@ -0,0 +1,43 @@
+# core/sessions.py
+"""
+User to session-key mapping for single-session sign-in.
+
+``UserSession`` holds one row per live sign-in. ``start_single_session``
+revokes the user's other sessions by key through the configured session
+engine, so revocation costs one lookup on an indexed column however many
+sessions exist. ``end_session`` drops the row on sign-out; a session that
+just expires leaves its row behind until the user's next sign-in revokes it.
+"""
+from importlib import import_module
+
+from django.conf import settings
+
+
+def _session_store():
+    return import_module(settings.SESSION_ENGINE).SessionStore
+
+
+def revoke_sessions(session_keys):
+    """Delete the given sessions from the session engine"""
+    SessionStore = _session_store()
+    for session_key in session_keys:
+        SessionStore(session_key=session_key).delete()
+
+
+def start_single_session(user, session_key):
+    """Record ``session_key`` for ``user`` and revoke any other session they hold"""
+    from .models import UserSession
+
+    others = list(UserSession.objects.filter(user=user).exclude(session_key=session_key).values_list('session_key', flat=True))
+    if others:
+        revoke_sessions(others)
+        UserSession.objects.filter(session_key__in=others).delete()
+    UserSession.objects.update_or_create(session_key=session_key, defaults={'user': user})
+    return len(others)
+
+
+def end_session(session_key):
+    from .models import UserSession
+
+    if session_key:
+        UserSession.objects.filter(session_key=session_key).delete()
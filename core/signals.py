@@ -0,0 +1,67 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .backends import forget_user
+from .counters import adjust_dashboard_stats, adjust_unread_counts, adjust_unread_if_unseen, role_stat_field
+from .models import Notification, Role, User
+from .sqlite import on_connection_created
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    """Drop a changed user from the auth backend's per-process cache"""
+    forget_user(instance.pk)
+
+
+def _role_name(role_id):
+    if role_id is None:
+        return None
+    return Role.objects.filter(id=role_id).values_list('role_name', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def count_saved_user(sender, instance, created=False, raw=False, **kwargs):
+    """Keep the dashboard's teacher and student totals in step with users"""
+    if raw:
+        return
+    if created:
+        # The role object is normally already attached to a new user
+        field = role_stat_field(instance.role.role_name)
+        if field:
+            adjust_dashboard_stats(**{field: 1})
+    elif hasattr(instance, '_loaded_role_id') and instance._loaded_role_id != instance.role_id:
+        deltas = {}
+        old_field = role_stat_field(_role_name(instance._loaded_role_id))
+        new_field = role_stat_field(_role_name(instance.role_id))
+        if old_field:
+            deltas[old_field] = deltas.get(old_field, 0) - 1
+        if new_field:
+            deltas[new_field] = deltas.get(new_field, 0) + 1
+        adjust_dashboard_stats(**deltas)
+    instance._loaded_role_id = instance.role_id
+
+
+@receiver(post_delete, sender=User)
+def count_deleted_user(sender, instance, **kwargs):
+    field = role_stat_field(_role_name(getattr(instance, '_loaded_role_id', instance.role_id)))
+    if field:
+        adjust_dashboard_stats(**{field: -1})
+
+
+@receiver(post_save, sender=Notification)
+def count_created_notification(sender, instance, created=False, raw=False, **kwargs):
+    """Keep NotificationState.unread_count in step with single creates"""
+    # A new row is always newer than the user's last_seen_at
+    if created and not raw:
+        adjust_unread_counts([instance.user_id], 1)
+
+
+@receiver(post_delete, sender=Notification)
+def count_deleted_notification(sender, instance, **kwargs):
+    adjust_unread_if_unseen(instance.user_id, instance.created_at, -1)
+
+
+# Pragma profile for every new SQLite connection (core/sqlite.py)
+connection_created.connect(on_connection_created, dispatch_uid='core.sqlite.pragmas')
@@ -0,0 +1,114 @@
+# core/sqlite.py
+"""
+SQLite tuning: a pragma profile applied to every new connection, and
+``BEGIN IMMEDIATE`` for transactions that are going to write.
+
+``SQLITE_PRAGMAS`` is checked against ``PRAGMA_RULES`` (values end up in
+SQL, so only known pragmas and well-formed values are accepted) and applied
+from the ``connection_created`` signal. The default profile turns on WAL, so
+readers no longer block the writer or each other, relaxes ``synchronous`` to
+NORMAL (safe under WAL), maps the file into memory and sets a busy timeout.
+
+A deferred transaction that reads before it writes has to upgrade its lock
+half way through; if another connection got there first, SQLite fails the
+upgrade at once with "database is locked" rather than waiting, since
+waiting could deadlock. Starting write transactions with ``BEGIN IMMEDIATE``
+takes the write lock up front, where ``busy_timeout`` does apply.
+``core.middleware.WriteTransactionMiddleware`` does that for unsafe HTTP
+methods; other writers use ``core.writer.write_transaction``.
+"""
+import logging
+import re
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 30000,  # Milliseconds
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,  # Negative: KiB, so 64 MB
+    'temp_store': 'MEMORY',
+}
+
+_non_negative = re.compile(r'^\d+$')
+_integer = re.compile(r'^-?\d+$')
+
+PRAGMA_RULES = {
+    'journal_mode': {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'},
+    'synchronous': {'OFF', 'NORMAL', 'FULL', 'EXTRA'},
+    'temp_store': {'DEFAULT', 'FILE', 'MEMORY'},
+    'busy_timeout': _non_negative,
+    'mmap_size': _non_negative,
+    'cache_size': _integer,
+    'wal_autocheckpoint': _non_negative,
+    'journal_size_limit': _integer,
+}
+
+WRITE_TRANSACTION_MODE = 'IMMEDIATE'
+
+
+def validate_pragmas(pragmas):
+    """Normalised ``{name: value}`` for ``pragmas``; ImproperlyConfigured if any is unknown or malformed"""
+    validated = {}
+    for name, value in pragmas.items():
+        rule = PRAGMA_RULES.get(name)
+        if rule is None:
+            raise ImproperlyConfigured(
+                f"SQLITE_PRAGMAS: unsupported pragma {name!r}; expected one of {', '.join(sorted(PRAGMA_RULES))}"
+            )
+        text = str(value).upper() if isinstance(rule, set) else str(value)
+        valid = text in rule if isinstance(rule, set) else bool(rule.match(text))
+        if not valid:
+            raise ImproperlyConfigured(f"SQLITE_PRAGMAS: invalid value {value!r} for {name}")
+        validated[name] = text
+    return validated
+
+
+def configured_pragmas():
+    return validate_pragmas(getattr(settings, 'SQLITE_PRAGMAS', DEFAULT_PRAGMAS))
+
+
+def apply_pragmas(connection, pragmas=None):
+    """Run the pragma profile on a new SQLite connection. Returns what SQLite reports back."""
+    pragmas = configured_pragmas() if pragmas is None else validate_pragmas(pragmas)
+    applied = {}
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+            cursor.execute(f'PRAGMA {name}')
+            row = cursor.fetchone()
+            applied[name] = row[0] if row else None
+    # In-memory databases (tests) cannot use WAL; anything else is worth a warning
+    journal_mode = applied.get('journal_mode')
+    wanted = pragmas.get('journal_mode')
+    if wanted and journal_mode and str(journal_mode).upper() != wanted and not connection.is_in_memory_db():
+        logger.warning(f"SQLite journal_mode is {journal_mode}, not {wanted}")
+    return applied
+
+
+def on_connection_created(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        apply_pragmas(connection)
+
+
+@contextmanager
+def transaction_mode(mode, using=DEFAULT_DB_ALIAS):
+    """Start transactions opened inside this block with ``BEGIN <mode>`` on SQLite"""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    # Connecting resets transaction_mode from settings, so connect first
+    connection.ensure_connection()
+    previous = connection.transaction_mode
+    connection.transaction_mode = mode
+    try:
+        yield
+    finally:
+        connection.transaction_mode = previous
@@ -1,3 +1,1806 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.db.migrations.recorder import MigrationRecorder
+from django.http import HttpResponse
+from django.utils import timezone
+from django.template import engines
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import URLPattern, URLResolver, get_resolver, path
+
+from student.models import Student
+
+from . import analytics, checks, dbcopy, events, hashing, sqlite, writer
+from .admission import AdmissionQueue, get_queue, reset_queues
+from .backends import RoleAwareModelBackend
+from .decorators import ATOMIC, POLICIES, ReadOnlyViolation, admission_queue, atomic_view, query_budget, read_only_view
+from .middleware import QueryBudgetExceeded, WriteTransactionMiddleware
+from .counters import get_dashboard_stats, get_state, mark_all_seen, reconcile_dashboard_stats, reconcile_unread_counters
+from .models import Role
+from .session_store import REFRESHED_KEY, SessionStore
+
+
+def _n_queries_view(request, n):
+    for _ in range(n):
+        Role.objects.filter(role_name='Student').exists()
+    return HttpResponse('ok')
+
+
+@query_budget(3)
+def _budgeted_view(request, n):
+    return _n_queries_view(request, n)
+
+
+urlpatterns = [
+    path('unbudgeted/<int:n>/', _n_queries_view, name='unbudgeted'),
+    path('budgeted/<int:n>/', _budgeted_view, name='budgeted'),
+]
+
+
+@override_settings(
+    ROOT_URLCONF='core.tests',
+    QUERY_BUDGET_ENABLED=True,
+    QUERY_BUDGET_STRICT=True,
+    QUERY_BUDGET_DEFAULT=None,
+    QUERY_BUDGETS={},
+)
+class QueryBudgetMiddlewareTests(TestCase):
+    def test_server_timing_reports_query_count(self):
+        response = self.client.get('/unbudgeted/2/')
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+        self.assertIn('app;dur=', response['Server-Timing'])
+
+    def test_decorated_budget_fails_in_strict_mode(self):
+        self.client.get('/budgeted/3/')
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get('/budgeted/4/')
+
+    @override_settings(QUERY_BUDGETS={'unbudgeted': 1})
+    def test_settings_budget_by_view_name(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get('/unbudgeted/2/')
+
+    @override_settings(QUERY_BUDGET_STRICT=False, QUERY_BUDGET_DUPLICATE_THRESHOLD=3)
+    def test_over_budget_and_repeated_queries_only_warn_when_not_strict(self):
+        with self.assertLogs('core.middleware', level='WARNING') as logs:
+            response = self.client.get('/budgeted/5/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any('Possible N+1' in line for line in logs.output))
+        self.assertTrue(any('budget 3' in line for line in logs.output))
+
+    @override_settings(QUERY_BUDGET_ENABLED=False)
+    def test_disabled_adds_no_header(self):
+        response = self.client.get('/unbudgeted/1/')
+        self.assertNotIn('Server-Timing', response)
+
+
+class MenuContextTests(TestCase):
+    def setUp(self):
+        from .models import User
+
+        role = Role.objects.create(role_name='Student')
+        self.user = User.objects.create_user(username='ctx', password='x', role=role)
+        self.factory = RequestFactory()
+
+    def _render(self, source):
+        request = self.factory.get('/dashboard/')
+        request.user = self.user
+        return engines['django'].from_string(source).render({}, request)
+
+    def test_menu_only_page_runs_no_queries(self):
+        self._render('{% for item in menu_items %}{{ item.title }}{% endfor %}')
+        with self.assertNumQueries(0):
+            html = self._render('{{ user_role }}{% for item in menu_items %}{{ item.title }}{% endfor %}')
+        self.assertIn('View Files', html)
+
+    def test_notifications_are_queried_when_used(self):
+        from .models import Notification
+
+        Notification.notify([self.user], 'Hello', 'World')
+        with self.assertNumQueries(2):
+            html = self._render('{{ unread_notification_count }}{% for n in notifications %}{{ n.title }}{% endfor %}')
+        self.assertEqual(html, '1Hello')
+
+
+def _project_views(patterns, prefix=''):
+    """``(route, callback)`` for every URL served by this project's own apps"""
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _project_views(pattern.url_patterns, prefix + str(pattern.pattern))
+        elif isinstance(pattern, URLPattern) and pattern.callback.__module__.split('.')[0] in ('core', 'teacher', 'student'):
+            yield prefix + str(pattern.pattern), pattern.callback
+
+
+class TransactionPolicyTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_every_view_declares_a_policy(self):
+        undeclared = [
+            route for route, view in _project_views(get_resolver().url_patterns)
+            if getattr(view, 'transaction_policy', None) not in POLICIES
+        ]
+        self.assertEqual(undeclared, [])
+
+    def test_student_pages_hold_no_transaction_open(self):
+        # view_file streams and received_files renders; neither may pin a transaction
+        for pattern in get_resolver('student.urls').url_patterns:
+            self.assertNotEqual(pattern.callback.transaction_policy, ATOMIC, pattern.name)
+
+    @override_settings(TRANSACTION_POLICY_STRICT=True)
+    def test_read_only_view_cannot_write_in_strict_mode(self):
+        @read_only_view
+        def view(request):
+            Role.objects.create(role_name='Teacher')
+            return HttpResponse('ok')
+
+        with self.assertRaises(ReadOnlyViolation):
+            view(self.factory.get('/'))
+
+    def test_atomic_view_rolls_back_when_it_fails(self):
+        @atomic_view
+        def view(request):
+            Role.objects.create(role_name='Teacher')
+            raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            view(self.factory.post('/'))
+        self.assertFalse(Role.objects.filter(role_name='Teacher').exists())
+
+
+class _RecordingBroker:
+    """Stands in for a real broker; keeps what was published"""
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self, channels, event, data):
+        self.published.append((channels, event, data))
+
+
+class EventsTests(TestCase):
+    def setUp(self):
+        from teacher.models import Batch
+        from .models import User
+
+        self.roles = {name: Role.objects.create(role_name=name) for name in ('Teacher', 'Student')}
+        self.batch = Batch.objects.create(batch_code='EV1')
+        self.teacher = User.objects.create_user(username='ev-teacher', password='x', role=self.roles['Teacher'])
+        self.student_user = User.objects.create_user(
+            username='ev-student', password='x', role=self.roles['Student'], batch=self.batch,
+        )
+        Student.objects.create(user=self.student_user, student_code='EV1-001', name='Ev', batch=self.batch)
+        events._broker = None
+
+    def tearDown(self):
+        events._broker = None
+
+    def test_format_sse(self):
+        frame = events.format_sse({'id': 7, 'event': 'notification', 'data': {'title': 'Hi'}})
+        self.assertEqual(frame, 'id: 7\nevent: notification\ndata: {"title": "Hi"}\n\n')
+
+    def test_channels_for_student_include_their_batch(self):
+        from .models import User
+
+        student_user = User.objects.select_related('student').get(pk=self.student_user.pk)
+        self.assertEqual(events.channels_for(student_user), [f'user:{student_user.pk}', f'batch:{self.batch.pk}'])
+        self.assertEqual(events.channels_for(self.teacher), [f'user:{self.teacher.pk}'])
+
+    def test_local_broker_delivers_only_to_matching_channels(self):
+        async def scenario():
+            broker = events.LocalBroker()
+            mine = broker.subscribe(['user:1', 'batch:5'])
+            other = broker.subscribe(['user:2'])
+            broker.publish(['batch:5'], 'files', {'upload': 3})
+            message = await mine.get(timeout=1)
+            with self.assertRaises(asyncio.TimeoutError):
+                await other.get(timeout=0.05)
+            mine.close()
+            other.close()
+            return message, broker.subscriber_count()
+
+        message, remaining = asyncio.run(scenario())
+        self.assertEqual((message['event'], message['data']), ('files', {'upload': 3}))
+        self.assertEqual(remaining, 0)
+
+    def test_full_subscription_is_flagged_for_resync(self):
+        async def scenario():
+            broker = events.LocalBroker()
+            subscription = broker.subscribe(['user:1'])
+            for n in range(events.SUBSCRIPTION_QUEUE_SIZE + 1):
+                broker.publish(['user:1'], 'notification', {'n': n})
+            await asyncio.sleep(0)
+            return subscription.overflowed
+
+        self.assertTrue(asyncio.run(scenario()))
+
+    @override_settings(EVENTS_BROKER='core.tests._RecordingBroker')
+    def test_publish_waits_for_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            events.publish(['user:1'], 'notification', {'title': 'Hi'})
+        self.assertEqual(events.get_broker().published, [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(events.get_broker().published, [(['user:1'], 'notification', {'title': 'Hi'})])
+
+    @override_settings(EVENTS_ENABLED=True)
+    def test_stream_refuses_when_served_synchronously(self):
+        self.client.force_login(self.teacher)
+        response = self.client.get('/events/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(response.streaming)
+
+    def test_pages_open_a_stream_only_when_enabled(self):
+        self.client.force_login(self.teacher)
+        self.assertNotContains(self.client.get('/dashboard/'), 'new EventSource')
+        with override_settings(EVENTS_ENABLED=True):
+            self.assertContains(self.client.get('/dashboard/'), 'new EventSource')
+
+
+class BatchSummaryETagTests(TestCase):
+    def setUp(self):
+        from teacher.models import Batch
+        from .models import User
+
+        cache.clear()
+        self.batch = Batch.objects.create(batch_code='B1')
+        role = Role.objects.create(role_name='Admin')
+        self.client.force_login(User.objects.create_user(username='admin', password='x', role=role))
+
+    def test_unchanged_summary_revalidates_as_304(self):
+        response = self.client.get('/batch-summary/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self.client.get('/batch-summary/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_committed_change_issues_a_new_etag(self):
+        from .models import User
+
+        etag = self.client.get('/batch-summary/')['ETag']
+        role = Role.objects.create(role_name='Student')
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create_user(username='s1', password='x', role=role, batch=self.batch)
+            Student.objects.create(user=user, student_code='s1', name='s1', batch=self.batch)
+
+        response = self.client.get('/batch-summary/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['data'][0]['student_count'], 1)
+
+
+@override_settings(SESSION_ENGINE='core.session_store', SESSION_REFRESH_SECONDS=300)
+class SessionStoreTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        session = SessionStore()
+        session['user'] = 'ada'
+        session.save(must_create=True)
+        self.session_key = session.session_key
+        self.saved_at = session[REFRESHED_KEY]
+
+    def test_plain_read_writes_nothing(self):
+        session = SessionStore(self.session_key)
+        with self.assertNumQueries(0):
+            self.assertEqual(session['user'], 'ada')
+        self.assertFalse(session.modified)
+
+    def test_refresh_after_threshold(self):
+        session = SessionStore(self.session_key)
+        with mock.patch('core.session_store.time.time', return_value=self.saved_at + 300):
+            self.assertEqual(session['user'], 'ada')
+            self.assertTrue(session.modified)
+            session.save()
+        self.assertEqual(SessionStore(self.session_key)[REFRESHED_KEY], self.saved_at + 300)
+
+    def test_just_before_threshold_writes_nothing(self):
+        session = SessionStore(self.session_key)
+        with mock.patch('core.session_store.time.time', return_value=self.saved_at + 299):
+            session.load()
+        self.assertFalse(session.modified)
+
+    def test_new_session_is_not_marked_for_refresh(self):
+        session = SessionStore()
+        session.load()
+        self.assertFalse(session.modified)
+
+    def test_deploy_check_rejects_a_process_local_cache(self):
+        local = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://x'}}
+        with self.settings(CACHES=local):
+            self.assertEqual([e.id for e in checks.check_session_cache(None)], ['core.E001'])
+        with self.settings(CACHES=shared):
+            self.assertEqual(checks.check_session_cache(None), [])
+        with self.settings(CACHES=local, SESSION_ENGINE='django.contrib.sessions.backends.db'):
+            self.assertEqual(checks.check_session_cache(None), [])
+
+
+class NotificationCursorTests(TestCase):
+    def setUp(self):
+        from .models import User
+
+        role = Role.objects.create(role_name='Student')
+        self.user = User.objects.create_user(username='reader', password='x', role=role)
+        start = timezone.now() - timezone.timedelta(hours=1)
+        self.bodies = []
+        for minutes in (0, 10, 20):
+            body = self._notify(start + timezone.timedelta(minutes=minutes))
+            self.bodies.append(body)
+
+    def _notify(self, created_at):
+        from .models import Notification
+
+        body = Notification.notify([self.user], 'Hello', 'World')
+        Notification.objects.filter(body=body).update(created_at=created_at)
+        return body
+
+    def _created_at(self, body):
+        return body.recipients.get().created_at
+
+    def test_counter_follows_new_notifications(self):
+        self.assertEqual(get_state(self.user).unread_count, 3)
+        self.assertEqual(reconcile_unread_counters(), 0)
+
+    def test_cursor_moves_to_newest_notification_not_now(self):
+        cursor = mark_all_seen(self.user)
+        self.assertEqual(cursor, self._created_at(self.bodies[-1]))
+        state = get_state(self.user)
+        self.assertEqual((state.last_seen_at, state.unread_count), (cursor, 0))
+
+    def test_only_what_was_shown_is_marked_seen(self):
+        shown = [body.id for body in self.bodies[:2]]
+        cursor = mark_all_seen(self.user, shown)
+        self.assertEqual(cursor, self._created_at(self.bodies[1]))
+        self.assertEqual(get_state(self.user).unread_count, 1)
+        self.assertEqual(reconcile_unread_counters(), 0)
+
+    def test_late_commit_after_the_newest_shown_stays_unread(self):
+        # Created (timestamped) just after the newest shown row, committed after the page was drawn
+        self._notify(self._created_at(self.bodies[-1]) + timezone.timedelta(microseconds=1))
+        mark_all_seen(self.user, [body.id for body in self.bodies])
+        self.assertEqual(get_state(self.user).unread_count, 1)
+        self.assertEqual(reconcile_unread_counters(), 0)
+
+    def test_cursor_never_moves_back(self):
+        newest = mark_all_seen(self.user)
+        mark_all_seen(self.user, [self.bodies[0].id])
+        state = get_state(self.user)
+        self.assertEqual((state.last_seen_at, state.unread_count), (newest, 0))
+
+    def test_nothing_shown_changes_nothing(self):
+        self.assertIsNone(mark_all_seen(self.user, []))
+        self.assertIsNone(get_state(self.user).last_seen_at)
+        self.assertEqual(get_state(self.user).unread_count, 3)
+
+    def test_view_marks_the_posted_bodies(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            '/mark-notifications-read/', {'body_ids': [self.bodies[0].id]}, content_type='application/json',
+        )
+        self.assertEqual(response.json()['unread_count'], 2)
+        self.assertEqual(get_state(self.user).last_seen_at, self._created_at(self.bodies[0]))
+
+
+def _create_schema(alias):
+    """Tables for every model plus the default database's migration history, without running migrations"""
+    with connections[alias].schema_editor() as editor:
+        for model in dbcopy.copyable_models():
+            if not model._meta.auto_created:
+                editor.create_model(model)
+    recorder = MigrationRecorder(connections[alias])
+    recorder.ensure_schema()
+    for app, name in MigrationRecorder(connections['default']).applied_migrations():
+        recorder.record_applied(app, name)
+
+
+def _fill(alias):
+    """A few related rows, written without signals so only ``alias`` changes"""
+    from teacher.models import Batch, Upload
+    from .models import Notification, NotificationBody, User
+
+    [role] = Role.objects.using(alias).bulk_create([Role(role_name='Student')])
+    [batch] = Batch.objects.using(alias).bulk_create([Batch(batch_code='B1', student_count=3)])
+    users = User.objects.using(alias).bulk_create([
+        User(username=f'u{n}', password='!', first_name='Zoë', role=role, batch=batch) for n in range(3)
+    ])
+    students = Student.objects.using(alias).bulk_create([
+        Student(user=user, student_code=user.username, name=user.first_name, batch=batch) for user in users
+    ])
+    [upload] = Upload.objects.using(alias).bulk_create([
+        Upload(topic='Cells', subject='Biology', file='uploads/c.pdf', batch=batch),
+    ])
+    Upload.shared_with.through.objects.using(alias).bulk_create([
+        Upload.shared_with.through(upload=upload, student=student) for student in students[:2]
+    ])
+    [body] = NotificationBody.objects.using(alias).bulk_create([
+        NotificationBody(title='New', message='x', upload=upload, items=[{'topic': 'Cells', 'upload_id': upload.id}]),
+    ])
+    Notification.objects.using(alias).bulk_create([Notification(user=user, body=body) for user in users])
+
+
+def _sqlite_alias(test, path, alias):
+    """Register the SQLite file ``path`` as ``alias`` for the rest of ``test``"""
+    dbcopy.register_source(path, alias)
+    # Connected up front: TestCase only lets its declared databases connect
+    # lazily, and these files live outside the test transaction
+    connections[alias].connect()
+
+    def forget():
+        connections[alias].close()
+        del connections[alias]
+        del connections.settings[alias]
+    test.addCleanup(forget)
+    return alias
+
+
+class DbCopyTestMixin:
+    """Copies a freshly filled SQLite file into ``self.target``"""
+    target = None
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.source = self._sqlite_alias('copy_source')
+        _create_schema(self.source)
+        _fill(self.source)
+
+    def _sqlite_alias(self, alias):
+        return _sqlite_alias(self, os.path.join(self.tmp, f'{alias}.sqlite3'), alias)
+
+    def _copy(self):
+        messages = []
+        copied = dbcopy.copy_database(self.source, self.target, batch_size=2, log=messages.append)
+        self.assertIn('core.User: 3 rows', messages)
+        return copied
+
+    def test_copy_then_verify(self):
+        copied = self._copy()
+        self.assertEqual(copied['core.User'], 3)
+        self.assertEqual(copied['teacher.Upload_shared_with'], 2)
+        results = dbcopy.verify(self.source, self.target, batch_size=2)
+        self.assertEqual([label for label, _, _, matches in results if not matches], [])
+        self.assertEqual({label: n for label, n, _, _ in results}, {label: n for label, _, n, _ in results})
+
+    def test_copy_replaces_existing_rows(self):
+        self._copy()
+        Role.objects.using(self.target).create(role_name='Stray')
+        self._copy()
+        self.assertFalse(Role.objects.using(self.target).filter(role_name='Stray').exists())
+
+    def test_sequences_continue_after_copied_ids(self):
+        from teacher.models import Batch
+
+        self._copy()
+        copied = set(Role.objects.using(self.target).values_list('id', flat=True))
+        role = Role.objects.using(self.target).create(role_name='Teacher')
+        self.assertGreater(role.id, max(copied))
+        batch = Batch.objects.using(self.target).create(batch_code='B2')
+        self.assertGreater(batch.id, Batch.objects.using(self.source).get().id)
+
+    def test_verify_detects_changed_and_missing_rows(self):
+        from .models import User
+
+        self._copy()
+        User.objects.using(self.target).filter(username='u0').update(first_name='Zoe')
+        Student.objects.using(self.target).filter(student_code='u1').delete()
+        results = {label: (source, target, matches) for label, source, target, matches in dbcopy.verify(self.source, self.target)}
+        self.assertEqual(results['core.User'], (3, 3, False))
+        self.assertEqual(results['student.Student'], (3, 2, False))
+        self.assertTrue(results['core.Role'][2])
+
+    def test_checksum_ignores_row_order_but_not_values(self):
+        from .models import User
+
+        before = dbcopy.table_checksum(User, self.source)
+        self.assertEqual(dbcopy.table_checksum(User, self.source, batch_size=1), before)
+        User.objects.using(self.source).filter(username='u2').update(is_active=False)
+        self.assertNotEqual(dbcopy.table_checksum(User, self.source), before)
+        self.assertEqual(dbcopy.table_checksum(User, self.source)[0], 3)
+
+    def _drop_notification_table(self, alias):
+        from .models import Notification
+
+        with connections[alias].schema_editor() as editor:
+            editor.delete_model(Notification)
+
+    def test_schema_differences_are_refused(self):
+        dbcopy.check_migrations(self.source, self.target)
+        MigrationRecorder(connections[self.source]).record_unapplied('core', '0013_user_sessions')
+        with self.assertRaisesMessage(dbcopy.CopyError, 'core.0013_user_sessions'):
+            dbcopy.check_migrations(self.source, self.target)
+        self._drop_notification_table(self.source)
+        with self.assertRaisesMessage(dbcopy.CopyError, 'core_notification'):
+            dbcopy.copy_database(self.source, self.target)
+
+
+class SQLiteDbCopyTests(DbCopyTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.target = self._sqlite_alias('copy_target')
+        _create_schema(self.target)
+
+
+@unittest.skipUnless(os.environ.get('POSTGRES_DB'), "Set POSTGRES_DB to copy into PostgreSQL")
+class PostgresDbCopyTests(DbCopyTestMixin, TestCase):
+    target = 'default'
+
+    def test_schema_differences_are_refused(self):
+        # The target is the migrated test database; only the source is changed
+        self._drop_notification_table(self.source)
+        with self.assertRaisesMessage(dbcopy.CopyError, 'core_notification'):
+            dbcopy.copy_database(self.source, self.target)
+
+
+class _BrokenPool:
+    def __init__(self):
+        self.shut_down = False
+
+    def submit(self, func, *args):
+        raise hashing.BrokenProcessPool("A worker died")
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+class HashingPoolTests(TestCase):
+    def setUp(self):
+        self.addCleanup(hashing._executors.clear)
+
+    def test_sign_in_has_its_own_pool(self):
+        bulk = hashing.get_executor(hashing.BULK_POOL)
+        sign_in = hashing.get_executor(hashing.SIGN_IN_POOL)
+        self.addCleanup(bulk.shutdown)
+        self.addCleanup(sign_in.shutdown)
+        self.assertIsNot(bulk, sign_in)
+        self.assertIs(hashing.get_executor(hashing.SIGN_IN_POOL), sign_in)
+
+    def test_workers_are_not_forked_from_the_server(self):
+        executor = hashing.get_executor(hashing.SIGN_IN_POOL)
+        self.addCleanup(executor.shutdown)
+        self.assertIn(executor._mp_context.get_start_method(), ('forkserver', 'spawn'))
+        # A fresh interpreter configures Django itself before hashing
+        [encoded] = executor.submit(hashing._hash_chunk, ['secret']).result(timeout=60)
+        self.assertTrue(hashing.check_password('secret', encoded))
+
+    def test_broken_pool_is_replaced_and_checked_inline(self):
+        encoded = hashing._hash_chunk(['secret'])[0]
+        for password, expected in (('secret', True), ('wrong', False)):
+            broken = hashing._executors[hashing.SIGN_IN_POOL] = _BrokenPool()
+            self.assertIs(hashing.verify_password(password, encoded), expected)
+            self.assertTrue(broken.shut_down)
+            self.assertNotIn(hashing.SIGN_IN_POOL, hashing._executors)
+
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        from teacher.models import Batch
+        from .models import User
+
+        self.roles = {name: Role.objects.create(role_name=name) for name in ('Admin', 'Teacher', 'Student')}
+        self.teacher = User.objects.create_user(username='t', password='x', role=self.roles['Teacher'])
+        self.batch = Batch.objects.create(batch_code='B1', branch='CSE')
+        self.long_ago = timezone.now() - timezone.timedelta(days=2)
+
+    def _upload(self, subject, uploaded_at=None):
+        from teacher.models import Upload
+
+        upload = Upload.objects.create(
+            topic='T', subject=subject, file='uploads/t.pdf', teacher=self.teacher, batch=self.batch,
+        )
+        if uploaded_at is not None:
+            Upload.objects.filter(pk=upload.pk).update(uploaded_at=uploaded_at)
+        return upload
+
+    def test_uploads_are_rolled_up_once(self):
+        self._upload('Maths', self.long_ago)
+        self._upload('Maths', self.long_ago)
+        self._upload('Physics', self.long_ago)
+        self.assertEqual(analytics.rollup_uploads(batch_size=2), 3)
+        self.assertEqual(analytics.rollup_uploads(), 0)
+        series = analytics.upload_series('subject', 'day', days=7)
+        day = timezone.localdate(self.long_ago).isoformat()
+        self.assertEqual(series, [
+            {'period': day, 'key': 'Maths', 'count': 2},
+            {'period': day, 'key': 'Physics', 'count': 1},
+        ])
+        self.assertEqual(analytics.upload_series('branch', 'week', days=7)[0]['count'], 3)
+
+    def test_unsettled_upload_holds_back_later_ids(self):
+        from .models import RollupWatermark
+
+        first = self._upload('Maths', self.long_ago)
+        recent = self._upload('Maths')
+        self._upload('Maths', self.long_ago)
+        self.assertEqual(analytics.rollup_uploads(), 1)
+        self.assertEqual(RollupWatermark.objects.get(name=analytics.UPLOADS_WATERMARK).last_id, first.id)
+
+        type(recent).objects.filter(pk=recent.pk).update(uploaded_at=self.long_ago)
+        self.assertEqual(analytics.rollup_uploads(), 2)
+
+    def test_student_sign_ins_are_recorded_once_per_day(self):
+        from .models import DailyActiveStudent, User
+
+        for n, role in enumerate(('Student', 'Student', 'Teacher')):
+            user = User.objects.create_user(username=f'u{n}', password='x', role=self.roles[role], batch=self.batch)
+            User.objects.filter(pk=user.pk).update(last_login=self.long_ago)
+        just_now = User.objects.create_user(username='late', password='x', role=self.roles['Student'])
+        User.objects.filter(pk=just_now.pk).update(last_login=timezone.now())
+
+        self.assertEqual(analytics.rollup_logins(), 2)
+        self.assertEqual(analytics.rollup_logins(), 0)
+        self.assertEqual(DailyActiveStudent.objects.count(), 2)
+        self.assertEqual(analytics.active_student_series('day', days=7), [
+            {'period': timezone.localdate(self.long_ago).isoformat(), 'key': 'B1', 'count': 2},
+        ])
+
+    def test_chart_endpoints(self):
+        from .models import User
+
+        self._upload('Maths', self.long_ago)
+        analytics.run_rollups()
+        self.client.force_login(User.objects.create_user(username='a', password='x', role=self.roles['Admin']))
+
+        response = self.client.get('/analytics/uploads/', {'group': 'teacher', 'period': 'day', 'days': 7})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data'][0]['key'], 't')
+        self.assertEqual(self.client.get('/analytics/active-students/').json()['data'], [])
+        self.assertEqual(self.client.get('/analytics/uploads/', {'group': 'colour'}).status_code, 400)
+        self.assertEqual(self.client.get('/analytics/uploads/', {'days': 'many'}).status_code, 400)
+
+        self.client.force_login(self.teacher)
+        self.assertEqual(self.client.get('/analytics/uploads/').status_code, 403)
+        self.assertEqual(self.client.get('/analytics/active-students/').status_code, 403)
+
+
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        self.roles = {name: Role.objects.create(role_name=name) for name in ('Admin', 'Teacher', 'Student')}
+
+    def _user(self, username, role):
+        from .models import User
+
+        return User.objects.create_user(username=username, password='x', role=self.roles[role])
+
+    def _totals(self):
+        stats = get_dashboard_stats()
+        return stats.total_teachers, stats.total_students, stats.total_batches, stats.total_sent_files
+
+    def test_new_users_are_counted_by_role(self):
+        self._user('t1', 'Teacher')
+        self._user('s1', 'Student')
+        self._user('s2', 'Student')
+        self._user('a1', 'Admin')
+        self.assertEqual(self._totals(), (1, 2, 0, 0))
+        self.assertEqual(reconcile_dashboard_stats(), 0)
+
+    def test_role_changes_move_the_count(self):
+        from .models import User
+
+        self._user('u1', 'Student')
+        user = User.objects.get(username='u1')
+        user.role = self.roles['Teacher']
+        user.save()
+        self.assertEqual(self._totals()[:2], (1, 0))
+        # Saving again without a change counts nothing twice
+        user.save()
+        self.assertEqual(self._totals()[:2], (1, 0))
+        user.role = self.roles['Admin']
+        user.save()
+        self.assertEqual(self._totals()[:2], (0, 0))
+        self.assertEqual(reconcile_dashboard_stats(), 0)
+
+    def test_deletes_are_counted(self):
+        from .models import User
+
+        self._user('t1', 'Teacher')
+        self._user('s1', 'Student')
+        self._user('s2', 'Student')
+        User.objects.get(username='t1').delete()
+        User.objects.filter(username='s1').delete()
+        self.assertEqual(self._totals()[:2], (0, 1))
+
+    def test_batches_and_uploads_are_counted(self):
+        from teacher.models import Batch, Upload
+
+        batch = Batch.objects.create(batch_code='B1')
+        upload = Upload.objects.create(topic='T', subject='Maths', file='uploads/t.pdf', batch=batch)
+        self.assertEqual(self._totals()[2:], (1, 1))
+        upload.delete()
+        batch.delete()
+        self.assertEqual(self._totals()[2:], (0, 0))
+
+    def test_reconcile_fixes_drift(self):
+        from .models import DashboardStats
+
+        self._user('t1', 'Teacher')
+        DashboardStats.objects.filter(pk=1).update(total_teachers=5, total_students=3)
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('Dashboard totals: corrected', out.getvalue())
+        self.assertEqual(self._totals(), (1, 0, 0, 0))
+        self.assertEqual(reconcile_dashboard_stats(), 0)
+
+    def test_reconcile_creates_a_missing_row(self):
+        from .models import DashboardStats
+
+        self._user('s1', 'Student')
+        DashboardStats.objects.all().delete()
+        self.assertEqual(self._totals(), (0, 0, 0, 0))
+        self.assertEqual(reconcile_dashboard_stats(), 1)
+        self.assertEqual(self._totals(), (0, 1, 0, 0))
+
+
+def _student_sheet(rows, headers=('Enrollment Number', 'Student Name', 'Batch Code', 'Class', 'Academic Year', 'Branch')):
+    import io
+
+    import openpyxl
+    from django.core.files.uploadedfile import SimpleUploadedFile
+
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(list(headers))
+    for row in rows:
+        sheet.append(list(row))
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return SimpleUploadedFile('students.xlsx', buffer.getvalue())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BulkUploadStudentsTests(TestCase):
+    def setUp(self):
+        from teacher.models import Batch
+        from .models import User
+
+        roles = {name: Role.objects.create(role_name=name) for name in ('Admin', 'Student')}
+        self.student_role = roles['Student']
+        self.batch = Batch.objects.create(batch_code='B1', class_name='10', academic_year='2024-2025', branch='Old')
+        existing = User.objects.create_user(
+            username='annasmith', password='x', first_name='Anna', last_name='Smith', role=roles['Student'], batch=self.batch,
+        )
+        Student.objects.create(user=existing, student_code='E1', name='Anna Smith', batch=self.batch)
+        self.client.force_login(User.objects.create_user(username='admin', password='x', role=roles['Admin']))
+
+    def _post(self, rows, **kwargs):
+        return self.client.post('/bulk_upload_students/', {'excel_file': _student_sheet(rows, **kwargs)})
+
+    def test_duplicate_enrollment_numbers_are_rejected(self):
+        response = self._post([
+            ('E1', 'Old Hand', 'B1', '10', '2024-2025', 'Old'),
+            ('E2', 'Ben Ode', 'B1', '10', '2024-2025', 'Old'),
+            ('E2', 'Ben Again', 'B1', '10', '2024-2025', 'Old'),
+        ]).json()
+        self.assertEqual((response['status'], response['successful'], response['failed']), ('partial_success', 1, 2))
+        self.assertIn('Row 2: Old Hand - Enrollment number E1 already exists', response['errors'])
+        self.assertIn('Row 4: Ben Again - Enrollment number E2 already exists', response['errors'])
+        self.assertEqual(Student.objects.get(student_code='E2').name, 'Ben Ode')
+
+    def test_usernames_are_numbered_when_taken(self):
+        from django.contrib.auth.hashers import check_password
+
+        response = self._post([
+            ('E2', 'Anna Smith', 'B1', '10', '2024-2025', 'Old'),
+            ('E3', 'Anna Smith', 'B1', '10', '2024-2025', 'Old'),
+            ('E4', 'Cher', 'B1', '10', '2024-2025', 'Old'),
+        ]).json()
+        self.assertEqual(response['successful'], 3)
+        users = {student.student_code: student.user for student in Student.objects.select_related('user')}
+        self.assertEqual(
+            [users[code].username for code in ('E2', 'E3', 'E4')], ['annasmith1', 'annasmith2', 'cher'],
+        )
+        self.assertEqual((users['E4'].first_name, users['E4'].last_name), ('Cher', ''))
+        self.assertEqual(users['E2'].role, self.student_role)
+        self.assertTrue(check_password('E2', users['E2'].password))
+
+    def test_counters_and_batches_follow_the_import(self):
+        from teacher.models import Batch
+        from .counters import reconcile_dashboard_stats
+        from teacher.counters import reconcile_batch_counters
+
+        before = get_dashboard_stats().total_students
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self._post([
+                ('E2', 'Ben Ode', 'B1', '11', '2025-2026', 'New'),
+                ('E3', 'Cy Ode', 'B2', '9', '2025-2026', 'New'),
+                ('E4', 'Di Ode', 'B2', '9', '2025-2026', 'New'),
+            ]).json()
+        self.assertEqual(response['status'], 'success')
+        batches = {batch.batch_code: batch for batch in Batch.objects.all()}
+        self.assertEqual((batches['B1'].student_count, batches['B2'].student_count), (2, 2))
+        self.assertEqual((batches['B1'].class_name, batches['B1'].branch), ('11', 'New'))
+        self.assertEqual(get_dashboard_stats().total_students, before + 3)
+        self.assertEqual((reconcile_batch_counters(), reconcile_dashboard_stats()), (0, 0))
+
+    def test_missing_columns_and_non_admins_are_refused(self):
+        from .models import User
+
+        response = self._post([('E2', 'Ben Ode')], headers=('Enrollment Number', 'Student Name'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Batch Code', response.json()['message'])
+
+        self.client.force_login(User.objects.get(username='annasmith'))
+        response = self._post([('E2', 'Ben Ode', 'B1', '10', '2024-2025', 'Old')])
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Student.objects.filter(student_code='E2').exists())
+
+
+class SQLitePragmaTests(TransactionTestCase):
+    """Some pragmas cannot change inside TestCase's wrapping transaction"""
+
+    def test_unknown_and_malformed_pragmas_are_refused(self):
+        for pragmas in (
+            {'key': 'secret'},
+            {'synchronous = OFF; --': 'NORMAL'},
+            {'journal_mode': 'WAL; DROP TABLE core_role'},
+            {'synchronous': 'SOMETIMES'},
+            {'busy_timeout': '1; ATTACH DATABASE'},
+            {'busy_timeout': -1},
+            {'cache_size': '64 MB'},
+        ):
+            with self.subTest(pragmas=pragmas), self.assertRaises(ImproperlyConfigured):
+                sqlite.validate_pragmas(pragmas)
+
+    def test_values_are_normalised(self):
+        self.assertEqual(
+            sqlite.validate_pragmas({'journal_mode': 'wal', 'cache_size': -2000, 'busy_timeout': 10}),
+            {'journal_mode': 'WAL', 'cache_size': '-2000', 'busy_timeout': '10'},
+        )
+
+    def test_applied_values_are_read_back(self):
+        self.addCleanup(sqlite.apply_pragmas, connection)
+        applied = sqlite.apply_pragmas(connection, {
+            'synchronous': 'full', 'busy_timeout': 1234, 'cache_size': -2000, 'temp_store': 'FILE',
+        })
+        # SQLite reports enumerations as numbers
+        self.assertEqual(applied, {'synchronous': 2, 'busy_timeout': 1234, 'cache_size': -2000, 'temp_store': 1})
+
+    def test_new_connections_get_the_profile(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], int(sqlite.configured_pragmas()['busy_timeout']))
+
+
+class WriteTransactionModeTests(TransactionTestCase):
+    """Outside TestCase's wrapping transaction, so the view's own BEGIN is visible"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def _begins(self, method):
+        statements = []
+        modes = []
+
+        def record(execute, sql, params, many, context):
+            if sql.startswith('BEGIN'):
+                statements.append(sql)
+            return execute(sql, params, many, context)
+
+        def view(request):
+            modes.append(connection.transaction_mode)
+            with transaction.atomic():
+                Role.objects.filter(role_name='Student').exists()
+            return HttpResponse('ok')
+
+        middleware = WriteTransactionMiddleware(view)
+        with connection.execute_wrapper(record):
+            middleware(getattr(self.factory, method)('/'))
+        return statements, modes
+
+    def test_unsafe_methods_begin_immediate_and_restore_the_mode(self):
+        previous = connection.transaction_mode
+        for method in ('post', 'put', 'delete'):
+            with self.subTest(method=method):
+                statements, modes = self._begins(method)
+                self.assertEqual(statements, ['BEGIN IMMEDIATE'])
+                self.assertEqual(modes, [sqlite.WRITE_TRANSACTION_MODE])
+                self.assertEqual(connection.transaction_mode, previous)
+
+    def test_safe_methods_stay_deferred(self):
+        statements, modes = self._begins('get')
+        self.assertEqual(statements, ['BEGIN'])
+        self.assertEqual(modes, [connection.transaction_mode])
+
+    def test_mode_is_restored_when_the_view_fails(self):
+        previous = connection.transaction_mode
+
+        def view(request):
+            raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            WriteTransactionMiddleware(view)(self.factory.post('/'))
+        self.assertEqual(connection.transaction_mode, previous)
+
+
+def _wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for the other threads")
+        time.sleep(0.005)
+
+
+class _SlotHolder(threading.Thread):
+    """Holds ``scheduler``'s write slot until ``release`` is set"""
+
+    def __init__(self, scheduler):
+        super().__init__(daemon=True)
+        self.scheduler = scheduler
+        self.holding = threading.Event()
+        self.release = threading.Event()
+
+    def run(self):
+        with self.scheduler.slot():
+            self.holding.set()
+            self.release.wait(5)
+
+    def __enter__(self):
+        self.start()
+        self.holding.wait(5)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release.set()
+        self.join(5)
+
+
+class WriteSchedulerTests(TestCase):
+    def setUp(self):
+        self.scheduler = writer.WriteScheduler(max_waiting=10, max_wait=5)
+        writer.reset_scheduler()
+        self.addCleanup(writer.reset_scheduler)
+
+    def test_waiters_are_admitted_in_arrival_order(self):
+        admitted = []
+
+        def write(n):
+            with self.scheduler.slot():
+                admitted.append(n)
+
+        with _SlotHolder(self.scheduler):
+            threads = []
+            for n in range(5):
+                thread = threading.Thread(target=write, args=(n,), daemon=True)
+                thread.start()
+                threads.append(thread)
+                # Start the next writer only once this one is queued
+                _wait_until(lambda: self.scheduler.waiting() == n + 1)
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(admitted, [0, 1, 2, 3, 4])
+        self.assertEqual(self.scheduler._queue.active, 0)
+
+    def test_nested_slots_do_not_wait_for_themselves(self):
+        finished = threading.Event()
+
+        def write():
+            with self.scheduler.slot(max_wait=0.1), self.scheduler.slot(max_wait=0.1):
+                self.assertTrue(self.scheduler.holding())
+            self.assertFalse(self.scheduler.holding())
+            finished.set()
+
+        thread = threading.Thread(target=write, daemon=True)
+        thread.start()
+        thread.join(5)
+        self.assertTrue(finished.is_set())
+        self.assertEqual(self.scheduler._queue.active, 0)
+
+    def test_nested_write_transactions(self):
+        with writer.write_transaction(max_wait=0.1):
+            Role.objects.create(role_name='Teacher')
+            with writer.write_transaction(max_wait=0.1):
+                Role.objects.create(role_name='Admin')
+        self.assertFalse(writer.get_scheduler().holding())
+        self.assertEqual(writer.get_scheduler()._queue.active, 0)
+        self.assertEqual(Role.objects.filter(role_name__in=['Teacher', 'Admin']).count(), 2)
+
+    def test_timed_out_waiter_leaves_the_queue_with_a_retry_after(self):
+        with _SlotHolder(self.scheduler):
+            with self.assertRaises(writer.WriterBusy) as raised:
+                with self.scheduler.slot(max_wait=0.05):
+                    self.fail("Admitted while the slot was held")
+            self.assertGreaterEqual(raised.exception.retry_after, 1)
+            self.assertEqual(self.scheduler.waiting(), 0)
+        # The holder's release found nobody waiting and freed the slot
+        self.assertEqual(self.scheduler._queue.active, 0)
+        with self.scheduler.slot(max_wait=0.05):
+            pass
+
+    def test_full_queue_is_turned_away_at_once(self):
+        scheduler = writer.WriteScheduler(max_waiting=1, max_wait=5)
+        with _SlotHolder(scheduler):
+            def wait():
+                with scheduler.slot():
+                    pass
+
+            waiter = threading.Thread(target=wait, daemon=True)
+            waiter.start()
+            _wait_until(lambda: scheduler.waiting() == 1)
+            started = time.monotonic()
+            with self.assertRaises(writer.WriterBusy):
+                with scheduler.slot():
+                    pass
+            self.assertLess(time.monotonic() - started, 1)
+
+    @override_settings(WRITE_QUEUE={'max_wait': 0.05})
+    def test_atomic_view_answers_503_when_the_slot_is_busy(self):
+        @atomic_view
+        def view(request):
+            Role.objects.create(role_name='Teacher')
+            return HttpResponse('ok')
+
+        with _SlotHolder(writer.get_scheduler()):
+            response = view(RequestFactory().post('/'))
+        self.assertEqual(response.status_code, 503)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertFalse(Role.objects.filter(role_name='Teacher').exists())
+
+    def test_release_without_waiters_frees_the_slot(self):
+        queue = AdmissionQueue(slots=2, max_waiting=10, max_wait=1)
+        self.assertIsNone(queue.acquire())
+        self.assertIsNone(queue.acquire())
+        self.assertEqual(queue.active, 2)
+        queue.release(0.01)
+        self.assertEqual(queue.active, 1)
+        queue.release(0.01)
+        self.assertEqual(queue.active, 0)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], PASSWORD_HASHING_OFFLOAD=False)
+class CredentialViewTests(TestCase):
+    """Passwords are hashed before the write slot is taken, and only the writes hold it"""
+
+    def setUp(self):
+        from teacher.models import Batch
+        from .models import User
+
+        roles = {name: Role.objects.create(role_name=name) for name in ('Admin', 'Student')}
+        self.batch = Batch.objects.create(batch_code='B1')
+        self.admin = User.objects.create_user(username='admin', password='x', role=roles['Admin'])
+        self.student_role = roles['Student']
+        writer.reset_scheduler()
+        self.addCleanup(writer.reset_scheduler)
+
+        self.held_while_hashing = []
+
+        def hash_password(password):
+            self.held_while_hashing.append(writer.get_scheduler().holding())
+            return hashing.hash_password(password)
+
+        patcher = mock.patch('core.views.hash_password', side_effect=hash_password)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _student(self):
+        from .models import User
+
+        user = User.objects.create_user(username='ben', password='old', role=self.student_role, batch=self.batch)
+        return Student.objects.create(user=user, student_code='E1', name='Ben Ode', batch=self.batch)
+
+    def _password_is(self, username, password):
+        from .models import User
+
+        return User.objects.get(username=username).check_password(password)
+
+    def test_add_individual_student(self):
+        self.client.force_login(self.admin)
+        self.client.post('/add_individual_student/', {'enrollment': 'E9', 'batch_code': 'B1', 'student_name': 'Cy Rus'})
+        self.assertTrue(self._password_is('cyrus', 'E9'))
+        self.assertEqual(Student.objects.get(student_code='E9').user.username, 'cyrus')
+        self.assertEqual(self.held_while_hashing, [False])
+
+    def test_signup(self):
+        self.client.post('/signup/', {
+            'firstName': 'Dee', 'lastName': 'Ray', 'username': 'dee', 'batchCode': 'B1',
+            'role': self.student_role.id, 'password': 'pw', 'confirmPassword': 'pw',
+        })
+        self.assertTrue(self._password_is('dee', 'pw'))
+        self.assertTrue(Student.objects.filter(user__username='dee', batch=self.batch).exists())
+        self.assertEqual(self.held_while_hashing, [False])
+
+    def test_reset_password(self):
+        self._student()
+        session = self.client.session
+        session['reset_username'] = 'ben'
+        session.save()
+        response = self.client.post('/reset-password/', {'new_password': 'new', 'confirm_password': 'new'})
+        self.assertRedirects(response, '/', fetch_redirect_response=False)
+        self.assertTrue(self._password_is('ben', 'new'))
+        self.assertEqual(self.held_while_hashing, [False])
+
+    def test_update_student_credentials(self):
+        student = self._student()
+        self.client.force_login(self.admin)
+        response = self.client.post(
+            f'/update-student-credentials/{student.id}/', {'username': 'benny', 'password': 'new'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.json()['status'], 'success')
+        self.assertTrue(self._password_is('benny', 'new'))
+        self.assertEqual(self.held_while_hashing, [False])
+
+    @override_settings(WRITE_QUEUE={'max_wait': 0.05})
+    def test_busy_write_slot_answers_503_and_saves_nothing(self):
+        student = self._student()
+        self.client.force_login(self.admin)
+        with _SlotHolder(writer.get_scheduler()):
+            response = self.client.post(
+                f'/update-student-credentials/{student.id}/', {'username': 'ben', 'password': 'new'},
+                content_type='application/json', HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+            )
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.assertTrue(self._password_is('ben', 'old'))
+
+
+class AdmissionQueueTests(TestCase):
+    def setUp(self):
+        reset_queues()
+        self.addCleanup(reset_queues)
+
+    def test_waiters_are_admitted_in_arrival_order(self):
+        # One slot, so each request is admitted only once the one before has left
+        queue = AdmissionQueue(slots=1, max_waiting=10, max_wait=5)
+        admitted = []
+
+        def request(n):
+            self.assertIsNone(queue.acquire())
+            admitted.append(n)
+            queue.release(0.01)
+
+        self.assertIsNone(queue.acquire())
+        threads = []
+        for n in range(5):
+            thread = threading.Thread(target=request, args=(n,), daemon=True)
+            thread.start()
+            threads.append(thread)
+            _wait_until(lambda: queue.waiting() == n + 1)
+        queue.release(0.01)
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(admitted, [0, 1, 2, 3, 4])
+        self.assertEqual(queue.active, 0)
+
+    def test_full_queue_turns_requests_away_at_once(self):
+        queue = AdmissionQueue(slots=1, max_waiting=0, max_wait=5)
+        self.assertIsNone(queue.acquire())
+        started = time.monotonic()
+        self.assertGreaterEqual(queue.acquire(), 1)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_timed_out_request_leaves_the_queue(self):
+        queue = AdmissionQueue(slots=1, max_waiting=10, max_wait=0.05)
+        self.assertIsNone(queue.acquire())
+        self.assertGreaterEqual(queue.acquire(), 1)
+        self.assertEqual(queue.waiting(), 0)
+        queue.release(0.01)
+        self.assertEqual(queue.active, 0)
+
+    def test_retry_after_grows_with_the_queue_and_is_capped(self):
+        queue = AdmissionQueue(slots=2)
+        self.assertEqual(queue.retry_after(0), 1)
+        self.assertLess(queue.retry_after(3), queue.retry_after(10))
+        self.assertEqual(queue.retry_after(10_000), 60)
+
+    @override_settings(ADMISSION_QUEUES={'uploads': {'slots': 1, 'max_waiting': 0}})
+    def test_decorated_view_answers_503_with_retry_after(self):
+        @admission_queue('uploads', "Too many uploads right now.")
+        def view(request):
+            return HttpResponse('ok')
+
+        factory = RequestFactory()
+        queue = get_queue('uploads')
+        self.assertIsNone(queue.acquire())
+
+        response = view(factory.post('/upload/'))
+        self.assertEqual(response.status_code, 503)
+        retry_after = response['Retry-After']
+        self.assertIn('Too many uploads right now.', response.content.decode())
+        self.assertIn(f'content="{retry_after};url=/upload/"', response.content.decode())
+
+        response = view(factory.post('/upload/', HTTP_X_REQUESTED_WITH='XMLHttpRequest'))
+        self.assertEqual(response.status_code, 503)
+        data = json.loads(response.content)
+        self.assertEqual(data['retry_after'], int(response['Retry-After']))
+        self.assertTrue(data['message'].startswith('Too many uploads right now.'))
+
+        # Other methods are not queued
+        self.assertEqual(view(factory.get('/upload/')).status_code, 200)
+
+        queue.release(0.01)
+        self.assertEqual(view(factory.post('/upload/')).status_code, 200)
+        self.assertEqual(queue.active, 0)
+
+    def test_login_is_turned_away_with_its_own_reason(self):
+        queue = get_queue('login')
+        for _ in range(queue.slots):
+            queue.acquire()
+        queue.max_waiting = 0
+        response = self.client.post('/', {'username': 'ada', 'password': 'x'})
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Too many people are signing in right now.', response.content.decode())
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher', 'django.contrib.auth.hashers.PBKDF2PasswordHasher'],
+    PASSWORD_HASHING_OFFLOAD=False,
+)
+class AuthenticateTests(TestCase):
+    def setUp(self):
+        from .models import User
+
+        self.backend = RoleAwareModelBackend()
+        self.user = User.objects.create_user(username='ada', password='secret', role=Role.objects.create(role_name='Teacher'))
+
+    def _authenticate(self, username, password):
+        return self.backend.authenticate(None, username=username, password=password)
+
+    def test_right_and_wrong_passwords(self):
+        self.assertEqual(self._authenticate('ada', 'secret'), self.user)
+        self.assertIsNone(self._authenticate('ada', 'wrong'))
+        self.assertIsNone(self._authenticate('ada', None))
+
+    def test_unknown_user_is_checked_against_a_dummy_hash(self):
+        from . import backends
+
+        with mock.patch.object(backends, 'verify_password', wraps=hashing.verify_password) as verify:
+            self.assertIsNone(self._authenticate('nobody', 'secret'))
+        verify.assert_called_once_with('secret', backends._unknown_user_hash())
+
+    def test_inactive_user_is_refused(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(self._authenticate('ada', 'secret'))
+
+    def test_outdated_hash_is_replaced(self):
+        from django.contrib.auth.hashers import make_password
+
+        self.user.password = make_password('secret', hasher='pbkdf2_sha256')
+        self.user.save()
+        self.assertEqual(self._authenticate('ada', 'secret'), self.user)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('md5$'))
+        self.assertTrue(self.user.check_password('secret'))
+
+    def test_current_hash_is_left_alone(self):
+        before = self.user.password
+        self._authenticate('ada', 'secret')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.password, before)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class RetentionTests(TestCase):
+    def setUp(self):
+        from .models import User
+
+        role = Role.objects.create(role_name='Student')
+        self.ada = User.objects.create_user(username='ada', password='x', role=role)
+        self.ben = User.objects.create_user(username='ben', password='x', role=role)
+        self.now = timezone.now()
+
+    def _notify(self, users, days_ago, title='Hello'):
+        from .models import Notification, NotificationBody
+
+        body = Notification.notify(users, title, f'{title} world')
+        at = self.now - timezone.timedelta(days=days_ago)
+        Notification.objects.filter(body=body).update(created_at=at)
+        NotificationBody.objects.filter(pk=body.pk).update(created_at=at)
+        return body
+
+    def _remaining(self, user):
+        from .models import Notification
+
+        return set(Notification.objects.filter(user=user).values_list('body_id', flat=True))
+
+    def _prune(self, **kwargs):
+        from .retention import prune_notifications
+
+        return prune_notifications(pause=0, **kwargs)
+
+    def test_only_read_rows_past_retention_are_archived(self):
+        from .models import NotificationArchive, NotificationBody
+
+        old_read = self._notify([self.ada, self.ben], 100, 'Old')
+        old_unread = self._notify([self.ada], 92, 'Unread')
+        recent_read = self._notify([self.ben], 1, 'Recent')
+        mark_all_seen(self.ada, [old_read.id])
+        mark_all_seen(self.ben)
+
+        stats = self._prune(days=90, max_per_user=100)
+        self.assertEqual(stats, {'expired': 2, 'over_cap': 0, 'bodies': 1})
+        self.assertEqual(self._remaining(self.ada), {old_unread.id})
+        self.assertEqual(self._remaining(self.ben), {recent_read.id})
+        self.assertFalse(NotificationBody.objects.filter(pk=old_read.pk).exists())
+
+        archive = NotificationArchive.objects.get()
+        self.assertEqual(archive.body_id, old_read.id)
+        self.assertEqual((archive.title, archive.message), ('Old', 'Old world'))
+        self.assertEqual(archive.recipients, sorted([self.ada.id, self.ben.id]))
+        self.assertEqual((get_state(self.ada).unread_count, get_state(self.ben).unread_count), (1, 0))
+        self.assertEqual(reconcile_unread_counters(), 0)
+
+    def test_cap_keeps_each_users_newest_rows(self):
+        from .models import NotificationArchive
+
+        bodies = [self._notify([self.ada], days) for days in (5, 4, 3, 2, 1)]
+        self._notify([self.ben], 5)
+        stats = self._prune(days=90, max_per_user=2)
+        self.assertEqual(stats, {'expired': 0, 'over_cap': 3, 'bodies': 3})
+        self.assertEqual(self._remaining(self.ada), {bodies[3].id, bodies[4].id})
+        self.assertEqual(len(self._remaining(self.ben)), 1)
+        self.assertEqual(
+            sorted(NotificationArchive.objects.values_list('body_id', flat=True)),
+            [body.id for body in bodies[:3]],
+        )
+        # The capped rows were unread, so the counter drops with them
+        self.assertEqual(get_state(self.ada).unread_count, 2)
+        self.assertEqual(reconcile_unread_counters(), 0)
+
+    def test_archive_merges_recipients_pruned_in_different_runs(self):
+        from .models import NotificationArchive
+
+        body = self._notify([self.ada, self.ben], 100)
+        mark_all_seen(self.ada)
+        self._prune(days=90, max_per_user=100)
+        self.assertEqual(NotificationArchive.objects.get().recipients, [self.ada.id])
+        mark_all_seen(self.ben)
+        self._prune(days=90, max_per_user=100)
+        self.assertEqual(NotificationArchive.objects.get(body_id=body.id).recipients, sorted([self.ada.id, self.ben.id]))
+
+    def test_recent_bodies_without_recipients_are_kept(self):
+        from .models import NotificationBody
+
+        fresh = NotificationBody.objects.create(title='Being sent', message='...')
+        old = NotificationBody.objects.create(title='Abandoned', message='...')
+        NotificationBody.objects.filter(pk=old.pk).update(created_at=self.now - timezone.timedelta(days=1))
+        self.assertEqual(self._prune(days=90, max_per_user=100)['bodies'], 1)
+        self.assertTrue(NotificationBody.objects.filter(pk=fresh.pk).exists())
+        self.assertFalse(NotificationBody.objects.filter(pk=old.pk).exists())
+
+    def test_archive_file(self):
+        from .models import NotificationArchive
+
+        self._notify([self.ada], 100, 'Old')
+        mark_all_seen(self.ada)
+        path = os.path.join(tempfile.mkdtemp(), 'archive.jsonl')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        self.assertEqual(self._prune(days=90, max_per_user=100, archive_path=path)['expired'], 1)
+        with open(path, encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([(row['user_id'], row['title']) for row in rows], [(self.ada.id, 'Old')])
+        self.assertFalse(NotificationArchive.objects.exists())
+
+    def test_command_reports_what_was_reclaimed(self):
+        for days in (5, 4, 3):
+            self._notify([self.ada], days)
+        body = self._notify([self.ben], 100)
+        mark_all_seen(self.ben)
+
+        out = StringIO()
+        call_command('prune_notifications', '--days', '90', '--max-per-user', '2', '--dry-run', stdout=out)
+        self.assertIn('Would archive 2 notification(s): 1 past retention, 1 over the per-user cap', out.getvalue())
+        self.assertEqual(len(self._remaining(self.ada)), 3)
+
+        out = StringIO()
+        call_command('prune_notifications', '--days', '90', '--max-per-user', '2', '--pause', '0', stdout=out)
+        self.assertIn('Archived 2 notification(s): 1 past retention, 1 over the per-user cap', out.getvalue())
+        self.assertIn('Deleted 2 unreferenced notification bodies', out.getvalue())
+        self.assertEqual(len(self._remaining(self.ada)), 2)
+        self.assertNotIn(body.id, self._remaining(self.ben))
+
+
+def _render_digest(items):
+    return f"{len(items)} files", ', '.join(items)
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    NOTIFICATION_DIGEST_WINDOW_SECONDS=600,
+)
+class NotificationDigestTests(TestCase):
+    def setUp(self):
+        from .models import User
+
+        role = Role.objects.create(role_name='Student')
+        self.ada = User.objects.create_user(username='ada', password='x', role=role)
+        self.ben = User.objects.create_user(username='ben', password='x', role=role)
+        self.cy = User.objects.create_user(username='cy', password='x', role=role)
+
+    def _digest(self, users, item):
+        from .models import Notification
+
+        return Notification.notify_digest(users, 'upload:1:1', item, _render_digest)
+
+    def _unread(self, user):
+        return get_state(user).unread_count
+
+    def test_events_in_the_window_are_appended(self):
+        first = self._digest([self.ada, self.ben], 'a')
+        second = self._digest([self.ada, self.ben], 'b')
+        self.assertEqual(second.pk, first.pk)
+        second.refresh_from_db()
+        self.assertEqual((second.items, second.title, second.message), (['a', 'b'], '2 files', 'a, b'))
+        rows = second.recipients.all()
+        self.assertEqual(len(rows), 2)
+        # Moved back to the top, but still one unread notification each
+        self.assertTrue(all(row.created_at == second.updated_at for row in rows))
+        self.assertEqual((self._unread(self.ada), self._unread(self.ben)), (1, 1))
+        self.assertEqual(reconcile_unread_counters(), 0)
+
+    def test_seen_digest_becomes_unread_again(self):
+        body = self._digest([self.ada, self.ben], 'a')
+        mark_all_seen(self.ada, [body.id])
+        self.assertEqual(self._unread(self.ada), 0)
+        self._digest([self.ada, self.ben], 'b')
+        self.assertEqual((self._unread(self.ada), self._unread(self.ben)), (1, 1))
+        self.assertEqual(reconcile_unread_counters(), 0)
+
+    def test_new_and_missing_recipients_get_a_fresh_row(self):
+        from .models import Notification
+
+        body = self._digest([self.ada, self.ben], 'a')
+        # ben deleted the notification; cy joined the batch since
+        Notification.objects.get(body=body, user=self.ben).delete()
+        self.assertEqual(self._unread(self.ben), 0)
+        self._digest([self.ada, self.ben, self.cy], 'b')
+        self.assertEqual(set(body.recipients.values_list('user_id', flat=True)), {self.ada.id, self.ben.id, self.cy.id})
+        self.assertEqual((self._unread(self.ada), self._unread(self.ben), self._unread(self.cy)), (1, 1, 1))
+        self.assertEqual(reconcile_unread_counters(), 0)
+
+    def test_window_is_anchored_to_the_first_event(self):
+        from .models import NotificationBody
+
+        first = self._digest([self.ada], 'a')
+        # Updated a moment ago, but opened longer ago than the window
+        NotificationBody.objects.filter(pk=first.pk).update(created_at=timezone.now() - timezone.timedelta(seconds=601))
+        second = self._digest([self.ada], 'b')
+        self.assertNotEqual(second.pk, first.pk)
+        self.assertEqual(second.items, ['b'])
+        first.refresh_from_db()
+        self.assertEqual(first.items, ['a'])
+
+    @override_settings(NOTIFICATION_DIGEST_WINDOW_SECONDS=0)
+    def test_no_window_never_merges(self):
+        self.assertNotEqual(self._digest([self.ada], 'a').pk, self._digest([self.ada], 'b').pk)
+        self.assertEqual(self._unread(self.ada), 2)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], PASSWORD_HASHING_OFFLOAD=False)
+class SingleSessionTests(TestCase):
+    def setUp(self):
+        from .models import User
+
+        cache.clear()
+        role = Role.objects.create(role_name='Teacher')
+        # Ids that share digits, as the old lookup by user id in the session data confused them
+        self.ada = User.objects.create_user(id=7, username='ada', password='pw', role=role)
+        self.ben = User.objects.create_user(id=77, username='ben', password='pw', role=role)
+        self.cy = User.objects.create_user(id=17, username='cy', password='pw', role=role)
+
+    def _sign_in(self, user):
+        client = self.client_class()
+        response = client.post('/', {'username': user.username, 'password': 'pw'})
+        self.assertRedirects(response, '/dashboard/', fetch_redirect_response=False)
+        return client, client.session.session_key
+
+    def _live(self, session_key):
+        return SessionStore().exists(session_key)
+
+    def _keys(self, user):
+        from .models import UserSession
+
+        return set(UserSession.objects.filter(user=user).values_list('session_key', flat=True))
+
+    def test_second_sign_in_revokes_the_first_by_key(self):
+        first, first_key = self._sign_in(self.ada)
+        _, second_key = self._sign_in(self.ada)
+        self.assertFalse(self._live(first_key))
+        self.assertTrue(self._live(second_key))
+        self.assertEqual(self._keys(self.ada), {second_key})
+        # The first browser is signed out
+        self.assertRedirects(first.get('/dashboard/'), '/', fetch_redirect_response=False)
+
+    def test_other_users_sessions_are_untouched(self):
+        _, ben_key = self._sign_in(self.ben)
+        _, cy_key = self._sign_in(self.cy)
+        self._sign_in(self.ada)
+        self._sign_in(self.ada)
+        self.assertTrue(self._live(ben_key))
+        self.assertTrue(self._live(cy_key))
+        self.assertEqual((self._keys(self.ben), self._keys(self.cy)), ({ben_key}, {cy_key}))
+
+    def test_sign_out_removes_the_mapping(self):
+        client, session_key = self._sign_in(self.ada)
+        client.get('/logout/')
+        self.assertEqual(self._keys(self.ada), set())
+        self.assertFalse(self._live(session_key))
+
+    def test_migration_maps_live_sessions_to_their_users(self):
+        from importlib import import_module
+
+        from django.apps import apps
+        from django.contrib.sessions.backends.db import SessionStore as DBStore
+        from django.contrib.sessions.models import Session
+
+        from .models import UserSession
+
+        def db_session(user_id=None, expired=False):
+            session = DBStore()
+            if user_id is not None:
+                session['_auth_user_id'] = str(user_id)
+            session.create()
+            if expired:
+                Session.objects.filter(pk=session.session_key).update(
+                    expire_date=timezone.now() - timezone.timedelta(minutes=1)
+                )
+            return session.session_key
+
+        ada_key = db_session(self.ada.id)
+        ben_key = db_session(self.ben.id)
+        db_session(self.cy.id, expired=True)
+        db_session(999)  # User deleted since
+        db_session()  # Anonymous
+
+        migration = import_module('core.migrations.0013_user_sessions')
+        migration.map_live_sessions(apps, SimpleNamespace(connection=connection))
+        self.assertEqual(
+            set(UserSession.objects.values_list('user_id', 'session_key')),
+            {(self.ada.id, ada_key), (self.ben.id, ben_key)},
+        )
+
+
+class MigrateOtherDatabaseTests(TestCase):
+    def test_data_migrations_write_to_the_database_being_migrated(self):
+        from .models import DashboardStats, User
+
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        alias = _sqlite_alias(self, os.path.join(tmp, 'target.sqlite3'), 'migrate_target')
+        # A sentinel 0011's data step would overwrite if it ran against the default database
+        DashboardStats.objects.update_or_create(pk=1, defaults={'total_teachers': 42})
+
+        call_command('migrate', database=alias, interactive=False, verbosity=0)
+
+        self.assertEqual(DashboardStats.objects.get(pk=1).total_teachers, 42)
+        self.assertEqual(DashboardStats.objects.using(alias).get(pk=1).total_teachers, 0)
+        self.assertFalse(User.objects.using(alias).exists())
+        self.assertEqual(
+            set(MigrationRecorder(connections[alias]).applied_migrations()),
+            set(MigrationRecorder(connections['default']).applied_migrations()),
+        )
+
+
+class MergeBatchCodesMigrationTests(TestCase):
+    before = [
+        ('core', '0004_batchcode_password_batchcode_username'),
+        ('teacher', '0009_batch_details'),
+        ('student', '0002_initial'),
+    ]
+    after = [('core', '0005_merge_batchcode_into_batch')]
+
+    def setUp(self):
+        from django.db.migrations.executor import MigrationExecutor
+
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.alias = _sqlite_alias(self, os.path.join(tmp, 'merge.sqlite3'), 'merge_target')
+        executor = MigrationExecutor(connections[self.alias])
+        executor.migrate(self.before)
+        self.old = executor.loader.project_state(self.before).apps
+
+    def _migrate(self):
+        from django.db.migrations.executor import MigrationExecutor
+
+        executor = MigrationExecutor(connections[self.alias])
+        executor.migrate(self.after)
+        return executor.loader.project_state(self.after).apps
+
+    def _user(self, username, batchcode):
+        Role = self.old.get_model('core', 'Role')
+        User = self.old.get_model('core', 'User')
+        role, _ = Role.objects.using(self.alias).get_or_create(role_name='Student')
+        return User.objects.using(self.alias).create(username=username, role=role, batchcode=batchcode)
+
+    def test_batch_codes_and_users_are_merged(self):
+        Batch = self.old.get_model('teacher', 'Batch')
+        BatchCode = self.old.get_model('core', 'BatchCode')
+        OldStudent = self.old.get_model('student', 'Student')
+        b1 = Batch.objects.using(self.alias).create(batch_code='B1')
+        BatchCode.objects.using(self.alias).create(
+            batch_code='B1', class_name='10', academic_year='2026', branch='Gandhipuram',
+            username='b1', password='pw',
+        )
+        BatchCode.objects.using(self.alias).create(batch_code='B2', class_name='11')
+        self._user('spaced', ' B3 ')
+        self._user('listed', 'B1')
+        self._user('blank', '')
+        moved = self._user('moved', 'B2')
+        OldStudent.objects.using(self.alias).create(user=moved, student_code='E1', name='Moe', batch=b1)
+
+        apps = self._migrate()
+        Batch = apps.get_model('teacher', 'Batch')
+        User = apps.get_model('core', 'User')
+
+        merged = Batch.objects.using(self.alias).get(batch_code='B1')
+        self.assertEqual(merged.id, b1.id)
+        self.assertEqual(
+            (merged.class_name, merged.academic_year, merged.branch, merged.username, merged.password),
+            ('10', '2026', 'Gandhipuram', 'b1', 'pw'),
+        )
+        self.assertEqual(Batch.objects.using(self.alias).get(batch_code='B2').class_name, '11')
+        self.assertEqual(
+            dict(User.objects.using(self.alias).values_list('username', 'batch__batch_code')),
+            {'spaced': 'B3', 'listed': 'B1', 'blank': None, 'moved': 'B1'},
+        )
+        self.assertEqual(Batch.objects.using(self.alias).count(), 3)
+
+
+class BatchViewTests(TestCase):
+    def setUp(self):
+        from teacher.models import Batch
+        from .models import User
+
+        roles = {name: Role.objects.create(role_name=name) for name in ('Admin', 'Student')}
+        self.admin = User.objects.create_user(username='admin', password='x', role=roles['Admin'])
+        self.b1 = Batch.objects.create(batch_code='B1')
+        self.b2 = Batch.objects.create(batch_code='B2')
+        self.students = {}
+        for code, batch in (('E1', self.b1), ('E2', self.b1), ('E3', self.b2)):
+            user = User.objects.create_user(username=code.lower(), password='x', role=roles['Student'], batch=batch)
+            self.students[code] = Student.objects.create(user=user, student_code=code, name=code, batch=batch)
+        self.client.force_login(self.admin)
+
+    def test_manage_batchcodes_lists_batches(self):
+        response = self.client.get('/batchcodes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['batches']), [self.b2, self.b1])
+
+    def test_manage_batchcodes_is_admin_only(self):
+        self.client.force_login(self.students['E1'].user)
+        response = self.client.get('/batchcodes/')
+        self.assertRedirects(response, '/dashboard/', fetch_redirect_response=False)
+
+    def _transfer(self, student, from_batch):
+        return self.client.post('/transfer_student/', {
+            'from_batch': from_batch, 'to_batch': 'B2', 'student_id': student.id,
+            'transfer_date': '2026-10-19', 'remarks': 'Moved up',
+        })
+
+    def test_transfer_student(self):
+        from .models import Notification
+
+        student = self.students['E1']
+        self._transfer(student, 'B1')
+        student.refresh_from_db()
+        student.user.refresh_from_db()
+        self.assertEqual((student.batch, student.user.batch), (self.b2, self.b2))
+        self.b1.refresh_from_db()
+        self.b2.refresh_from_db()
+        self.assertEqual((self.b1.student_count, self.b2.student_count), (1, 2))
+        self.assertEqual(
+            list(Notification.objects.filter(user=student.user).values_list('body__title', flat=True)),
+            ['Batch Transfer Notification'],
+        )
+
+    def test_transfer_from_the_wrong_batch_changes_nothing(self):
+        from .models import Notification
+
+        student = self.students['E3']
+        self._transfer(student, 'B1')
+        student.refresh_from_db()
+        student.user.refresh_from_db()
+        self.assertEqual((student.batch, student.user.batch), (self.b2, self.b2))
+        self.assertFalse(Notification.objects.filter(user=student.user).exists())
+
+    def _delete(self, batch_id):
+        return self.client.post(
+            f'/batchcodes/delete/{batch_id}/', json.dumps({'reason': 'Graduated'}), content_type='application/json',
+        )
+
+    def test_delete_batchcode_removes_its_students_and_users(self):
+        from teacher.models import Batch
+        from .models import Notification, User
+
+        response = self._delete(self.b1.id)
+        self.assertEqual(json.loads(response.content)['status'], 'success')
+        self.assertFalse(Batch.objects.filter(id=self.b1.id).exists())
+        self.assertEqual(list(Student.objects.values_list('student_code', flat=True)), ['E3'])
+        self.assertEqual(set(User.objects.values_list('username', flat=True)), {'admin', 'e3'})
+        self.assertIn(
+            "Reason: Graduated",
+            Notification.objects.get(user=self.admin).body.message,
+        )
+
+    def test_delete_missing_batchcode(self):
+        response = self._delete(self.b2.id + 100)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Student.objects.count(), 3)
+
+
+class GetUserTests(TestCase):
+    def setUp(self):
+        from teacher.models import Batch
+        from .backends import clear_user_cache
+        from .models import User
+
+        self.backend = RoleAwareModelBackend()
+        batch = Batch.objects.create(batch_code='B1')
+        role = Role.objects.create(role_name='Student')
+        self.user = User.objects.create_user(username='ben', password='x', role=role, batch=batch)
+        self.student = Student.objects.create(user=self.user, student_code='E1', name='Ben', batch=batch)
+        clear_user_cache()
+        self.addCleanup(clear_user_cache)
+
+    def test_role_batch_and_student_load_in_one_query(self):
+        from .backends import get_student
+
+        with self.assertNumQueries(1):
+            user = self.backend.get_user(self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(user.role.role_name, 'Student')
+            self.assertEqual(user.batch.batch_code, 'B1')
+            self.assertEqual(get_student(user).batch.batch_code, 'B1')
+
+    def test_user_without_a_student_profile(self):
+        from .backends import get_student
+
+        self.student.delete()
+        user = self.backend.get_user(self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_student(user))
+
+    def test_inactive_user_is_not_loaded(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+
+    def test_cache_is_off_by_default(self):
+        self.backend.get_user(self.user.pk)
+        with self.assertNumQueries(1):
+            self.backend.get_user(self.user.pk)
+
+    @override_settings(AUTH_USER_CACHE_TTL=60)
+    def test_cached_users_are_copies(self):
+        first = self.backend.get_user(str(self.user.pk))
+        first.first_name = 'Changed'
+        with self.assertNumQueries(0):
+            second = self.backend.get_user(str(self.user.pk))
+        self.assertEqual(second.first_name, '')
+        self.assertIsNot(second, first)
+
+    @override_settings(AUTH_USER_CACHE_TTL=60)
+    def test_cache_entries_expire(self):
+        self.backend.get_user(self.user.pk)
+        later = time.monotonic() + 61
+        with mock.patch('core.backends.time.monotonic', return_value=later):
+            with self.assertNumQueries(1):
+                self.backend.get_user(self.user.pk)
+
+    @override_settings(AUTH_USER_CACHE_TTL=60)
+    def test_saving_the_user_forgets_it(self):
+        self.backend.get_user(self.user.pk)
+        self.user.first_name = 'Benedict'
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.backend.get_user(self.user.pk).first_name, 'Benedict')
+
+    @override_settings(AUTH_USER_CACHE_TTL=60)
+    def test_saving_the_student_forgets_its_user(self):
+        self.backend.get_user(self.user.pk)
+        self.student.name = 'Benedict'
+        self.student.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.backend.get_user(self.user.pk).student.name, 'Benedict')
@@ -8,7 +8,8 @@ from core.views import (
     delete_batchcode, download_format, bulk_upload_students,
     add_individual_student, transfer_student, get_students_by_batch,
     delete_student, download_bulk_files, get_batch_summary,
-    mark_notifications_read, delete_notification
+    mark_notifications_read, delete_notification, event_stream,
+    upload_analytics, active_student_analytics
 )
 
 app_name = 'core'  # Add namespace
@@ -36,4 +37,7 @@ urlpatterns = [
     path('update-student-credentials/<int:student_id>/', update_student_credentials, name='update_student_credentials'),
     path('mark-notifications-read/', mark_notifications_read, name='mark_notifications_read'),
     path('delete-notification/<int:notification_id>/', delete_notification, name='delete_notification'),
+    path('events/', event_stream, name='event_stream'),
+    path('analytics/uploads/', upload_analytics, name='upload_analytics'),
+    path('analytics/active-students/', active_student_analytics, name='active_student_analytics'),
 ]
\ No newline at end of file
@@ -0,0 +1,56 @@
+"""
+Version counters kept in the cache.
+
+A version is bumped whenever the data behind a cached response changes.
+Readers put the version in their cache keys and ETags, so stale entries are
+never read again and simply expire.
+
+Versions live in the ``default`` cache, so every process must share it
+(see ``CACHES`` in settings); with the in-process default a bump in one
+worker is not seen by the others.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_TIMEOUT = None  # Versions must outlive the entries keyed by them
+
+
+def _seed():
+    # A fresh counter starts from the clock, so a version that was evicted
+    # never comes back with a value that old cache entries were keyed by
+    return int(time.time() * 1000)
+
+
+def get_version(name):
+    """Current version for ``name``"""
+    key = f'version:{name}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _seed(), VERSION_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    """Invalidate everything keyed by the current version of ``name``"""
+    key = f'version:{name}'
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, _seed(), VERSION_TIMEOUT)
+        return cache.get(key)
+
+
+def bump_version_on_commit(name, using=None):
+    """``bump_version`` once the current transaction commits, or now outside one"""
+    # A bump before commit lets a reader cache the old rows under the new version
+    transaction.on_commit(lambda: bump_version(name), using=using)
+
+
+def get_versions(*names):
+    """Current versions for several names, in one cache round trip when all exist"""
+    keys = [f'version:{name}' for name in names]
+    found = cache.get_many(keys)
+    return tuple(found[key] if key in found else get_version(name) for key, name in zip(keys, names))
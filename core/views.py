@@ -3,93 +3,55 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db import transaction, OperationalError
-from django.http import JsonResponse, HttpResponseForbidden, HttpResponse
+from django.db import transaction
+from django.http import JsonResponse, HttpResponseForbidden, HttpResponse, StreamingHttpResponse
 from datetime import datetime
 from student.models import Student
-from .models import Notification, DashboardStats, User, Role, BatchCode
+from student.visibility import student_file_stats
+from .models import Notification, User, Role
 from teacher.models import Batch
 import pandas as pd
 import io
 import openpyxl
-from functools import wraps
-import time
-from django.contrib.sessions.models import Session
+from collections import Counter
+import asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.cache import cache
+from django.views.decorators.http import condition
+from teacher.counters import BATCH_SUMMARY_VERSION, adjust_student_count
+from . import analytics
+from .backends import get_student
+from .counters import adjust_dashboard_stats, get_dashboard_stats, mark_all_seen, unread_count as get_unread_count
+from .decorators import admission_queue, atomic_view, autocommit_view, busy_response, query_budget, read_only_view
+from .events import channels_for, format_sse, get_broker, publish, user_channel
+from .hashing import hash_password, hash_passwords
+from .sessions import end_session, start_single_session
+from .versions import get_version
+from .writer import WriterBusy, write_transaction
 
-# Decorator for handling database lock issues
-def retry_on_db_lock(func):
-    """Retry function execution on database locks"""
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        max_attempts = 3
-        attempt = 1
-        last_error = None
-        
-        while attempt <= max_attempts:
-            try:
-                return func(*args, **kwargs)
-            except OperationalError as e:
-                last_error = e
-                if "database is locked" not in str(e):
-                    raise
-                if attempt == max_attempts:
-                    break
-                time.sleep(0.2 * attempt)
-                attempt += 1
-            except Exception as e:
-                raise
-        
-        # If we got here, we failed all attempts
-        if last_error:
-            print(f"Failed after {max_attempts} attempts: {str(last_error)}")
-        raise last_error
-    
-    return wrapper
+BATCH_SUMMARY_CACHE_TIMEOUT = 60 * 60
+BULK_CREATE_BATCH_SIZE = 500
+ANALYTICS_DEFAULT_DAYS = 90
+ANALYTICS_MAX_DAYS = 366
 
 @login_required
+@read_only_view
 def manage_batchcodes(request):
     if not request.user.is_authenticated or not hasattr(request.user, 'role') or request.user.role.role_name != "Admin":
         messages.error(request, "You don't have permission to access this page.")
         return redirect('core:dashboard')
     
-    # Get all existing BatchCode objects
-    existing_batches = BatchCode.objects.all().order_by('-created_at')
-    
-    # Get unique batch codes from User model that don't exist in BatchCode
-    user_batchcodes = User.objects.exclude(batchcode='').values_list('batchcode', flat=True).distinct()
-    
-    # Create missing batch codes from User model
-    for code in user_batchcodes:
-        if not BatchCode.objects.filter(batch_code=code).exists():
-            BatchCode.objects.create(
-                batch_code=code,
-                class_name=f"Class for {code}",
-                academic_year="2025-2026",
-                branch="Nehru nagar"
-            )
-    
-    # Get all batch codes after creating missing ones
-    batches = BatchCode.objects.all().order_by('-created_at')
-    print(f"Found {len(batches)} batch codes")
-    
-    # Prepare batch data with students
-    batch_data = []
-    for batch_code in batches:
-        try:
-            teacher_batch, _ = Batch.objects.get_or_create(batch_code=batch_code.batch_code)
-            students = Student.objects.filter(batch=teacher_batch)
-            batch_code.students = students
-        except Exception as e:
-            print(f"Error getting students for batch {batch_code.batch_code}: {str(e)}")
-            batch_code.students = []
-        batch_data.append(batch_code)
+    batches = Batch.objects.order_by('-created_at')
     
     context = {
-        'batches': batch_data
+        'batches': batches
     }
     return render(request, 'batchcode.html', context)
 
 @login_required
+@atomic_view
 def add_batchcode(request):
     if not request.user.is_authenticated or not hasattr(request.user, 'role') or request.user.role.role_name != "Admin":
         return HttpResponseForbidden("You don't have permission to perform this action.")
@@ -104,22 +66,22 @@ def add_batchcode(request):
             messages.error(request, "All fields are required.")
             return redirect('core:manage_batchcodes')
             
-        if BatchCode.objects.filter(batch_code=batch_code).exists():
+        if Batch.objects.filter(batch_code=batch_code).exists():
             messages.error(request, f"Batch code '{batch_code}' already exists.")
             return redirect('core:manage_batchcodes')
             
-        BatchCode.objects.create(
+        Batch.objects.create(
             batch_code=batch_code,
             class_name=class_name,
             academic_year=academic_year,
             branch=branch
         )
-        Batch.objects.get_or_create(batch_code=batch_code)
         messages.success(request, f"Batch code '{batch_code}' created successfully.")
         
     return redirect('core:manage_batchcodes')
 
 @login_required
+@atomic_view
 def delete_batchcode(request, batch_id):
     if not request.user.is_authenticated or not hasattr(request.user, 'role') or request.user.role.role_name != "Admin":
         return JsonResponse({
@@ -133,33 +95,21 @@ def delete_batchcode(request, batch_id):
             data = json.loads(request.body)
             reason = data.get('reason', 'No reason provided')
             
-            batch = BatchCode.objects.get(id=batch_id)
+            batch = Batch.objects.get(id=batch_id)
             batch_code = batch.batch_code
             
             # Create delete notification for admin users
-            admin_role = Role.objects.get(role_name='Admin')
-            admin_users = User.objects.filter(role=admin_role)
-            for admin in admin_users:
-                Notification.objects.create(
-                    user=admin,
-                    title="Batch Deletion Record",
-                    message=f"Batch '{batch_code}' was deleted.\nReason: {reason}"
-                )
+            admin_ids = User.objects.filter(role__role_name='Admin').values_list('id', flat=True)
+            Notification.notify(
+                admin_ids,
+                title="Batch Deletion Record",
+                message=f"Batch '{batch_code}' was deleted.\nReason: {reason}"
+            )
             
-            # Delete associated students first
-            try:
-                teacher_batch = Batch.objects.get(batch_code=batch_code)
-                students = Student.objects.filter(batch=teacher_batch)
-                # Delete student users
-                for student in students:
-                    if student.user:
-                        student.user.delete()
-                students.delete()
-                teacher_batch.delete()
-            except Batch.DoesNotExist:
-                pass
+            # Delete the batch's students' users, and with them their student profiles
+            User.objects.filter(student__batch=batch).delete()
             
-            # Finally delete the batch code
+            # Finally delete the batch itself
             batch.delete()
             
             return JsonResponse({
@@ -167,7 +117,7 @@ def delete_batchcode(request, batch_id):
                 "message": f"Batch code '{batch_code}' and associated students deleted successfully."
             })
             
-        except BatchCode.DoesNotExist:
+        except Batch.DoesNotExist:
             return JsonResponse({
                 "status": "error",
                 "message": "Batch code not found."
@@ -188,33 +138,45 @@ def delete_batchcode(request, batch_id):
         "message": "Invalid request method."
     }, status=405)
 
+def _batch_summary_etag(request):
+    return f"batch-summary-{get_version(BATCH_SUMMARY_VERSION)}"
+
 @login_required
+@query_budget(5)
+@condition(etag_func=_batch_summary_etag)
+@read_only_view
 def get_batch_summary(request):
     """Get summary of all batches including student counts and class details"""
     if not request.user.is_authenticated:
         return JsonResponse({"error": "Authentication required"}, status=401)
     
     try:
-        batch_summary = []
-        batches = BatchCode.objects.all().order_by('batch_code')
-        
-        for batch in batches:
-            teacher_batch = Batch.objects.filter(batch_code=batch.batch_code).first()
-            student_count = Student.objects.filter(batch=teacher_batch).count() if teacher_batch else 0
-            
-            batch_summary.append({
+        version = get_version(BATCH_SUMMARY_VERSION)
+        cache_key = f"batch_summary:{version}"
+        batch_summary = cache.get(cache_key)
+
+        if batch_summary is None:
+            # Details and counters live on the same row: one query
+            batches = Batch.objects.order_by('batch_code')
+
+            batch_summary = [{
                 'id': str(batch.id),  # Convert ID to string
                 'batch_code': batch.batch_code or '',
                 'class_name': batch.class_name or '',
                 'academic_year': batch.academic_year or '',
                 'branch': batch.branch or '',
-                'student_count': student_count
-            })
+                'student_count': batch.student_count,
+                'upload_count': batch.upload_count,
+            } for batch in batches]
+            cache.set(cache_key, batch_summary, BATCH_SUMMARY_CACHE_TIMEOUT)
         
-        return JsonResponse({
+        response = JsonResponse({
             'status': 'success',
             'data': batch_summary
         })
+        # Always revalidate; an unchanged summary comes back as a 304
+        response['Cache-Control'] = 'private, no-cache'
+        return response
         
     except Exception as e:
         return JsonResponse({
@@ -223,6 +185,7 @@ def get_batch_summary(request):
         }, status=500)
 
 @login_required
+@read_only_view
 def get_students_by_batch(request):
     if not request.user.is_authenticated or not hasattr(request.user, 'role') or request.user.role.role_name != "Admin":
         return JsonResponse({"error": "Permission denied"}, status=403)
@@ -235,20 +198,19 @@ def get_students_by_batch(request):
     
     try:
         if batch_id:
-            batch_code_obj = BatchCode.objects.get(id=batch_id)
-            batch_code = batch_code_obj.batch_code
+            batch = Batch.objects.get(id=batch_id)
+            batch_code = batch.batch_code
         else:
-            batch_code_obj = BatchCode.objects.get(batch_code=batch_code)
+            batch = Batch.objects.get(batch_code=batch_code)
         
-        batch = Batch.objects.get(batch_code=batch_code)
-        students = Student.objects.filter(batch=batch)
+        students = Student.objects.filter(batch=batch).select_related('user')
         
         students_data = [{
             "id": student.id,
             "name": student.name,
             "student_code": student.student_code,
             "batch": batch.batch_code,
-            "class_name": batch_code_obj.class_name,
+            "class_name": batch.class_name,
             "username": student.user.username if student.user else student.student_code,
             "password": student.student_code  # Using student_code as initial password
         } for student in students]
@@ -256,15 +218,14 @@ def get_students_by_batch(request):
         print(f"Found {len(students_data)} students for batch {batch_code}")
         return JsonResponse({"students": students_data})
         
-    except BatchCode.DoesNotExist:
-        return JsonResponse({"error": f"Batch code {batch_code} not found"}, status=404)
     except Batch.DoesNotExist:
-        return JsonResponse({"error": f"Teacher batch {batch_code} not found"}, status=404)
+        return JsonResponse({"error": f"Batch code {batch_code} not found"}, status=404)
     except Exception as e:
         print(f"Error getting students: {str(e)}")
         return JsonResponse({"error": "An error occurred while fetching students"}, status=500)
 
 @login_required
+@atomic_view
 def delete_student(request, student_id):
     if not request.user.is_authenticated or not hasattr(request.user, 'role') or request.user.role.role_name != "Admin":
         return HttpResponseForbidden("You don't have permission to perform this action.")
@@ -277,15 +238,12 @@ def delete_student(request, student_id):
                 batch_code = student.batch.batch_code if student.batch else "No Batch"
                 delete_reason = request.POST.get('delete_reason', 'No reason provided')
                 
-                admin_role = Role.objects.get(role_name='Admin')
-                admin_users = User.objects.filter(role=admin_role)
-                
-                for admin in admin_users:
-                    Notification.objects.create(
-                        user=admin,
-                        title=f"Student Deletion Record",
-                        message=f"Student '{student_name}' from batch '{batch_code}' was deleted.\nReason: {delete_reason}"
-                    )
+                admin_ids = User.objects.filter(role__role_name='Admin').values_list('id', flat=True)
+                Notification.notify(
+                    admin_ids,
+                    title=f"Student Deletion Record",
+                    message=f"Student '{student_name}' from batch '{batch_code}' was deleted.\nReason: {delete_reason}"
+                )
                 
                 if student.user:
                     student.user.delete()
@@ -323,6 +281,7 @@ def delete_student(request, student_id):
     
     return redirect('core:manage_batchcodes')
 
+@atomic_view
 def transfer_student(request):
     if not request.user.is_authenticated or not hasattr(request.user, 'role') or request.user.role.role_name != "Admin":
         return HttpResponseForbidden("You don't have permission to perform this action.")
@@ -342,19 +301,23 @@ def transfer_student(request):
     
     try:
         transfer_date = datetime.strptime(transfer_date, '%Y-%m-%d').date()
-        student = Student.objects.get(id=student_id)
+        student = Student.objects.select_related('user').get(id=student_id)
         from_batch_inner = Batch.objects.get(batch_code=from_batch)
-        to_batch_inner = Batch.objects.get_or_create(batch_code=to_batch)[0]
+        to_batch_inner = Batch.objects.get(batch_code=to_batch)
         
-        if student.batch != from_batch_inner:
+        if student.batch_id != from_batch_inner.id:
             messages.error(request, "Student is not in the specified batch.")
             return redirect('core:manage_batchcodes')
         
-        student.batch = to_batch_inner
-        student.save()
-        
-        Notification.objects.create(
-            user=student.user,
+        with transaction.atomic():
+            student.batch = to_batch_inner
+            student.save()
+            if student.user:
+                student.user.batch = to_batch_inner
+                student.user.save(update_fields=['batch'])
+        
+        Notification.notify(
+            [student.user],
             title=f"Batch Transfer Notification",
             message=f"You have been transferred from {from_batch} to {to_batch}.\nRemarks: {remarks if remarks else 'No remarks provided'}"
         )
@@ -370,7 +333,7 @@ def transfer_student(request):
     
     return redirect('core:manage_batchcodes')
 
-@retry_on_db_lock
+@read_only_view
 def download_bulk_files(request):
     """Download all uploaded files in bulk"""
     if not request.user.is_authenticated or not hasattr(request.user, 'role') or request.user.role.role_name != "Admin":
@@ -418,7 +381,7 @@ def download_bulk_files(request):
         messages.error(request, "Error generating bulk download. Please try again.")
         return redirect('core:dashboard')
 
-@retry_on_db_lock
+@read_only_view
 def download_format(request, format_type):
     """Download Excel format for student upload"""
     if not request.user.is_authenticated or not hasattr(request.user, 'role') or request.user.role.role_name != "Admin":
@@ -461,7 +424,7 @@ def download_format(request, format_type):
         messages.error(request, "Error generating Excel format. Please try again.")
         return redirect('core:manage_batchcodes')
 
-@retry_on_db_lock
+@autocommit_view  # Hashing runs before any transaction is opened
 def bulk_upload_students(request):
     """Handle bulk upload of students via Excel file"""
     if not request.user.is_authenticated or not hasattr(request.user, 'role') or request.user.role.role_name != "Admin":
@@ -581,94 +544,118 @@ def bulk_upload_students(request):
         successful = 0
         failed = 0
         errors = []
-        
-        with transaction.atomic():
-            # Process each row in the Excel file
-            df = df.replace({pd.NA: None, pd.NaT: None})  # Handle NaN values
-            for index, row in df.iterrows():
-                try:
-                    # Extract data from row using the mapped column names
-                    if pd.isna(row[column_mapping['Enrollment Number']]) or \
-                       pd.isna(row[column_mapping['Batch Code']]) or \
-                       pd.isna(row[column_mapping['Student Name']]) or \
-                       pd.isna(row[column_mapping['Class']]) or \
-                       pd.isna(row[column_mapping['Academic Year']]) or \
-                       pd.isna(row[column_mapping['Branch']]):
-                        raise ValueError("Row contains empty values")
-                    enrollment = str(row[column_mapping['Enrollment Number']]).strip()
-                    batch_code = str(row[column_mapping['Batch Code']]).strip()
-                    student_name = str(row[column_mapping['Student Name']]).strip()
-                    class_name = str(row[column_mapping['Class']]).strip()
-                    academic_year = str(row[column_mapping['Academic Year']]).strip()
-                    branch = str(row[column_mapping['Branch']]).strip()
-                    
-                    if not all([enrollment, batch_code, student_name, class_name, academic_year, branch]):
-                        raise ValueError("All fields are required")
-                    
-                    # Validate academic year format (optional)
-                    if not academic_year.replace('-', '').isdigit():
-                        raise ValueError(f"Invalid academic year format: {academic_year}. Expected format: YYYY-YYYY")
-                    
-                    # Get or create BatchCode and Batch
-                    batch_code_obj, _ = BatchCode.objects.get_or_create(
-                        batch_code=batch_code,
-                        defaults={
-                            'class_name': class_name,
-                            'academic_year': academic_year,
-                            'branch': branch
-                        }
-                    )
-                    
-                    # Update existing batch code with new values if needed
-                    if batch_code_obj.academic_year != academic_year or \
-                       batch_code_obj.branch != branch or \
-                       batch_code_obj.class_name != class_name:
-                        batch_code_obj.academic_year = academic_year
-                        batch_code_obj.branch = branch
-                        batch_code_obj.class_name = class_name
-                        batch_code_obj.save()
-                    
-                    batch, _ = Batch.objects.get_or_create(batch_code=batch_code)
-                    
-                    # Process student name
-                    name_parts = student_name.split(maxsplit=1)
-                    first_name = name_parts[0]
-                    last_name = name_parts[1] if len(name_parts) > 1 else ""
-                    
-                    # Generate username
-                    base_username = (first_name + last_name).lower()
-                    base_username = ''.join(c for c in base_username if c.isalnum())
-                    username = base_username
-                    counter = 1
-                    while User.objects.filter(username=username).exists():
-                        username = f"{base_username}{counter}"
-                        counter += 1
-                    
-                    # Create user
-                    student_role = Role.objects.get(role_name='Student')
-                    user = User.objects.create(
-                        username=username,
-                        first_name=first_name,
-                        last_name=last_name,
-                        role=student_role,
-                        batchcode=batch_code
-                    )
-                    user.set_password(enrollment)
-                    user.save()
-                    
-                    # Create student
-                    Student.objects.create(
+        rows = []
+        
+        # Validate every row first; nothing is written yet
+        df = df.replace({pd.NA: None, pd.NaT: None})  # Handle NaN values
+        existing_codes = set(Student.objects.values_list('student_code', flat=True))
+        seen_codes = set()
+        for index, row in df.iterrows():
+            student_name = None
+            try:
+                # Extract data from row using the mapped column names
+                if pd.isna(row[column_mapping['Enrollment Number']]) or \
+                   pd.isna(row[column_mapping['Batch Code']]) or \
+                   pd.isna(row[column_mapping['Student Name']]) or \
+                   pd.isna(row[column_mapping['Class']]) or \
+                   pd.isna(row[column_mapping['Academic Year']]) or \
+                   pd.isna(row[column_mapping['Branch']]):
+                    raise ValueError("Row contains empty values")
+                enrollment = str(row[column_mapping['Enrollment Number']]).strip()
+                batch_code = str(row[column_mapping['Batch Code']]).strip()
+                student_name = str(row[column_mapping['Student Name']]).strip()
+                class_name = str(row[column_mapping['Class']]).strip()
+                academic_year = str(row[column_mapping['Academic Year']]).strip()
+                branch = str(row[column_mapping['Branch']]).strip()
+                
+                if not all([enrollment, batch_code, student_name, class_name, academic_year, branch]):
+                    raise ValueError("All fields are required")
+                
+                # Validate academic year format (optional)
+                if not academic_year.replace('-', '').isdigit():
+                    raise ValueError(f"Invalid academic year format: {academic_year}. Expected format: YYYY-YYYY")
+                
+                if enrollment in existing_codes or enrollment in seen_codes:
+                    raise ValueError(f"Enrollment number {enrollment} already exists")
+                seen_codes.add(enrollment)
+                
+                rows.append({
+                    'enrollment': enrollment,
+                    'batch_code': batch_code,
+                    'student_name': student_name,
+                    'class_name': class_name,
+                    'academic_year': academic_year,
+                    'branch': branch,
+                })
+            except Exception as e:
+                failed += 1
+                errors.append(f"Row {index + 2}: {student_name or 'Unknown'} - {str(e)}")
+        
+        # Hash in a process pool before the transaction, so the write lock
+        # is only held for the inserts
+        hashed_passwords = hash_passwords(row['enrollment'] for row in rows)
+        
+        # Usernames are first name + last name, numbered when taken
+        taken_usernames = set(User.objects.values_list('username', flat=True))
+        users = []
+        for row, hashed_password in zip(rows, hashed_passwords):
+            name_parts = row['student_name'].split(maxsplit=1)
+            first_name = name_parts[0]
+            last_name = name_parts[1] if len(name_parts) > 1 else ""
+            base_username = ''.join(c for c in (first_name + last_name).lower() if c.isalnum())
+            username = base_username
+            counter = 1
+            while username in taken_usernames:
+                username = f"{base_username}{counter}"
+                counter += 1
+            taken_usernames.add(username)
+            users.append(User(
+                username=username,
+                first_name=first_name,
+                last_name=last_name,
+                password=hashed_password,
+            ))
+        
+        if rows:
+            student_role = Role.objects.get(role_name='Student')
+            with write_transaction():
+                # Get or create each batch once and keep its details current
+                batches = {}
+                for row in rows:
+                    details = (row['class_name'], row['academic_year'], row['branch'])
+                    batch = batches.get(row['batch_code'])
+                    if batch is None:
+                        batch, _ = Batch.objects.get_or_create(
+                            batch_code=row['batch_code'],
+                            defaults={
+                                'class_name': row['class_name'],
+                                'academic_year': row['academic_year'],
+                                'branch': row['branch']
+                            }
+                        )
+                        batches[row['batch_code']] = batch
+                    if (batch.class_name, batch.academic_year, batch.branch) != details:
+                        batch.class_name, batch.academic_year, batch.branch = details
+                        batch.save(update_fields=['class_name', 'academic_year', 'branch'])
+                
+                for row, user in zip(rows, users):
+                    user.role = student_role
+                    user.batch = batches[row['batch_code']]
+                User.objects.bulk_create(users, batch_size=BULK_CREATE_BATCH_SIZE)
+                Student.objects.bulk_create([
+                    Student(
                         user=user,
-                        student_code=enrollment,
-                        name=student_name,
-                        batch=batch
-                    )
-                    successful += 1
-                except Exception as e:
-                    failed += 1
-                    error_msg = f"Row {index + 2}: {student_name if 'student_name' in locals() else 'Unknown'} - {str(e)}"
-                    errors.append(error_msg)
-                    continue
+                        student_code=row['enrollment'],
+                        name=row['student_name'],
+                        batch=user.batch
+                    ) for row, user in zip(rows, users)
+                ], batch_size=BULK_CREATE_BATCH_SIZE)
+                
+                # bulk_create sends no signals, so the counters are updated here
+                for batch_id, count in Counter(user.batch_id for user in users).items():
+                    adjust_student_count(batch_id, count)
+                adjust_dashboard_stats(total_students=len(users))
+            successful = len(rows)
         
         # Prepare response
         response_data = {
@@ -684,11 +671,14 @@ def bulk_upload_students(request):
     except pd.errors.EmptyDataError:
         return JsonResponse({'status': 'error', 'message': "The Excel file is empty"}, status=400)
         
+    except WriterBusy as e:
+        return busy_response(request, e.retry_after, "The server is busy saving other changes.")
     except Exception as e:
         error_msg = f"Error processing Excel file: {str(e)}"
         return JsonResponse({'status': 'error', 'message': error_msg}, status=500)
 
 @login_required
+@autocommit_view  # Hashing runs before the write slot is taken
 def add_individual_student(request):
     if not request.user.is_authenticated or not hasattr(request.user, 'role') or request.user.role.role_name != "Admin":
         return HttpResponseForbidden("You don't have permission to perform this action.")
@@ -707,18 +697,16 @@ def add_individual_student(request):
             return redirect('core:manage_batchcodes')
         
         try:
-            with transaction.atomic():
-                try:
-                    batch_code = BatchCode.objects.get(batch_code=batch_code_str)
-                except BatchCode.DoesNotExist:
-                    batch_code = BatchCode.objects.create(
-                        batch_code=batch_code_str,
-                        class_name=class_name or f"Class for {batch_code_str}",
-                        academic_year="2025-2026",
-                        branch="Nehru nagar"
-                    )
-                
-                batch, _ = Batch.objects.get_or_create(batch_code=batch_code_str)
+            hashed_password = hash_password(enrollment)
+            with write_transaction():
+                batch, _ = Batch.objects.get_or_create(
+                    batch_code=batch_code_str,
+                    defaults={
+                        'class_name': class_name or f"Class for {batch_code_str}",
+                        'academic_year': "2025-2026",
+                        'branch': "Nehru nagar"
+                    }
+                )
                 
                 name_parts = student_name.split(maxsplit=1)
                 first_name = name_parts[0]
@@ -737,11 +725,10 @@ def add_individual_student(request):
                     username=username,
                     first_name=first_name,
                     last_name=last_name,
+                    password=hashed_password,
                     role=student_role,
-                    batchcode=batch_code_str
+                    batch=batch
                 )
-                user.set_password(enrollment)
-                user.save()
                 
                 student = Student.objects.create(
                     user=user,
@@ -755,11 +742,8 @@ def add_individual_student(request):
                     return JsonResponse({'success': True, 'message': success_msg})
                 messages.success(request, success_msg)
             
-        except BatchCode.DoesNotExist:
-            error_msg = f"Batch code '{batch_code_str}' does not exist."
-            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                return JsonResponse({'success': False, 'error': error_msg}, status=404)
-            messages.error(request, error_msg)
+        except WriterBusy as e:
+            return busy_response(request, e.retry_after, "The server is busy saving other changes.")
         except Role.DoesNotExist:
             error_msg = "Student role not found. Please contact the administrator."
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -773,68 +757,33 @@ def add_individual_student(request):
     
     return redirect('core:manage_batchcodes')
 
+@read_only_view
 def dashboard_stats(request):
     try:
-        from teacher.models import Batch, Upload
-        from django.utils import timezone
-        from django.db.models import Q
-        
         user_role = request.user.role.role_name if hasattr(request.user, 'role') and request.user.role else None
         
-        total_teachers = User.objects.filter(role__role_name='Teacher').count()
-        total_students = User.objects.filter(role__role_name='Student').count()
-        total_batches = Batch.objects.count()
-        total_sent_files = Upload.objects.count()
+        # Totals are kept up to date by signals; this endpoint only reads
+        stats = get_dashboard_stats()
         student_stats = {}
         
         # Calculate student-specific stats if user is a student
         if user_role == "Student":
-            from student.models import Student
-            try:
-                student = Student.objects.get(user=request.user)
-                current_date = timezone.now().date()
-                
-                # Get active files for this student
-                active_files = Upload.objects.filter(
-                    Q(batch=student.batch) | Q(shared_with=student),
-                    is_active=True,
-                    to_date__gte=current_date
-                ).distinct()
-                
-                # Calculate total received files
-                total_received_files = active_files.count()
-                
-                # Calculate total teachers who shared files
-                sharing_teachers = active_files.values('teacher').distinct().count()
-                
-                # Calculate total subjects
-                total_subjects = active_files.values('subject').distinct().count()
-                
-                student_stats = {
-                    'total_received_files': total_received_files,
-                    'total_sharing_teachers': sharing_teachers,
-                    'total_subjects': total_subjects
-                }
-            except Student.DoesNotExist:
+            student = get_student(request.user)  # Preloaded by the auth backend
+            if student is not None:
+                student_stats = student_file_stats(student)
+            else:
                 student_stats = {
                     'total_received_files': 0,
                     'total_sharing_teachers': 0,
                     'total_subjects': 0
                 }
         
-        stats, _ = DashboardStats.objects.get_or_create(pk=1)
-        stats.total_teachers = total_teachers
-        stats.total_students = total_students
-        stats.total_batches = total_batches
-        stats.total_sent_files = total_sent_files
-        stats.save()
-        
         data = {
             'success': True,
-            'total_teachers': total_teachers,
-            'total_students': total_students,
-            'total_batches': total_batches,
-            'total_sent_files': total_sent_files,
+            'total_teachers': stats.total_teachers,
+            'total_students': stats.total_students,
+            'total_batches': stats.total_batches,
+            'total_sent_files': stats.total_sent_files,
             **student_stats
         }
     except Exception as e:
@@ -844,7 +793,57 @@ def dashboard_stats(request):
         }
     return JsonResponse(data)
 
-@retry_on_db_lock
+def _analytics_params(request, groups=None):
+    """Validated (group, period, days) from the query string, or an error message"""
+    group = request.GET.get('group', 'subject')
+    period = request.GET.get('period', 'week')
+    if groups is not None and group not in groups:
+        return None, f"group must be one of: {', '.join(groups)}"
+    if period not in analytics.PERIODS:
+        return None, f"period must be one of: {', '.join(analytics.PERIODS)}"
+    try:
+        days = int(request.GET.get('days', ANALYTICS_DEFAULT_DAYS))
+    except ValueError:
+        return None, "days must be a number"
+    return (group, period, min(max(days, 1), ANALYTICS_MAX_DAYS)), None
+
+@login_required
+@query_budget(3)
+@read_only_view
+def upload_analytics(request):
+    """Uploads per day or week, grouped by subject, batch, teacher or branch"""
+    if not hasattr(request.user, 'role') or request.user.role.role_name != "Admin":
+        return JsonResponse({"status": "error", "message": "Permission denied"}, status=403)
+    params, error = _analytics_params(request, analytics.UPLOAD_GROUPS)
+    if error:
+        return JsonResponse({"status": "error", "message": error}, status=400)
+    group, period, days = params
+    return JsonResponse({
+        'status': 'success',
+        'group': group,
+        'period': period,
+        'data': analytics.upload_series(group, period, days),
+    })
+
+@login_required
+@query_budget(3)
+@read_only_view
+def active_student_analytics(request):
+    """Distinct students who signed in per day or week, by batch"""
+    if not hasattr(request.user, 'role') or request.user.role.role_name != "Admin":
+        return JsonResponse({"status": "error", "message": "Permission denied"}, status=403)
+    params, error = _analytics_params(request)
+    if error:
+        return JsonResponse({"status": "error", "message": error}, status=400)
+    _, period, days = params
+    return JsonResponse({
+        'status': 'success',
+        'period': period,
+        'data': analytics.active_student_series(period, days),
+    })
+
+@admission_queue('login', "Too many people are signing in right now.")
+@autocommit_view  # Password checks run before the write slot is taken
 def login_view(request):
     if request.method == "POST":
         username = request.POST.get("username", "").strip()
@@ -869,20 +868,18 @@ def login_view(request):
                 messages.error(request, "Your account has been deactivated. Please contact administrator.")
                 return render(request, "login.html")
             
-            # Use atomic transaction for all database writes
-            with transaction.atomic():
+            # All database writes in one transaction, queued for the write slot
+            with write_transaction():
                 # Check if student needs profile creation
                 if hasattr(user, 'role') and user.role and user.role.role_name == "Student":
                     try:
                         student = Student.objects.select_for_update().get(user=user)
                     except Student.DoesNotExist:
-                        batch = None
-                        if hasattr(user, 'batchcode') and user.batchcode:
-                            batch, _ = Batch.objects.select_for_update().get_or_create(batch_code=user.batchcode)
+                        batch = user.batch
                         
                         if batch:
                             student_count = Student.objects.filter(batch=batch).count()
-                            unique_student_code = f"{user.batchcode}-{student_count+1:03d}"
+                            unique_student_code = f"{batch.batch_code}-{student_count+1:03d}"
                         else:
                             unique_student_code = f"STU{user.id:04d}"
                         
@@ -896,13 +893,10 @@ def login_view(request):
                 
                 # Attempt login after profile creation
                 try:
-                    # Delete any existing session for this user to prevent conflicts
-                    Session.objects.filter(
-                        session_data__contains=str(user.id)
-                    ).delete()
-                    
                     login(request, user)
                     request.session.save()  # Explicitly save the session
+                    # One session per user: revoke any earlier ones by key
+                    start_single_session(user, request.session.session_key)
                     
                     messages.success(request, f"Welcome back, {user.get_full_name() or user.username}!")
                     return redirect("core:dashboard")
@@ -913,6 +907,8 @@ def login_view(request):
                     messages.error(request, "Error creating session. Please try again.")
                     return render(request, "login.html")
         
+        except WriterBusy as e:
+            return busy_response(request, e.retry_after, "The server is busy signing other people in.")
         except Exception as e:
             print(f"Login error: {str(e)}")
             messages.error(request, "An error occurred during login. Please try again.")
@@ -920,6 +916,7 @@ def login_view(request):
     
     return render(request, "login.html")
 
+@autocommit_view  # Hashing runs before the write slot is taken
 def signup_view(request):
     is_student_login = request.session.get('student_login', False)
     stored_username = request.session.get('student_username', '')
@@ -970,7 +967,8 @@ def signup_view(request):
             return render(request, "signup.html", {"roles": roles})
         
         try:
-            with transaction.atomic():
+            hashed_password = hash_password(password)
+            with write_transaction():
                 role = Role.objects.get(id=role_id)
                 user_data = {
                     'first_name': first_name,
@@ -979,18 +977,15 @@ def signup_view(request):
                     'role': role
                 }
                 
-                if role.role_name.lower() != 'admin':
-                    user_data['batchcode'] = batch_code
+                batch = None
+                if role.role_name.lower() != 'admin' and batch_code:
+                    batch, _ = Batch.objects.get_or_create(batch_code=batch_code)
+                    user_data['batch'] = batch
                     
-                user = User(**user_data)
-                user.set_password(password)
+                user = User(password=hashed_password, **user_data)
                 user.save()
                 
                 if role.role_name.lower() == 'student':
-                    batch = None
-                    if batch_code:
-                        batch, _ = Batch.objects.get_or_create(batch_code=batch_code)
-                    
                     student_count = Student.objects.filter(batch=batch).count() if batch else 0
                     unique_student_code = f"{batch_code}-{student_count+1:03d}" if batch else f"STU{user.id:04d}"
                     
@@ -1004,6 +999,8 @@ def signup_view(request):
             
             messages.success(request, "Sign up successful! Please log in.")
             return redirect("core:login")
+        except WriterBusy as e:
+            return busy_response(request, e.retry_after, "The server is busy saving other changes.")
         except Role.DoesNotExist:
             messages.error(request, "Invalid role selected.")
             return render(request, "signup.html", {"roles": roles})
@@ -1034,6 +1031,7 @@ def signup_view(request):
     }
     return render(request, "signup.html", context)
 
+@read_only_view
 def forgot_password(request):
     if request.method == "POST":
         username = request.POST.get("username")
@@ -1050,6 +1048,7 @@ def forgot_password(request):
     
     return render(request, "forgot_password.html")
 
+@autocommit_view  # Hashing runs before the write slot is taken
 def reset_password(request):
     username = request.session.get("reset_username")
     if not username:
@@ -1070,8 +1069,10 @@ def reset_password(request):
         
         try:
             user = User.objects.get(username=username)
-            user.set_password(new_password)
-            user.save()
+            hashed_password = hash_password(new_password)
+            with write_transaction():
+                user.password = hashed_password
+                user.save(update_fields=['password'])
             messages.success(request, "Password updated successfully! Please log in.")
             if "reset_username" in request.session:
                 del request.session["reset_username"]
@@ -1079,6 +1080,8 @@ def reset_password(request):
         except User.DoesNotExist:
             messages.error(request, "User not found.")
             return redirect("core:forgot_password")
+        except WriterBusy as e:
+            return busy_response(request, e.retry_after, "The server is busy saving other changes.")
         except Exception as e:
             messages.error(request, f"An error occurred: {str(e)}")
             return render(request, "reset_password.html")
@@ -1087,6 +1090,7 @@ def reset_password(request):
 
 @login_required
 @login_required
+@atomic_view
 def update_batch_credentials(request):
     if not request.user.is_authenticated or not hasattr(request.user, 'role') or request.user.role.role_name != "Admin":
         return JsonResponse({
@@ -1101,7 +1105,7 @@ def update_batch_credentials(request):
             username = data.get('username')
             password = data.get('password')
             
-            batch = BatchCode.objects.get(id=batch_id)
+            batch = Batch.objects.get(id=batch_id)
             batch.username = username
             if password:  # Only update password if provided
                 batch.password = password
@@ -1112,7 +1116,7 @@ def update_batch_credentials(request):
                 'message': 'Credentials updated successfully'
             })
             
-        except BatchCode.DoesNotExist:
+        except Batch.DoesNotExist:
             return JsonResponse({
                 'status': 'error',
                 'message': 'Batch not found'
@@ -1129,6 +1133,7 @@ def update_batch_credentials(request):
         'message': 'Invalid request method'
     }, status=405)
 
+@read_only_view
 def home(request):
     try:
         if not hasattr(request.user, 'role') or request.user.role is None:
@@ -1142,9 +1147,7 @@ def home(request):
             messages.error(request, "Invalid role assigned. Please contact the administrator.")
             return redirect("core:login")
         
-        stats = DashboardStats.objects.first()
-        if stats is None:
-            stats = DashboardStats.objects.create()
+        stats = get_dashboard_stats()
         
         show_menus = {
             'show_teacher_menu': False,
@@ -1184,6 +1187,7 @@ def home(request):
         return redirect("core:login")
 
 @login_required
+@autocommit_view  # Hashing runs before the write slot is taken
 def update_student_credentials(request, student_id):
     if not request.user.is_authenticated or not hasattr(request.user, 'role') or request.user.role.role_name != "Admin":
         return JsonResponse({
@@ -1219,11 +1223,12 @@ def update_student_credentials(request, student_id):
                     }, status=400)
                 student.user.username = username
 
-            # Update password if provided
+            # Update password if provided, hashed before the write slot is taken
             if password:
-                student.user.set_password(password)
+                student.user.password = hash_password(password)
 
-            student.user.save()
+            with write_transaction():
+                student.user.save()
             
             return JsonResponse({
                 'status': 'success',
@@ -1237,6 +1242,9 @@ def update_student_credentials(request, student_id):
                 'message': 'Student not found'
             }, status=404)
             
+        except WriterBusy as e:
+            return busy_response(request, e.retry_after, "The server is busy saving other changes.")
+
         except Exception as e:
             return JsonResponse({
                 'status': 'error',
@@ -1248,15 +1256,14 @@ def update_student_credentials(request, student_id):
         'message': 'Invalid request method'
     }, status=405)
 
-@retry_on_db_lock
+@atomic_view
 def logout_view(request):
     try:
-        request.session.flush()
+        session_key = request.session.session_key
         with transaction.atomic():
-            session_key = request.session.session_key
+            # logout() flushes the session from the store
             logout(request)
-            if session_key:
-                Session.objects.filter(session_key=session_key).delete()
+            end_session(session_key)
         messages.info(request, "You have been logged out successfully.")
     except Exception as e:
         try:
@@ -1270,20 +1277,28 @@ def logout_view(request):
     return response
 
 @login_required
+@atomic_view
 def mark_notifications_read(request):
     """Mark notifications as read when user opens notification dropdown"""
     if request.method == 'POST':
         try:
-            # Mark all unread notifications for this user as read
+            # Moving the read cursor marks everything read in one row, up
+            # to the newest notification the page actually showed
+            body_ids = None
+            if request.body:
+                body_ids = json.loads(request.body).get('body_ids')
+                if body_ids is not None:
+                    body_ids = [int(body_id) for body_id in body_ids]
             with transaction.atomic():
-                Notification.objects.filter(
-                    user=request.user,
-                    is_read=False
-                ).update(is_read=True)
+                mark_all_seen(request.user, body_ids)
+                remaining = get_unread_count(request.user)
+                # Other open tabs update their badge too
+                publish([user_channel(request.user.pk)], 'notifications_read', {'unread_count': remaining})
                 
             return JsonResponse({
                 'status': 'success',
-                'message': 'Notifications marked as read'
+                'message': 'Notifications marked as read',
+                'unread_count': remaining,
             })
         except Exception as e:
             return JsonResponse({
@@ -1296,6 +1311,7 @@ def mark_notifications_read(request):
     }, status=405)
 
 @login_required
+@atomic_view
 def delete_notification(request, notification_id):
     """Delete a specific notification"""
     if request.method == 'DELETE':
@@ -1305,13 +1321,9 @@ def delete_notification(request, notification_id):
                     id=notification_id,
                     user=request.user  # Ensure user owns this notification
                 )
-                notification.delete()
+                notification.delete()  # The post_delete signal adjusts the counter
                 
-                # Get updated unread count
-                unread_count = Notification.objects.filter(
-                    user=request.user,
-                    is_read=False
-                ).count()
+                unread_count = get_unread_count(request.user)
                 
                 return JsonResponse({
                     'status': 'success',
@@ -1331,4 +1343,43 @@ def delete_notification(request, notification_id):
     return JsonResponse({
         'status': 'error',
         'message': 'Invalid request method'
-    }, status=405)
\ No newline at end of file
+    }, status=405)
+
+@login_required
+@autocommit_view
+async def event_stream(request):
+    """Server-Sent Events: pushes notifications and file list changes.
+    
+    Needs an ASGI server (e.g. ``uvicorn fileshare.asgi:application``) so an
+    open stream does not hold a worker thread. Served synchronously, or with
+    ``EVENTS_ENABLED`` off, it answers 204 so the browser stops reconnecting.
+    """
+    if not getattr(settings, 'EVENTS_ENABLED', False) or not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    user = await request.auser()
+    channels = await sync_to_async(channels_for)(user)
+    subscription = get_broker().subscribe(channels)
+    keepalive = getattr(settings, 'EVENTS_KEEPALIVE_SECONDS', 15)
+
+    async def stream():
+        try:
+            # Browsers reconnect after this many milliseconds if the stream drops
+            yield f"retry: {getattr(settings, 'EVENTS_RETRY_MS', 5000)}\n\n"
+            while True:
+                try:
+                    message = await subscription.get(timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if subscription.overflowed:
+                    # Events were dropped: have the client reload its state
+                    subscription.overflowed = False
+                    yield "event: resync\ndata: {}\n\n"
+                yield format_sse(message)
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
@@ -0,0 +1,122 @@
+# core/writer.py
+"""
+One write transaction at a time per process.
+
+SQLite has a single write lock. Letting every request thread race for it
+means polling ``busy_timeout`` sleeps in no particular order, and before
+this module the losers were re-run from the top by ``retry_on_db_lock``,
+which could repeat side effects such as saved files and sent notifications.
+Write transactions now queue here instead, first come, first served, and
+are handed the lock one after another. Reads never queue.
+
+The queue is bounded (``max_waiting``) and every wait has a deadline
+(``max_wait``). A writer that cannot get in raises ``WriterBusy`` with a
+``Retry-After`` estimate; nothing is retried on the caller's behalf.
+POSTs to views with the ``atomic`` transaction policy
+(``core.decorators``) queue for the whole view; other views, management
+commands and background threads use ``write_transaction``. Other
+databases lock rows, not the whole file, so their writers do not queue. Configured by
+``WRITE_QUEUE``::
+
+    WRITE_QUEUE = {'max_waiting': 200, 'max_wait': 10, 'slow_after': 2}
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .admission import AdmissionQueue
+from .sqlite import WRITE_TRANSACTION_MODE, transaction_mode
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WAITING = 200
+DEFAULT_MAX_WAIT = 10
+DEFAULT_SLOW_AFTER = 2  # Seconds a writer may hold the slot before it is logged
+
+
+class WriterBusy(Exception):
+    """The write queue is full, or the deadline passed before this writer's turn"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Write queue busy; retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class WriteScheduler:
+    """A FIFO queue in front of a single write slot. Re-entrant per thread."""
+
+    def __init__(self, max_waiting=DEFAULT_MAX_WAITING, max_wait=DEFAULT_MAX_WAIT, slow_after=DEFAULT_SLOW_AFTER):
+        self._queue = AdmissionQueue(slots=1, max_waiting=max_waiting, max_wait=max_wait)
+        self.slow_after = slow_after
+        self._local = threading.local()
+
+    def holding(self):
+        return getattr(self._local, 'depth', 0) > 0
+
+    def waiting(self):
+        return self._queue.waiting()
+
+    @contextmanager
+    def slot(self, max_wait=None):
+        """Hold the write slot for the block; raises WriterBusy if it cannot be had in time"""
+        if self.holding():
+            # Nested write_transaction or atomic view calling one
+            self._local.depth += 1
+            try:
+                yield
+            finally:
+                self._local.depth -= 1
+            return
+
+        retry_after = self._queue.acquire(max_wait)
+        if retry_after is not None:
+            raise WriterBusy(retry_after)
+        self._local.depth = 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._local.depth = 0
+            held = time.monotonic() - started
+            self._queue.release(held)
+            if held > self.slow_after:
+                logger.warning(f"Write slot held for {held:.2f}s; {self.waiting()} writers waiting")
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """The process-wide scheduler, built from ``WRITE_QUEUE`` on first use"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = WriteScheduler(**getattr(settings, 'WRITE_QUEUE', {}))
+        return _scheduler
+
+
+def reset_scheduler():
+    """Forget the scheduler so the next use re-reads the settings"""
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = None
+
+
+def queues_writes(using=DEFAULT_DB_ALIAS):
+    return connections[using].vendor == 'sqlite'
+
+
+@contextmanager
+def write_transaction(using=DEFAULT_DB_ALIAS, max_wait=None):
+    """``transaction.atomic`` that waits its turn for the write slot and takes SQLite's write lock up front"""
+    if not queues_writes(using):
+        with transaction.atomic(using=using):
+            yield
+        return
+    with get_scheduler().slot(max_wait), transaction_mode(WRITE_TRANSACTION_MODE, using), transaction.atomic(using=using):
+        yield
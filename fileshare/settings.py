@@ -22,7 +22,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryBudgetMiddleware',  # No-op unless QUERY_BUDGET_ENABLED
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.WriteTransactionMiddleware',  # Queues writers, BEGIN IMMEDIATE
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -32,15 +34,72 @@ MIDDLEWARE = [
     'core.middleware.SessionHandlerMiddleware',
     'core.middleware.FontMiddleware',
 ]
+# Query budget / N+1 detection (core.middleware.QueryBudgetMiddleware)
+QUERY_BUDGET_ENABLED = False  # Opt-in: adds Server-Timing and logs over-budget views
+QUERY_BUDGET_STRICT = False  # Raise QueryBudgetExceeded instead of logging (used by tests)
+QUERY_BUDGET_DEFAULT = None  # Queries allowed per request when a view declares no budget
+QUERY_BUDGETS = {}  # Per view name, e.g. {'core:batch_summary': 5}; @query_budget wins
+QUERY_BUDGET_DUPLICATE_THRESHOLD = 5  # Same query shape this many times is reported as N+1
+
+# Transaction policies (core.decorators.transaction_policy)
+TRANSACTION_POLICY_STRICT = False  # Raise ReadOnlyViolation when a read-only view writes, instead of logging
+
+# Server-Sent Events push (core.events); needs an ASGI server. Under WSGI
+# (runserver, gunicorn) each open stream would pin a worker thread, so pages
+# only open one when EVENTS_ENABLED is set, and the endpoint answers 204
+# (telling browsers not to reconnect) when it is served synchronously.
+ASGI_APPLICATION = 'fileshare.asgi.application'
+EVENTS_ENABLED = os.environ.get('EVENTS_ENABLED', '') == '1'  # Set when deployed behind an ASGI server
+EVENTS_BROKER = 'core.events.LocalBroker'  # core.events.RedisBroker to share events across processes
+EVENTS_REDIS_URL = os.environ.get('EVENTS_REDIS_URL')  # Used by RedisBroker
+EVENTS_KEEPALIVE_SECONDS = 15  # Comment line sent on idle streams so proxies keep them open
+
+# Notification retention (manage.py prune_notifications)
+NOTIFICATION_RETENTION_DAYS = 90  # Read notifications older than this are archived
+NOTIFICATION_MAX_PER_USER = 200  # Older notifications beyond this many per user are archived
+NOTIFICATION_DIGEST_WINDOW_SECONDS = 600  # Batch uploads by one teacher within this long of the first share one notification; 0 disables
+
+# Loads user, role and student profile in one query (core.backends)
+AUTHENTICATION_BACKENDS = ['core.backends.RoleAwareModelBackend']
+AUTH_USER_CACHE_TTL = 0  # Seconds to keep loaded users per process; 0 disables
+PASSWORD_HASHING_WORKERS = None  # Processes hashing passwords for bulk imports (core/hashing.py); None uses every CPU
+PASSWORD_SIGN_IN_WORKERS = None  # Processes checking sign-in passwords, a separate pool; None uses every CPU
+PASSWORD_HASHING_OFFLOAD = True  # Check sign-in passwords in that pool rather than on the request thread
+
+# Admission queues (core/admission.py): sign-ins in progress per process,
+# how many may queue behind them, and how long one may wait before it is
+# told to retry
+ADMISSION_QUEUES = {
+    'login': {'slots': 4, 'max_waiting': 100, 'max_wait': 5},
+}
+
+# Write queue (core/writer.py): one write transaction at a time per process,
+# SQLite only. How many may wait, seconds one may wait before it is told to
+# retry, and seconds a writer may hold the slot before it is logged as slow
+WRITE_QUEUE = {'max_waiting': 200, 'max_wait': 10, 'slow_after': 2}
+
+# Cache for cached responses, the version counters behind them
+# (core/versions.py) and cache-first sessions. The in-process default only
+# suits a single process: set CACHE_REDIS_URL when running several workers,
+# or a version bump or a revoked session in one worker goes unseen by the rest.
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+if CACHE_REDIS_URL:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_REDIS_URL}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
 # Session settings for better security and persistence
 SESSION_COOKIE_SECURE = False  # Set to True in production with HTTPS
 SESSION_COOKIE_HTTPONLY = True  # Prevent JavaScript access to session cookie
 SESSION_COOKIE_SAMESITE = 'Lax'  # Lax for development, Strict for production
 SESSION_COOKIE_AGE = 3600  # 1 hour in seconds
-SESSION_SAVE_EVERY_REQUEST = True  # Update session on every request
+SESSION_SAVE_EVERY_REQUEST = False  # core.session_store slides the expiry itself
+SESSION_REFRESH_SECONDS = 300  # Push the expiry out at most this often; other requests write nothing
 
-# Database session configuration
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# Cache-first sessions backed by the database (core/session_store.py); needs
+# the shared cache above when running several processes, which
+# ``manage.py check --deploy`` enforces (core.E001).
+SESSION_ENGINE = 'core.session_store'
 SESSION_DATABASE_ALIAS = 'default'
 SESSION_SERIALIZER = 'django.contrib.sessions.serializers.JSONSerializer'
 SESSION_CACHE_ALIAS = 'default'
@@ -75,17 +134,53 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'fileshare.wsgi.application'
 
-# Database configuration
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-        'ATOMIC_REQUESTS': True,  # Wrap all requests in transactions
-        'CONN_MAX_AGE': 60,  # Keep connections alive longer (60 seconds)
-        'OPTIONS': {
-            'timeout': 30,  # Increase SQLite timeout (30 seconds)
+# Database configuration: SQLite unless POSTGRES_DB is set. With PostgreSQL
+# the tests run on the same server, in test_<POSTGRES_DB>. Move existing
+# data across with ``manage.py migrate_sqlite_to_postgres``.
+SQLITE_PATH = BASE_DIR / 'db.sqlite3'
+
+if os.environ.get('POSTGRES_DB'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',  # Needs psycopg 3 and psycopg-pool
+            'NAME': os.environ['POSTGRES_DB'],
+            'USER': os.environ.get('POSTGRES_USER', ''),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'ATOMIC_REQUESTS': False,  # Each view declares a transaction policy (core.decorators)
+            'CONN_MAX_AGE': 0,  # Required with a pool; the pool keeps connections open
+            'OPTIONS': {
+                # Per-process connection pool; requests wait up to `timeout` seconds for a connection
+                'pool': {
+                    'min_size': int(os.environ.get('POSTGRES_POOL_MIN', 2)),
+                    'max_size': int(os.environ.get('POSTGRES_POOL_MAX', 10)),
+                    'timeout': int(os.environ.get('POSTGRES_POOL_TIMEOUT', 10)),
+                },
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': SQLITE_PATH,
+            'ATOMIC_REQUESTS': False,  # Each view declares a transaction policy (core.decorators)
+            'CONN_MAX_AGE': 60,  # Keep connections alive longer (60 seconds)
+            'OPTIONS': {
+                'timeout': 30,  # Increase SQLite timeout (30 seconds)
+            }
         }
     }
+
+# Applied to every new SQLite connection (core/sqlite.py); validated on use
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',  # Readers and the writer no longer block each other
+    'synchronous': 'NORMAL',  # Durable under WAL; only the last commits can be lost on power failure
+    'busy_timeout': 30000,  # Milliseconds to wait for the write lock
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,  # 64 MB page cache per connection
+    'temp_store': 'MEMORY',
 }
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -125,6 +220,17 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Document text/metadata extraction (teacher/extraction.py)
+DOCUMENT_EXTRACTION_ASYNC = True  # Run in a process pool after commit; False runs inline
+DOCUMENT_EXTRACTION_WORKERS = 2
+DOCUMENT_TEXT_MAX_CHARS = 200_000  # Stored text is truncated to this length
+
+# File view tracking (student/tracking.py)
+FILE_VIEW_TRACKING = True
+FILE_VIEW_BUFFER_SIZE = 10000  # Views held in memory per process; the oldest are dropped beyond this
+FILE_VIEW_FLUSH_SECONDS = 5
+FILE_VIEW_FLUSH_BATCH = 500  # Flush early once this many views are waiting
+
 # Logging Configuration
 LOGGING = {
     'version': 1,
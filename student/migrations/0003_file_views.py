@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student', '0002_initial'),
+        ('teacher', '0009_batch_details'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileViewEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('viewed_at', models.DateTimeField()),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='view_events', to='student.student')),
+                ('upload', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='view_events', to='teacher.upload')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['upload', 'viewed_at'], name='file_view_upload_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='FileViewStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view_count', models.PositiveIntegerField(default=0)),
+                ('first_viewed_at', models.DateTimeField()),
+                ('last_viewed_at', models.DateTimeField()),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='view_stats', to='student.student')),
+                ('upload', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='view_stats', to='teacher.upload')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('upload', 'student'), name='file_view_stat_unique')],
+            },
+        ),
+    ]
@@ -14,6 +14,13 @@ class Student(models.Model):
     def __str__(self):
         return f"{self.name} ({self.student_code})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so the batch counters can follow a transfer on save
+        instance._loaded_batch_id = instance.__dict__.get('batch_id')
+        return instance
+
     def get_active_files(self):
         """
         Returns QuerySet of Upload objects accessible to this student.
@@ -58,3 +65,30 @@ class Student(models.Model):
         ordering = ['-created_at']
 
 
+
+class FileViewEvent(models.Model):
+    """Append-only log of successful file views, written in batches by student.tracking"""
+    upload = models.ForeignKey('teacher.Upload', on_delete=models.CASCADE, related_name='view_events')
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='view_events')
+    viewed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['upload', 'viewed_at'], name='file_view_upload_idx'),
+        ]
+
+class FileViewStat(models.Model):
+    """Views of one upload by one student, rolled up from FileViewEvent"""
+    upload = models.ForeignKey('teacher.Upload', on_delete=models.CASCADE, related_name='view_stats')
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='view_stats')
+    view_count = models.PositiveIntegerField(default=0)
+    first_viewed_at = models.DateTimeField()
+    last_viewed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['upload', 'student'], name='file_view_stat_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.student_id} opened {self.upload_id} x{self.view_count}"
@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.backends import forget_user
+from teacher import counters
+from .models import Student
+
+
+@receiver(post_save, sender=Student)
+def count_saved_student(sender, instance, created=False, raw=False, **kwargs):
+    """Keep Batch.student_count in step with creates and transfers"""
+    if raw:
+        return
+    if created:
+        old_batch_id = None
+    elif hasattr(instance, '_loaded_batch_id'):
+        old_batch_id = instance._loaded_batch_id
+    else:
+        return  # Previous batch unknown; reconcile_counters will catch any drift
+    if old_batch_id != instance.batch_id:
+        counters.adjust_student_count(old_batch_id, -1)
+        counters.adjust_student_count(instance.batch_id, 1)
+    instance._loaded_batch_id = instance.batch_id
+
+
+@receiver(post_delete, sender=Student)
+def count_deleted_student(sender, instance, **kwargs):
+    counters.adjust_student_count(getattr(instance, '_loaded_batch_id', instance.batch_id), -1)
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def forget_cached_user(sender, instance, **kwargs):
+    """The cached user carries the student profile; drop it on change"""
+    forget_user(instance.user_id)
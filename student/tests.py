@@ -1,3 +1,157 @@
+from unittest import mock
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+
+from core.models import Role, User
+from teacher.models import Batch, Upload
+
+from .models import FileViewEvent, FileViewStat, Student
+from .tracking import ViewBuffer, open_summary, write_events
+from .visibility import student_file_stats
+
+
+class TrackingTestCase(TestCase):
+    def setUp(self):
+        self.role = Role.objects.create(role_name='Student')
+        self.batch = Batch.objects.create(batch_code='B1')
+        self.other_batch = Batch.objects.create(batch_code='B2')
+        self.upload = Upload.objects.create(topic='Cells', subject='Biology', file='uploads/c.pdf', batch=self.batch)
+        self.ann = self._student('ann', self.batch)
+        self.bob = self._student('bob', self.batch)
+        self.cy = self._student('cy', self.other_batch)
+        self.now = timezone.now()
+
+    def _student(self, code, batch):
+        user = User.objects.create_user(username=code, password='x', role=self.role, batch=batch)
+        return Student.objects.create(user=user, student_code=code, name=code.title(), batch=batch)
+
+    def _at(self, minutes):
+        return self.now + timezone.timedelta(minutes=minutes)
+
+
+class ViewBufferTests(TrackingTestCase):
+    def _buffer(self, size=100):
+        # The flushing thread would only wake after an hour; tests flush by hand
+        return ViewBuffer(size=size, flush_seconds=3600, flush_batch=1000)
+
+    def test_ring_keeps_the_newest_events(self):
+        buffer = self._buffer(size=3)
+        for minutes in range(5):
+            buffer.record(self.upload.id, self.ann.id, self._at(minutes))
+        self.assertEqual((buffer.pending(), buffer.dropped), (3, 2))
+        self.assertEqual([at for _, _, at in buffer.drain()], [self._at(2), self._at(3), self._at(4)])
+        self.assertEqual(buffer.pending(), 0)
+
+    def test_flush_writes_and_empties_the_buffer(self):
+        buffer = self._buffer()
+        buffer.record(self.upload.id, self.ann.id, self._at(0))
+        buffer.record(self.upload.id, self.ann.id, self._at(1))
+        self.assertEqual(FileViewEvent.objects.count(), 0)
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual((buffer.pending(), buffer.flush()), (0, 0))
+        self.assertEqual(FileViewStat.objects.get().view_count, 2)
+
+
+class WriteEventsTests(TrackingTestCase):
+    def test_counts_and_times_merge_into_existing_stats(self):
+        write_events([(self.upload.id, self.ann.id, self._at(10)), (self.upload.id, self.ann.id, self._at(20))])
+        write_events([
+            (self.upload.id, self.ann.id, self._at(30)),
+            (self.upload.id, self.ann.id, self._at(5)),
+            (self.upload.id, self.bob.id, self._at(15)),
+        ])
+        ann = FileViewStat.objects.get(student=self.ann)
+        self.assertEqual((ann.view_count, ann.first_viewed_at, ann.last_viewed_at), (4, self._at(5), self._at(30)))
+        bob = FileViewStat.objects.get(student=self.bob)
+        self.assertEqual((bob.view_count, bob.first_viewed_at, bob.last_viewed_at), (1, self._at(15), self._at(15)))
+        self.assertEqual(FileViewEvent.objects.count(), 5)
+
+    def test_deleted_uploads_and_students_are_skipped(self):
+        written = write_events([
+            (self.upload.id, self.ann.id, self._at(0)),
+            (self.upload.id + 100, self.ann.id, self._at(0)),
+            (self.upload.id, self.cy.id + 100, self._at(0)),
+        ])
+        self.assertEqual(written, 1)
+        self.assertEqual(write_events([(self.upload.id + 100, self.ann.id, self._at(0))]), 0)
+
+
+class OpenSummaryTests(TrackingTestCase):
+    def test_only_the_audience_is_counted(self):
+        write_events([
+            (self.upload.id, self.ann.id, self._at(0)),
+            (self.upload.id, self.ann.id, self._at(1)),
+            # Moved out of the batch since; no longer part of the audience
+            (self.upload.id, self.cy.id, self._at(2)),
+        ])
+        summary = open_summary(self.upload)
+        self.assertEqual((summary['opened'], summary['audience']), (1, 2))
+        self.assertEqual(summary['students'][0]['student_code'], 'ann')
+        self.assertEqual(summary['students'][0]['view_count'], 2)
+
+    def test_individual_shares_narrow_the_audience(self):
+        self.upload.shared_with.add(self.bob)
+        write_events([(self.upload.id, self.ann.id, self._at(0)), (self.upload.id, self.bob.id, self._at(1))])
+        summary = open_summary(self.upload)
+        self.assertEqual((summary['opened'], summary['audience']), (1, 1))
+        self.assertEqual(summary['students'][0]['student_code'], 'bob')
+
+
+class StudentFileStatsTests(TrackingTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        teacher_role = Role.objects.create(role_name='Teacher')
+        self.tess = User.objects.create_user(username='tess', password='x', role=teacher_role)
+        self.tom = User.objects.create_user(username='tom', password='x', role=teacher_role)
+        today = timezone.localdate()
+        # setUp's upload has no teacher; give it one so every file counts towards teachers
+        Upload.objects.filter(pk=self.upload.pk).update(teacher=self.tess)
+        self.upload.shared_with.add(self.ann)  # Seen through both the batch and the share
+        self._upload('Motion', 'Physics', self.tom, self.batch, to_date=today)
+        self._upload('Old', 'History', self.tess, self.batch, to_date=today - timezone.timedelta(days=1))
+        self._upload('Hidden', 'Art', self.tess, self.batch, is_active=False)
+        self.acids = self._upload('Acids', 'Chemistry', self.tom, self.other_batch)
+
+    def _upload(self, topic, subject, teacher, batch, **fields):
+        return Upload.objects.create(
+            topic=topic, subject=subject, file=f'uploads/{topic}.pdf', teacher=teacher, batch=batch, **fields,
+        )
+
+    def _stats(self, student):
+        student = Student.objects.get(pk=student.pk)
+        stats = student_file_stats(student)
+        return (stats['total_received_files'], stats['total_sharing_teachers'], stats['total_subjects'])
+
+    def test_grouped_counts(self):
+        self.assertEqual(self._stats(self.ann), (2, 2, 2))
+        self.assertEqual(self._stats(self.cy), (1, 1, 1))
+
+    def test_counts_are_cached(self):
+        self.assertEqual(self._stats(self.ann), (2, 2, 2))
+        # A queryset update sends no signals, so nothing moves the key on
+        Upload.objects.filter(subject='Physics').update(is_active=False)
+        with self.assertNumQueries(1):  # Only the student lookup
+            self.assertEqual(self._stats(self.ann), (2, 2, 2))
+
+    def test_share_gives_a_fresh_key(self):
+        self.assertEqual(self._stats(self.ann), (2, 2, 2))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.acids.shared_with.add(self.ann)
+        self.assertEqual(self._stats(self.ann), (3, 2, 3))
+        self.assertEqual(self._stats(self.bob), (2, 2, 2))
+
+    def test_transfer_gives_a_fresh_key(self):
+        self.assertEqual(self._stats(self.bob), (2, 2, 2))
+        self.bob.batch = self.other_batch
+        self.bob.save()
+        self.assertEqual(self._stats(self.bob), (1, 1, 1))
 
-# Create your tests here.
+    def test_date_rollover_gives_a_fresh_key(self):
+        self.assertEqual(self._stats(self.ann), (2, 2, 2))
+        tomorrow = timezone.localdate() + timezone.timedelta(days=1)
+        with mock.patch('student.visibility.timezone.localdate', return_value=tomorrow):
+            self.assertEqual(self._stats(self.ann), (1, 1, 1))
@@ -0,0 +1,178 @@
+# student/tracking.py
+"""
+Who opened which file, recorded without a database write per view.
+
+``record_view`` appends to an in-memory ring buffer and returns straight
+away. A daemon thread flushes the buffer every ``FILE_VIEW_FLUSH_SECONDS``
+(sooner once ``FILE_VIEW_FLUSH_BATCH`` events are waiting): each flush is one
+transaction that appends the events to ``FileViewEvent`` and folds them into
+the per (upload, student) ``FileViewStat`` rows that ``open_summary`` reads.
+
+Tracking is best effort. If the database falls behind, the buffer keeps the
+newest ``FILE_VIEW_BUFFER_SIZE`` events and counts the rest as dropped; a
+flush that fails is logged and its events are discarded; events still
+buffered when the process exits are flushed by an ``atexit`` hook.
+"""
+import atexit
+import logging
+import threading
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+from core.writer import write_transaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUFFER_SIZE = 10000
+DEFAULT_FLUSH_SECONDS = 5
+DEFAULT_FLUSH_BATCH = 500
+
+
+class ViewBuffer:
+    """Ring buffer of (upload_id, student_id, viewed_at) with a flushing thread"""
+
+    def __init__(self, size=None, flush_seconds=None, flush_batch=None):
+        self.size = size or getattr(settings, 'FILE_VIEW_BUFFER_SIZE', DEFAULT_BUFFER_SIZE)
+        self.flush_seconds = flush_seconds or getattr(settings, 'FILE_VIEW_FLUSH_SECONDS', DEFAULT_FLUSH_SECONDS)
+        self.flush_batch = flush_batch or getattr(settings, 'FILE_VIEW_FLUSH_BATCH', DEFAULT_FLUSH_BATCH)
+        self.dropped = 0
+        self._events = deque(maxlen=self.size)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def record(self, upload_id, student_id, viewed_at=None):
+        with self._lock:
+            if len(self._events) == self.size:
+                self.dropped += 1  # The oldest event falls off the ring
+            self._events.append((upload_id, student_id, viewed_at or timezone.now()))
+            due = len(self._events) >= self.flush_batch
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='file-view-flush', daemon=True)
+                self._thread.start()
+        if due:
+            self._wake.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._events)
+
+    def drain(self):
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+        return events
+
+    def flush(self):
+        """Write everything buffered so far. Returns the number of events written."""
+        events = self.drain()
+        if not events:
+            return 0
+        try:
+            return write_events(events)
+        except Exception as e:
+            logger.error(f"Dropping {len(events)} file view events: {str(e)}", exc_info=True)
+            return 0
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+def write_events(events):
+    """Append ``events`` to FileViewEvent and roll them up into FileViewStat, in one transaction"""
+    from teacher.models import Upload
+    from .models import FileViewEvent, FileViewStat, Student
+
+    # Uploads or students deleted since the view was recorded are skipped
+    upload_ids = set(Upload.objects.filter(id__in={e[0] for e in events}).values_list('id', flat=True))
+    student_ids = set(Student.objects.filter(id__in={e[1] for e in events}).values_list('id', flat=True))
+    events = [e for e in events if e[0] in upload_ids and e[1] in student_ids]
+    if not events:
+        return 0
+
+    rollup = defaultdict(lambda: [0, None, None])
+    for upload_id, student_id, viewed_at in events:
+        entry = rollup[upload_id, student_id]
+        entry[0] += 1
+        entry[1] = viewed_at if entry[1] is None else min(entry[1], viewed_at)
+        entry[2] = viewed_at if entry[2] is None else max(entry[2], viewed_at)
+
+    with write_transaction():
+        FileViewEvent.objects.bulk_create(
+            [FileViewEvent(upload_id=u, student_id=s, viewed_at=at) for u, s, at in events],
+            batch_size=DEFAULT_FLUSH_BATCH,
+        )
+        FileViewStat.objects.bulk_create(
+            [FileViewStat(upload_id=u, student_id=s, first_viewed_at=first, last_viewed_at=last)
+             for (u, s), (_, first, last) in rollup.items()],
+            batch_size=DEFAULT_FLUSH_BATCH,
+            ignore_conflicts=True,
+        )
+        for (upload_id, student_id), (count, first, last) in rollup.items():
+            FileViewStat.objects.filter(upload_id=upload_id, student_id=student_id).update(
+                view_count=F('view_count') + count,
+                first_viewed_at=Least(F('first_viewed_at'), Value(first)),
+                last_viewed_at=Greatest(F('last_viewed_at'), Value(last)),
+            )
+    return len(events)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """The process-wide view buffer, created on first use"""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = ViewBuffer()
+            atexit.register(_buffer.flush)
+        return _buffer
+
+
+def record_view(upload, student):
+    """Note that ``student`` opened ``upload``; never touches the database"""
+    if not getattr(settings, 'FILE_VIEW_TRACKING', True):
+        return
+    try:
+        get_buffer().record(upload.pk, student.pk)
+    except Exception as e:
+        logger.error(f"Could not record view of upload {upload.pk}: {str(e)}")
+
+
+def open_summary(upload):
+    """How many of the students who can see ``upload`` have opened it, and who"""
+    from .models import FileViewStat
+    from .visibility import upload_audience
+
+    audience = upload_audience(upload)
+    stats = (
+        FileViewStat.objects.filter(upload=upload, student__in=audience)
+        .select_related('student').order_by('-last_viewed_at')
+    )
+    students = [{
+        'student_id': stat.student_id,
+        'name': stat.student.name,
+        'student_code': stat.student.student_code,
+        'view_count': stat.view_count,
+        'first_viewed_at': stat.first_viewed_at.isoformat(),
+        'last_viewed_at': stat.last_viewed_at.isoformat(),
+    } for stat in stats]
+    return {
+        'opened': len(students),
+        'audience': audience.count(),
+        'students': students,
+    }
@@ -1,9 +1,13 @@
 from django.urls import path
+
+from core.decorators import READ_ONLY, default_transaction_policy
 from . import views
 
 app_name = 'student'
 
-urlpatterns = [
+# Student pages only read; views that write declare their own policy
+urlpatterns = default_transaction_policy(READ_ONLY, [
     path('received/', views.received_files, name='received_files'),
     path('view/<int:file_id>/', views.view_file, name='view_file'),
-]
\ No newline at end of file
+    path('search/', views.search_files, name='search_files'),
+])
@@ -13,8 +13,12 @@ from django.http import FileResponse, HttpResponse, HttpResponseForbidden, JsonR
 from django.views.static import serve
 from django.conf import settings
 from teacher.models import Upload, Batch
+from teacher.search import search_uploads
+from core.backends import get_student
+from core.decorators import autocommit_view
 from .models import Student
 from .decorators import prevent_pdf_download
+from .tracking import record_view
 
 # Configure logging
 log_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -30,6 +34,14 @@ if not logger.handlers:
     logger.addHandler(file_handler)
     logger.setLevel(logging.DEBUG)
 
+def _accessible_uploads(student, current_date):
+    """Uploads a student can see: their batch or shared directly, and not expired"""
+    return Upload.objects.select_related('teacher', 'batch', 'document').filter(
+        Q(batch=student.batch) | Q(shared_with=student),
+        is_active=True,
+        to_date__gte=current_date  # Only check if the file hasn't expired yet
+    ).defer('document__text').distinct().order_by('-uploaded_at')
+
 @login_required
 def view_file(request, file_id):
     """View file in browser without download option"""
@@ -93,7 +105,7 @@ def view_file(request, file_id):
         # Check if student has access to this file
         if user_role == "Student":
             try:
-                student = Student.objects.get(user=request.user)
+                student = request.user.student  # Preloaded by the auth backend
                 logger.info(f"Student: {student.name}, Batch: {student.batch}")
                 
                 # Check if file is accessible by student
@@ -131,6 +143,8 @@ def view_file(request, file_id):
         response['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
         response['Access-Control-Allow-Headers'] = 'Content-Type, X-Requested-With, Range'
         
+        if user_role == "Student":
+            record_view(file, student)  # Buffered; flushed off the request path
         logger.info(f"Successfully serving file ID: {file_id} to user: {request.user.username}")
         return response
         
@@ -154,6 +168,7 @@ def view_file(request, file_id):
         return redirect('student:received_files')
 
 @login_required
+@autocommit_view
 def received_files(request):
     logger.info("\n=== Starting received_files view ===")
     
@@ -192,23 +207,27 @@ def received_files(request):
     
     files = []
     try:
-        # Get or create student profile with transaction
-        with transaction.atomic():
-            student, created = Student.objects.get_or_create(
-                user=request.user,
-                defaults={
-                    'student_code': getattr(request.user, 'batchcode', None) or f'STU{request.user.id}',
-                    'name': request.user.get_full_name() or request.user.username
-                }
-            )
-            if created:
-                logger.info(f"Created new student profile for {request.user.username}")
-            logger.info(f"Using student profile: {student.name} ({student.student_code})")
+        # The auth backend preloads the profile; create it only when missing
+        student = get_student(request.user)
+        if student is None:
+            with transaction.atomic():
+                batch = request.user.batch
+                student, created = Student.objects.get_or_create(
+                    user=request.user,
+                    defaults={
+                        'student_code': batch.batch_code if batch else f'STU{request.user.id}',
+                        'name': request.user.get_full_name() or request.user.username,
+                        'batch': batch
+                    }
+                )
+                if created:
+                    logger.info(f"Created new student profile for {request.user.username}")
+        logger.info(f"Using student profile: {student.name} ({student.student_code})")
 
         # Get files based on role
         if user_role == "Admin":
             logger.info("Admin user - fetching all files")
-            files = Upload.objects.filter(is_active=True).select_related('teacher', 'batch')
+            files = Upload.objects.filter(is_active=True).select_related('teacher', 'batch', 'document').defer('document__text')
         else:
             # Verify student's batch assignment
             logger.info(f"""
@@ -231,11 +250,7 @@ def received_files(request):
             logger.info(f"Checking files for student {student.student_code} in batch {student.batch.batch_code}")
             
             # Get files accessible to this student with current date check
-            files = Upload.objects.select_related('teacher', 'batch').filter(
-                Q(batch=student.batch) | Q(shared_with=student),
-                is_active=True,
-                to_date__gte=current_date  # Only check if the file hasn't expired yet
-            ).distinct().order_by('-uploaded_at')
+            files = _accessible_uploads(student, current_date)
             
             logger.info(f"Files query: {files.query}")
             logger.info(f"Total files retrieved: {files.count()}")
@@ -278,6 +293,7 @@ def received_files(request):
                 # Check file availability and existence
                 file_exists = os.path.exists(file.file.path) if file.file else False
                 is_available = current_date <= file.to_date  # File is available until it expires
+                document = getattr(file, 'document', None)
                 
                 file_data = {
                     'id': file.id,
@@ -293,7 +309,9 @@ def received_files(request):
                         'from': file.from_date.strftime("%Y-%m-%d"),
                         'to': file.to_date.strftime("%Y-%m-%d")
                     },
-                    'file_exists': file_exists
+                    'file_exists': file_exists,
+                    'page_count': document.page_count if document else None,
+                    'page_sizes': document.page_sizes if document else [],
                 }
                 
                 files_by_subject[file.subject].append(file_data)
@@ -305,9 +323,6 @@ def received_files(request):
         # Convert to JSON for template
         files_data_json = json.dumps(files_by_subject)
         
-        # Create a hash of the current files data for comparison
-        files_data_hash = str(hash(files_data_json))
-        
         logger.info(f"Rendering template with {len(files)} files across {len(files_by_subject)} subjects")
         
         response = render(request, "student/received.html", {
@@ -315,7 +330,6 @@ def received_files(request):
             'files_data_json': files_data_json,
             'user_role': user_role,
             'timestamp': timezone.now().timestamp(),
-            'files_data_hash': files_data_hash,
         })
         
         # Add cache control headers
@@ -333,3 +347,47 @@ def received_files(request):
             'files_data_json': '{}',
             'user_role': user_role,
         })
+
+
+@login_required
+def search_files(request):
+    """Ranked full-text search over the files visible to the current user"""
+    user_role = request.user.role.role_name if hasattr(request.user, 'role') and request.user.role else None
+    if user_role not in ["Student", "Admin"]:
+        return JsonResponse({
+            'error': 'permission_denied',
+            'message': 'You do not have permission to search files.'
+        }, status=403)
+
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'query': query, 'results': []})
+
+    try:
+        limit = min(int(request.GET.get('limit', 20)), 100)
+    except ValueError:
+        limit = 20
+
+    current_date = timezone.now().date()
+    if user_role == "Admin":
+        visible = Upload.objects.filter(is_active=True).select_related('teacher', 'batch')
+    else:
+        student = get_student(request.user)
+        if student is None:
+            return JsonResponse({'query': query, 'results': []})
+        visible = _accessible_uploads(student, current_date)
+
+    results = []
+    for file in search_uploads(query, visible, limit=limit):
+        results.append({
+            'id': file.id,
+            'pdf_url': f"/student/view/{file.id}/" if file.file else None,
+            'title': f"{file.topic} - {file.sub_topic}" if file.sub_topic else file.topic,
+            'subject': file.subject,
+            'teacher': (file.teacher.get_full_name() or file.teacher.username) if file.teacher else 'Unknown Teacher',
+            'batch': file.batch.batch_code if file.batch else 'General',
+            'uploaded_at': file.uploaded_at.isoformat(),
+        })
+
+    logger.info(f"Search '{query}' by {request.user.username} returned {len(results)} files")
+    return JsonResponse({'query': query, 'results': results})
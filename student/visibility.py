@@ -0,0 +1,101 @@
+# student/visibility.py
+"""
+Which students can see an upload, expressed as event channels.
+
+A student sees an upload through their batch or through ``shared_with``.
+``notify_visibility_change`` pushes a ``files`` event to exactly those
+listeners whenever an upload appears, changes or goes away, so open
+``received`` pages can refresh without polling. It also bumps a version per
+channel, which keys per-student caches such as ``student_file_stats``.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from core.events import batch_channel, publish, user_channel
+from core.versions import bump_version, get_versions
+
+STUDENT_STATS_TIMEOUT = 60 * 60
+
+
+def upload_channels(upload):
+    """Channels of everyone who can currently see ``upload``"""
+    channels = []
+    if upload.batch_id:
+        channels.append(batch_channel(upload.batch_id))
+    if upload.pk:
+        user_ids = upload.shared_with.filter(user__isnull=False).values_list('user_id', flat=True)
+        channels.extend(user_channel(user_id) for user_id in user_ids)
+    return channels
+
+
+def upload_audience(upload):
+    """Students allowed to open ``upload``, as ``Upload.is_accessible_by_student`` decides"""
+    from .models import Student
+
+    if upload.shared_with.exists():
+        return upload.shared_with.all()
+    if upload.batch_id:
+        return Student.objects.filter(batch_id=upload.batch_id)
+    return Student.objects.all()
+
+
+def student_channels(student_ids):
+    """User channels for the given student ids"""
+    from .models import Student
+
+    user_ids = Student.objects.filter(id__in=student_ids, user__isnull=False).values_list('user_id', flat=True)
+    return [user_channel(user_id) for user_id in user_ids]
+
+
+def visibility_version_name(channel):
+    return f'visibility:{channel}'
+
+
+def notify_visibility_change(upload_id, action, channels):
+    """Tell ``channels`` that upload ``upload_id`` was added, updated or removed"""
+    channels = list(channels)
+
+    def bump():
+        for channel in set(channels):
+            bump_version(visibility_version_name(channel))
+
+    # After commit, so a reader cannot cache the old state under the new version
+    transaction.on_commit(bump)
+    publish(channels, 'files', {'upload_id': upload_id, 'action': action})
+
+
+def visible_uploads(student, on_date=None):
+    """Active, unexpired uploads ``student`` can see; may contain duplicates"""
+    from teacher.models import Upload
+
+    return Upload.objects.filter(
+        Q(batch_id=student.batch_id) | Q(shared_with=student),
+        is_active=True,
+        to_date__gte=on_date or timezone.localdate(),
+    )
+
+
+def student_file_stats(student):
+    """Files, sharing teachers and subjects visible to ``student``, cached.
+
+    The key carries the versions of the student's channels and today's date,
+    so a share, transfer or expiry all lead to a fresh count.
+    """
+    today = timezone.localdate()
+    user_version, batch_version = get_versions(
+        visibility_version_name(user_channel(student.user_id)),
+        visibility_version_name(batch_channel(student.batch_id)),
+    )
+    cache_key = f'student_file_stats:{student.pk}:{student.batch_id}:{user_version}:{batch_version}:{today}'
+    stats = cache.get(cache_key)
+    if stats is None:
+        # One grouped query; distinct counts absorb the OR join's duplicates
+        stats = visible_uploads(student, today).aggregate(
+            total_received_files=Count('id', distinct=True),
+            total_sharing_teachers=Count('teacher', distinct=True),
+            total_subjects=Count('subject', distinct=True),
+        )
+        cache.set(cache_key, stats, STUDENT_STATS_TIMEOUT)
+    return stats
@@ -1,14 +1,15 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR
+from django.db.models import Case, Value, When
 from .models import Batch, Upload
+from . import search
 
 @admin.register(Batch)
 class BatchAdmin(admin.ModelAdmin):
-    list_display = ('batch_code', 'name', 'get_student_count')
-    search_fields = ('batch_code', 'name')
-    
-    def get_student_count(self, obj):
-        return obj.students.count()
-    get_student_count.short_description = 'Number of Students'
+    list_display = ('batch_code', 'name', 'class_name', 'academic_year', 'branch', 'student_count', 'upload_count')
+    list_filter = ('academic_year', 'branch')
+    search_fields = ('batch_code', 'name', 'class_name')
+    readonly_fields = ('student_count', 'upload_count')
 
 @admin.register(Upload)
 class UploadAdmin(admin.ModelAdmin):
@@ -16,6 +17,20 @@ class UploadAdmin(admin.ModelAdmin):
     list_filter = ('is_active', 'subject', 'batch', 'uploaded_at')
     search_fields = ('topic', 'subject', 'teacher__username', 'batch__batch_code')
     date_hierarchy = 'uploaded_at'
+
+    def get_search_results(self, request, queryset, search_term):
+        # Use the FTS5 index when it is available instead of LIKE scans
+        if search_term and search.fts_available():
+            ids = [upload_id for upload_id, _ in search.ranked_upload_ids(search_term, within=queryset)]
+            results = queryset.filter(id__in=ids)
+            # Best match first, unless a column header was clicked
+            if ORDER_VAR not in request.GET:
+                results = results.order_by(Case(
+                    *[When(id=upload_id, then=Value(position)) for position, upload_id in enumerate(ids)],
+                    default=Value(len(ids)),
+                ))
+            return results, False
+        return super().get_search_results(request, queryset, search_term)
     
     def get_form(self, request, obj=None, **kwargs):
         form = super().get_form(request, obj, **kwargs)
@@ -0,0 +1,57 @@
+# teacher/counters.py
+"""
+Denormalised per-batch counters (``Batch.student_count`` / ``upload_count``).
+
+Every change goes through a single ``UPDATE ... SET n = n + delta`` so
+concurrent writers cannot lose updates. The signal handlers in
+``student/signals.py`` and ``teacher/signals.py`` call these for single-row
+changes; bulk paths call them directly. ``manage.py reconcile_counters``
+recomputes everything from scratch.
+"""
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from core.versions import bump_version_on_commit
+
+BATCH_SUMMARY_VERSION = 'batch_summary'
+
+
+def adjust_student_count(batch_id, delta):
+    from .models import Batch
+
+    if batch_id is None or not delta:
+        return
+    Batch.objects.filter(id=batch_id).update(student_count=F('student_count') + delta)
+    bump_version_on_commit(BATCH_SUMMARY_VERSION)
+
+
+def adjust_upload_count(batch_id, delta):
+    from .models import Batch
+
+    if batch_id is None or not delta:
+        return
+    Batch.objects.filter(id=batch_id).update(upload_count=F('upload_count') + delta)
+    bump_version_on_commit(BATCH_SUMMARY_VERSION)
+
+
+def reconcile_batch_counters():
+    """Recompute every batch's counters. Returns the number of batches corrected."""
+    from .models import Batch, Upload
+    from student.models import Student
+
+    students = Student.objects.filter(batch=OuterRef('pk')).values('batch').annotate(n=Count('id')).values('n')
+    uploads = Upload.objects.filter(batch=OuterRef('pk')).values('batch').annotate(n=Count('id')).values('n')
+    actual = Batch.objects.annotate(
+        actual_students=Coalesce(Subquery(students), Value(0)),
+        actual_uploads=Coalesce(Subquery(uploads), Value(0)),
+    ).exclude(student_count=F('actual_students'), upload_count=F('actual_uploads'))
+
+    corrected = 0
+    for batch in actual.only('id', 'student_count', 'upload_count'):
+        Batch.objects.filter(id=batch.id).update(
+            student_count=batch.actual_students, upload_count=batch.actual_uploads
+        )
+        corrected += 1
+    if corrected:
+        bump_version_on_commit(BATCH_SUMMARY_VERSION)
+    return corrected
@@ -0,0 +1,387 @@
+# teacher/extraction.py
+"""
+Text and metadata extraction for uploaded files.
+
+Extraction runs off the request path: ``schedule_extraction`` hands the file
+to a process pool once the upload is committed, and the result is stored in
+``UploadDocument``. Work is keyed by the SHA-256 of the file contents, so
+re-running is a no-op for unchanged files and identical files that were
+uploaded twice are only parsed once, whether they arrive through an upload,
+a replaced file or the backfill. ``manage.py extract_documents`` backfills
+existing uploads.
+
+The worker functions (``hash_file``, ``extract_document``) only touch the file
+system, never the database, so they are safe to run in a child process.
+Their results are written by a thread of this process (``ResultWriter``),
+which waits its turn for the write slot and retries while the write queue
+is busy; a result it still cannot write leaves the upload ``pending`` for
+``extract_documents`` to pick up.
+"""
+import hashlib
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import zipfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree import ElementTree
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from core.writer import WriterBusy, write_transaction
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+RESULT_RETRIES = 5  # Busy replies from the write queue before a result is left pending
+
+DOCX_NS = {
+    'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main',
+    'dc': 'http://purl.org/dc/elements/1.1/',
+    'ep': 'http://schemas.openxmlformats.org/officeDocument/2006/extended-properties',
+}
+
+ENGLISH_STOPWORDS = frozenset(
+    'the and of to in is that for it as with on are be this by an or from at which'.split()
+)
+
+
+class ExtractionUnsupported(Exception):
+    """The file type cannot be extracted in this environment"""
+
+
+def hash_file(path):
+    """SHA-256 of the file contents, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _summarise_sizes(sizes):
+    """Collapse per-page (width, height) pairs into distinct sizes with page counts"""
+    counts = Counter((round(w, 1), round(h, 1)) for w, h in sizes)
+    return [{'width': w, 'height': h, 'pages': n} for (w, h), n in counts.most_common()]
+
+
+def detect_language(text):
+    """Best-effort ISO 639-1 code for ``text`` ('' when unsure)"""
+    sample = (text or '')[:5000]
+    if not sample.strip():
+        return ''
+    try:
+        from langdetect import detect
+        return detect(sample)
+    except ImportError:
+        pass
+    except Exception:
+        return ''
+
+    # Fallback: dominant script, then English stopword ratio for Latin text
+    if len(re.findall(r'[\u0B80-\u0BFF]', sample)) > len(sample) * 0.2:
+        return 'ta'
+    if len(re.findall(r'[\u0900-\u097F]', sample)) > len(sample) * 0.2:
+        return 'hi'
+    words = re.findall(r'[a-z]+', sample.lower())
+    if words and sum(w in ENGLISH_STOPWORDS for w in words) / len(words) > 0.05:
+        return 'en'
+    return ''
+
+
+def _extract_pdf(path):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise ExtractionUnsupported("pypdf is not installed")
+
+    reader = PdfReader(path)
+    sizes = []
+    texts = []
+    for page in reader.pages:
+        box = page.mediabox
+        width, height = float(box.width), float(box.height)
+        if (page.get('/Rotate') or 0) % 180:
+            width, height = height, width
+        sizes.append((width, height))
+        try:
+            texts.append(page.extract_text() or '')
+        except Exception as e:
+            logger.warning(f"Could not extract text from a page of {path}: {str(e)}")
+    metadata = reader.metadata
+    return {
+        'page_count': len(reader.pages),
+        'page_sizes': _summarise_sizes(sizes),
+        'title': (metadata.title or '') if metadata else '',
+        'text': '\n'.join(texts),
+    }
+
+
+def _extract_docx(path):
+    with zipfile.ZipFile(path) as archive:
+        names = set(archive.namelist())
+        document = ElementTree.fromstring(archive.read('word/document.xml'))
+
+        paragraphs = []
+        for paragraph in document.iter(f"{{{DOCX_NS['w']}}}p"):
+            runs = [node.text or '' for node in paragraph.iter(f"{{{DOCX_NS['w']}}}t")]
+            if runs:
+                paragraphs.append(''.join(runs))
+
+        # Page sizes are declared per section, in twentieths of a point
+        sizes = []
+        for size in document.iter(f"{{{DOCX_NS['w']}}}pgSz"):
+            width = size.get(f"{{{DOCX_NS['w']}}}w")
+            height = size.get(f"{{{DOCX_NS['w']}}}h")
+            if width and height:
+                sizes.append((int(width) / 20, int(height) / 20))
+
+        title = ''
+        if 'docProps/core.xml' in names:
+            core = ElementTree.fromstring(archive.read('docProps/core.xml'))
+            node = core.find('dc:title', DOCX_NS)
+            title = (node.text or '') if node is not None else ''
+
+        # Word records the page count of the last render in app.xml
+        page_count = None
+        if 'docProps/app.xml' in names:
+            app = ElementTree.fromstring(archive.read('docProps/app.xml'))
+            node = app.find('ep:Pages', DOCX_NS)
+            if node is not None and (node.text or '').isdigit():
+                page_count = int(node.text)
+
+    return {
+        'page_count': page_count,
+        'page_sizes': _summarise_sizes(sizes),
+        'title': title,
+        'text': '\n'.join(paragraphs),
+    }
+
+
+EXTRACTORS = {
+    '.pdf': _extract_pdf,
+    '.docx': _extract_docx,
+}
+
+
+def extract_document(path):
+    """Extract text and metadata from ``path``.
+
+    Returns a dict with ``content_hash``, ``status`` and, on success, the
+    extracted fields. Never raises, so it can be mapped over a process pool.
+    """
+    result = {'path': path}
+    try:
+        result['content_hash'] = hash_file(path)
+        extractor = EXTRACTORS.get(os.path.splitext(path)[1].lower())
+        if extractor is None:
+            raise ExtractionUnsupported(f"No extractor for {os.path.splitext(path)[1] or 'files without an extension'}")
+        data = extractor(path)
+        max_chars = getattr(settings, 'DOCUMENT_TEXT_MAX_CHARS', 200_000)
+        data['text'] = data['text'].replace('\x00', '')[:max_chars]
+        data['language'] = detect_language(data['text'])
+        result.update(data, status='done')
+    except ExtractionUnsupported as e:
+        result.update(status='unsupported', error=str(e))
+    except Exception as e:
+        result.update(status='failed', error=f"{type(e).__name__}: {str(e)}")
+    return result
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(max_workers=None):
+    """Process pool shared by the request path and the backfill command"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = max_workers or getattr(settings, 'DOCUMENT_EXTRACTION_WORKERS', 2)
+            _executor = ProcessPoolExecutor(max_workers=workers)
+        return _executor
+
+
+def find_reusable(content_hash):
+    """A finished extraction of the same content, from any upload"""
+    from .models import UploadDocument
+
+    return UploadDocument.objects.filter(content_hash=content_hash, status='done').first()
+
+
+def store_result(upload_id, result, retries=0):
+    """Persist an ``extract_document`` result and refresh the search index
+
+    A busy write queue is waited out ``retries`` times, sleeping for its
+    Retry-After in between, before ``WriterBusy`` is raised.
+    """
+    from .models import Upload, UploadDocument
+    from . import search
+
+    upload = Upload.objects.select_related('teacher').filter(id=upload_id).first()
+    if upload is None:
+        logger.info(f"Upload {upload_id} was deleted before extraction finished")
+        return None
+
+    fields = {
+        'content_hash': result.get('content_hash', ''),
+        'status': result['status'],
+        'page_count': result.get('page_count'),
+        'page_sizes': result.get('page_sizes', []),
+        'title': (result.get('title') or '')[:255],
+        'language': result.get('language', ''),
+        'text': result.get('text', ''),
+        'error': result.get('error', ''),
+        'extracted_at': timezone.now(),
+    }
+    for attempt in range(retries + 1):
+        try:
+            with write_transaction():
+                document, _ = UploadDocument.objects.update_or_create(upload=upload, defaults=fields)
+                search.index_upload(upload)
+            break
+        except WriterBusy as e:
+            if attempt == retries:
+                raise
+            logger.info(f"Write queue busy; storing extraction for upload {upload_id} again in {e.retry_after}s")
+            time.sleep(e.retry_after)
+
+    if document.status == 'done':
+        logger.info(f"Extracted {document.page_count} pages from upload {upload_id} ({document.language or 'unknown language'})")
+    else:
+        logger.warning(f"Extraction {document.status} for upload {upload_id}: {document.error}")
+    return document
+
+
+def copy_result(upload_id, source, retries=0):
+    """Reuse a finished extraction of identical content"""
+    return store_result(upload_id, {
+        'content_hash': source.content_hash,
+        'status': source.status,
+        'page_count': source.page_count,
+        'page_sizes': source.page_sizes,
+        'title': source.title,
+        'language': source.language,
+        'text': source.text,
+    }, retries=retries)
+
+
+def needs_extraction(upload, content_hash):
+    """False when this upload already has a finished result for this content"""
+    document = getattr(upload, 'document', None)
+    return not (document and document.status == 'done' and document.content_hash == content_hash)
+
+
+class ResultWriter:
+    """Stores pool results from a thread of its own, created on first use
+
+    Done-callbacks run on the pool's management thread, which must not wait
+    for the write slot, so they only queue the result here.
+    """
+
+    def __init__(self, retries=RESULT_RETRIES):
+        self.retries = retries
+        self._results = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def put(self, upload_id, result):
+        self._results.put((upload_id, result))
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='extraction-results', daemon=True)
+                self._thread.start()
+
+    def pending(self):
+        return self._results.qsize()
+
+    def write(self, upload_id, result):
+        """Store one result; never raises, so the thread keeps going"""
+        close_old_connections()
+        try:
+            store_result(upload_id, result, retries=self.retries)
+        except WriterBusy:
+            logger.error(f"Write queue stayed busy; upload {upload_id} is left pending for extract_documents")
+        except Exception as e:
+            logger.error(f"Error storing extraction for upload {upload_id}: {str(e)}", exc_info=True)
+        finally:
+            close_old_connections()
+
+    def _run(self):
+        while True:
+            self.write(*self._results.get())
+
+
+_result_writer = None
+_result_writer_lock = threading.Lock()
+
+
+def get_result_writer():
+    """The process-wide result writer"""
+    global _result_writer
+    with _result_writer_lock:
+        if _result_writer is None:
+            _result_writer = ResultWriter()
+        return _result_writer
+
+
+def _on_extracted(upload_id):
+    def callback(future):
+        try:
+            result = future.result()
+        except Exception as e:
+            # The worker died or the pool shut down; record it rather than leave the upload pending
+            logger.error(f"Extraction of upload {upload_id} did not finish: {str(e)}")
+            result = {'status': 'failed', 'error': f"{type(e).__name__}: {str(e)}"}
+        get_result_writer().put(upload_id, result)
+    return callback
+
+
+def schedule_extraction(upload):
+    """Queue extraction for ``upload`` once the current transaction commits
+
+    Unchanged content is skipped and content already extracted for another
+    upload is copied, so only new files reach the process pool. A caller
+    that already hashed the file sets ``upload._content_hash`` so the commit
+    hook, which still runs inside the write slot, does not read it again.
+    """
+    if not upload.file:
+        return
+    upload_id = upload.pk
+    path = upload.file.path
+    # Set by callers that hashed the file before their transaction; only good for this save
+    known_hash = upload.__dict__.pop('_content_hash', None)
+
+    def submit():
+        from .models import Upload, UploadDocument
+
+        try:
+            content_hash = known_hash or hash_file(path)
+        except OSError as e:
+            logger.error(f"Could not read the file of upload {upload_id}: {str(e)}")
+            return
+        current = Upload.objects.select_related('document').filter(id=upload_id).first()
+        if current is None or not needs_extraction(current, content_hash):
+            return
+        reusable = find_reusable(content_hash)
+        if reusable is not None:
+            copy_result(upload_id, reusable)
+            return
+
+        UploadDocument.objects.update_or_create(upload_id=upload_id, defaults={'status': 'pending'})
+        if not getattr(settings, 'DOCUMENT_EXTRACTION_ASYNC', True):
+            store_result(upload_id, extract_document(path))
+            return
+        try:
+            future = get_executor().submit(extract_document, path)
+        except Exception as e:
+            logger.error(f"Could not queue extraction for upload {upload_id}: {str(e)}", exc_info=True)
+            return
+        future.add_done_callback(_on_extracted(upload_id))
+
+    transaction.on_commit(submit)
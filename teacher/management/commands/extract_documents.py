@@ -0,0 +1,83 @@
+# teacher/management/commands/extract_documents.py
+import os
+from concurrent.futures import as_completed
+
+from django.core.management.base import BaseCommand
+
+from core.writer import WriterBusy
+from teacher import extraction
+from teacher.models import Upload
+
+
+class Command(BaseCommand):
+    help = (
+        "Extract text and page metadata for existing uploads. Safe to re-run: "
+        "uploads whose content hash already has a finished extraction are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Re-extract even if a result exists")
+        parser.add_argument('--workers', type=int, default=None, help="Size of the process pool")
+        parser.add_argument('--batch-size', type=int, default=50, help="Uploads submitted to the pool at a time")
+
+    def handle(self, *args, **options):
+        force = options['force']
+        batch_size = max(1, options['batch_size'])
+        self.workers = options['workers']
+
+        uploads = Upload.objects.filter(file__startswith='uploads/').select_related('document').order_by('id')
+        stats = {'extracted': 0, 'reused': 0, 'skipped': 0, 'missing': 0, 'failed': 0, 'busy': 0}
+
+        batch = []
+        for upload in uploads.iterator(chunk_size=batch_size):
+            path = upload.file.path
+            if not os.path.exists(path):
+                stats['missing'] += 1
+                continue
+
+            content_hash = extraction.hash_file(path)
+            if not force and not extraction.needs_extraction(upload, content_hash):
+                stats['skipped'] += 1
+                continue
+
+            reusable = None if force else extraction.find_reusable(content_hash)
+            if reusable is not None:
+                try:
+                    extraction.copy_result(upload.id, reusable, retries=extraction.RESULT_RETRIES)
+                    stats['reused'] += 1
+                except WriterBusy:
+                    self._busy(upload.id, stats)
+                continue
+
+            batch.append((upload.id, path))
+            if len(batch) >= batch_size:
+                self._run_batch(batch, stats)
+                batch = []
+
+        if batch:
+            self._run_batch(batch, stats)
+
+        self.stdout.write(self.style.SUCCESS(
+            "Extraction finished: " + ", ".join(f"{key}={value}" for key, value in stats.items())
+        ))
+
+    def _run_batch(self, batch, stats):
+        executor = extraction.get_executor(self.workers)
+        futures = {executor.submit(extraction.extract_document, path): upload_id for upload_id, path in batch}
+        for future in as_completed(futures):
+            upload_id = futures[future]
+            try:
+                document = extraction.store_result(upload_id, future.result(), retries=extraction.RESULT_RETRIES)
+            except WriterBusy:
+                self._busy(upload_id, stats)
+                continue
+            if document is not None and document.status == 'done':
+                stats['extracted'] += 1
+            else:
+                stats['failed'] += 1
+            self.stdout.write(f"  upload {upload_id}: {document.status if document else 'deleted'}")
+
+    def _busy(self, upload_id, stats):
+        # Not stored; the next run picks the upload up again
+        stats['busy'] += 1
+        self.stderr.write(f"  upload {upload_id}: write queue busy, not stored")
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+from teacher.search import CREATE_FTS_SQL, DROP_FTS_SQL, FTS_TABLE
+
+
+def create_fts_index(apps, schema_editor):
+    """Create and backfill the FTS5 index (SQLite only)"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    user_table = apps.get_model('core', 'User')._meta.db_table
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(CREATE_FTS_SQL)
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} "
+            f"(rowid, topic, sub_topic, description, subject, teacher_name, body) "
+            f"SELECT u.id, u.topic, COALESCE(u.sub_topic, ''), COALESCE(u.description, ''), u.subject, "
+            f"COALESCE(NULLIF(TRIM(t.first_name || ' ' || t.last_name), ''), t.username, ''), '' "
+            f"FROM teacher_upload u LEFT JOIN {user_table} t ON t.id = u.teacher_id"
+        )
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(DROP_FTS_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teacher', '0005_alter_upload_to_date'),
+        ('core', '0004_batchcode_password_batchcode_username'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teacher', '0006_upload_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(db_index=True, max_length=64)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed'), ('unsupported', 'Unsupported')], default='pending', max_length=20)),
+                ('page_count', models.PositiveIntegerField(blank=True, null=True)),
+                ('page_sizes', models.JSONField(blank=True, default=list)),
+                ('title', models.CharField(blank=True, default='', max_length=255)),
+                ('language', models.CharField(blank=True, default='', max_length=10)),
+                ('text', models.TextField(blank=True, default='')),
+                ('error', models.TextField(blank=True, default='')),
+                ('extracted_at', models.DateTimeField(blank=True, null=True)),
+                ('upload', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='document', to='teacher.upload')),
+            ],
+        ),
+    ]
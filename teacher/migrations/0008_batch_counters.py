@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:47
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_existing(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    Batch = apps.get_model('teacher', 'Batch')
+    batches = Batch.objects.using(db_alias).annotate(
+        students_n=Count('students', distinct=True),
+        uploads_n=Count('uploads', distinct=True),
+    )
+    for batch in batches:
+        Batch.objects.using(db_alias).filter(id=batch.id).update(student_count=batch.students_n, upload_count=batch.uploads_n)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teacher', '0007_upload_document'),
+        ('student', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batch',
+            name='student_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='batch',
+            name='upload_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teacher', '0008_batch_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batch',
+            name='academic_year',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='batch',
+            name='branch',
+            field=models.CharField(blank=True, choices=[('Nehru nagar', 'Nehru nagar'), ('Gandhipuram', 'Gandhipuram')], default='', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='batch',
+            name='class_name',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='batch',
+            name='password',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='batch',
+            name='username',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+    ]
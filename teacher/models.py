@@ -4,18 +4,26 @@ from django.conf import settings
 from django.utils import timezone
 
 class Batch(models.Model):
+    BRANCH_CHOICES = (
+        ("Nehru nagar", "Nehru nagar"),
+        ("Gandhipuram", "Gandhipuram"),
+    )
+
     batch_code = models.CharField(max_length=50, unique=True)
     name = models.CharField(max_length=120, blank=True, null=True)
+    class_name = models.CharField(max_length=50, blank=True, default='')
+    academic_year = models.CharField(max_length=20, blank=True, default='')
+    branch = models.CharField(max_length=50, choices=BRANCH_CHOICES, blank=True, default='')
+    username = models.CharField(max_length=100, null=True, blank=True)
+    password = models.CharField(max_length=100, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Maintained by teacher/counters.py; see manage.py reconcile_counters
+    student_count = models.PositiveIntegerField(default=0)
+    upload_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.batch_code
 
-    @property
-    def student_count(self):
-        from student.models import Student
-        return Student.objects.filter(batch=self).count()
-
 class Upload(models.Model):
     teacher = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='uploads')
     teacher_code = models.CharField(max_length=50, blank=True, null=True)
@@ -37,6 +45,15 @@ class Upload(models.Model):
     def __str__(self):
         return f"{self.topic} ({self.subject})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so the batch counters can follow a batch change on save
+        instance._loaded_batch_id = instance.__dict__.get('batch_id')
+        # and so a replaced file is extracted again
+        instance._loaded_file_name = instance.__dict__.get('file')
+        return instance
+
     def is_shared_with_all(self):
         return self.shared_with.count() == 0
         
@@ -59,29 +76,36 @@ class Upload(models.Model):
             
             # If a batch is selected, only notify students in that batch
             if self.batch:
-                logger.info(f"Sending notifications to students in batch {self.batch.batch_code}")
-                batch_students = Student.objects.filter(batch=self.batch)
-                for student in batch_students:
-                    logger.info(f"Creating notification for batch student {student.student_code}")
-                    Notification.create_file_notification(
-                        user=student.user,
-                        subject=self.subject,
-                        topic=self.topic,
-                        teacher_name=teacher_name,
-                        batch_code=self.batch.batch_code,
-                        is_batch_upload=True
-                    )
+                user_ids = list(Student.objects.filter(
+                    batch=self.batch, user__isnull=False
+                ).values_list('user_id', flat=True))
+                Notification.create_file_notification(
+                    users=user_ids,
+                    subject=self.subject,
+                    topic=self.topic,
+                    teacher_name=teacher_name,
+                    batch_code=self.batch.batch_code,
+                    is_batch_upload=True,
+                    upload=self,
+                )
+                logger.info(f"Notified {len(user_ids)} students in batch {self.batch.batch_code} of upload {self.pk}")
             # If no batch is selected but specific students are shared with
             elif self.shared_with.exists():
-                for student in self.shared_with.all():
-                    logger.info(f"Creating notification for specifically shared student {student.student_code}")
+                # One body per batch code, since the message names the student's batch
+                users_by_batch = {}
+                for user_id, batch_code in self.shared_with.filter(
+                    user__isnull=False
+                ).values_list('user_id', 'batch__batch_code'):
+                    users_by_batch.setdefault(batch_code, []).append(user_id)
+                for batch_code, user_ids in users_by_batch.items():
                     Notification.create_file_notification(
-                        user=student.user,
+                        users=user_ids,
                         subject=self.subject,
                         topic=self.topic,
                         teacher_name=teacher_name,
-                        batch_code=student.batch.batch_code if student.batch else None,
-                        is_batch_upload=False
+                        batch_code=batch_code,
+                        is_batch_upload=False,
+                        upload=self,
                     )
 
     def is_accessible_by_student(self, student):
@@ -131,4 +155,28 @@ class Upload(models.Model):
 
         except Exception as e:
             logger.exception(f"Error checking file accessibility: {str(e)}")
-            return False
\ No newline at end of file
+            return False
+
+class UploadDocument(models.Model):
+    """Text and metadata extracted from an uploaded file (see teacher/extraction.py)"""
+    STATUS_CHOICES = (
+        ("pending", "Pending"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+        ("unsupported", "Unsupported"),
+    )
+
+    upload = models.OneToOneField(Upload, on_delete=models.CASCADE, related_name='document')
+    content_hash = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    page_count = models.PositiveIntegerField(null=True, blank=True)
+    # Distinct page sizes in points: [{"width": 595.3, "height": 841.9, "pages": 12}, ...]
+    page_sizes = models.JSONField(default=list, blank=True)
+    title = models.CharField(max_length=255, blank=True, default='')
+    language = models.CharField(max_length=10, blank=True, default='')
+    text = models.TextField(blank=True, default='')
+    error = models.TextField(blank=True, default='')
+    extracted_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.upload} [{self.status}]"
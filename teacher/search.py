@@ -0,0 +1,191 @@
+# teacher/search.py
+"""
+Full-text search over uploads.
+
+On SQLite the index is an FTS5 virtual table keyed by the upload id (the
+FTS ``rowid``). It is kept in step with ``Upload`` by the signal handlers in
+``teacher/signals.py``; other database backends fall back to ``icontains``.
+"""
+import logging
+import re
+
+from django.db import connection, OperationalError
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'teacher_upload_fts'
+
+# Column weights for bm25(): topic matches rank above a hit in the body text.
+FTS_COLUMNS = ('topic', 'sub_topic', 'description', 'subject', 'teacher_name', 'body')
+FTS_WEIGHTS = (10.0, 5.0, 2.0, 4.0, 3.0, 1.0)
+
+# Upper bound on FTS hits returned by one query
+MAX_FTS_HITS = 500
+
+CREATE_FTS_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    + ", ".join(FTS_COLUMNS)
+    + ", tokenize='unicode61 remove_diacritics 2')"
+)
+DROP_FTS_SQL = f"DROP TABLE IF EXISTS {FTS_TABLE}"
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+_fts_ready = False
+
+
+def fts_available():
+    """True when the default database is SQLite and the FTS table exists"""
+    global _fts_ready
+    if connection.vendor != 'sqlite':
+        return False
+    # Only a positive answer is cached: the table can appear after a migrate
+    if not _fts_ready:
+        _fts_ready = FTS_TABLE in connection.introspection.table_names()
+    return _fts_ready
+
+
+def build_match_query(text):
+    """Turn free text into a safe FTS5 MATCH expression.
+
+    Every word is quoted so user input can never be parsed as FTS syntax,
+    and the last word gets a prefix match so search-as-you-type works.
+    """
+    tokens = _TOKEN_RE.findall(text or '')
+    if not tokens:
+        return ''
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _teacher_name(upload):
+    if not upload.teacher:
+        return ''
+    return upload.teacher.get_full_name() or upload.teacher.username
+
+
+def _document_text(upload):
+    """Extracted document text for the body column (empty until extracted)"""
+    from .models import UploadDocument
+
+    text = UploadDocument.objects.filter(
+        upload_id=upload.pk, status='done'
+    ).values_list('text', flat=True).first()
+    return text or ''
+
+
+def index_upload(upload):
+    """Insert or refresh the FTS row for a single upload"""
+    if not fts_available():
+        return
+    values = [
+        upload.topic or '',
+        upload.sub_topic or '',
+        upload.description or '',
+        upload.subject or '',
+        _teacher_name(upload),
+        _document_text(upload),
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [upload.pk])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) "
+            f"VALUES (%s, {', '.join(['%s'] * len(FTS_COLUMNS))})",
+            [upload.pk, *values],
+        )
+
+
+def reindex_teacher(teacher_id, name):
+    """Rewrite the teacher name on every indexed upload by ``teacher_id``"""
+    from .models import Upload
+
+    if not fts_available():
+        return
+    uploads, params = Upload.objects.filter(teacher_id=teacher_id).values('id').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"UPDATE {FTS_TABLE} SET teacher_name = %s WHERE rowid IN ({uploads})", [name, *params])
+
+
+def remove_upload(upload_id):
+    """Drop the FTS row for a deleted upload"""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [upload_id])
+
+
+def rebuild_index():
+    """Re-index every upload from scratch. Returns the number of rows indexed."""
+    from .models import Upload
+
+    if not fts_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    count = 0
+    for upload in Upload.objects.select_related('teacher').iterator(chunk_size=200):
+        index_upload(upload)
+        count += 1
+    return count
+
+
+def ranked_upload_ids(text, limit=MAX_FTS_HITS, within=None):
+    """Return ``[(upload_id, rank), ...]`` best match first.
+
+    Lower bm25() scores are better, so the rank is returned as-is and the
+    list is already ordered by it. ``within`` is an Upload queryset the hits
+    must belong to; it is applied inside the FTS query, so ``limit`` counts
+    only uploads the caller may see.
+    """
+    match = build_match_query(text)
+    if not match or not fts_available():
+        return []
+    weights = ', '.join(str(w) for w in FTS_WEIGHTS)
+    restrict, params = '', []
+    if within is not None:
+        uploads, params = within.order_by().values('id').query.sql_with_params()
+        restrict = f" AND rowid IN ({uploads})"
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, bm25({FTS_TABLE}, {weights}) AS rank "
+                f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s{restrict} "
+                f"ORDER BY rank LIMIT %s",
+                [match, *params, limit],
+            )
+            return cursor.fetchall()
+    except OperationalError as e:
+        logger.warning(f"FTS query failed for {match!r}: {str(e)}")
+        return []
+
+
+def search_uploads(text, queryset, limit=50):
+    """Search ``queryset`` (already restricted to what the caller may see).
+
+    Returns a list of uploads ordered by relevance. Without FTS5 this falls
+    back to a plain ``icontains`` filter ordered by upload date.
+    """
+    from django.db.models import Q
+
+    text = (text or '').strip()
+    if not text:
+        return []
+
+    if not fts_available():
+        filters = Q()
+        for token in _TOKEN_RE.findall(text):
+            filters &= (
+                Q(topic__icontains=token) | Q(sub_topic__icontains=token) |
+                Q(description__icontains=token) | Q(subject__icontains=token) |
+                Q(teacher__first_name__icontains=token) | Q(teacher__last_name__icontains=token)
+            )
+        return list(queryset.filter(filters).order_by('-uploaded_at')[:limit])
+
+    ranked = ranked_upload_ids(text, limit=limit, within=queryset)
+    if not ranked:
+        return []
+    rank_by_id = dict(ranked)
+    visible = queryset.filter(id__in=rank_by_id.keys())
+    return sorted(visible, key=lambda upload: rank_by_id[upload.id])
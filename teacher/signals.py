@@ -0,0 +1,158 @@
+# teacher/signals.py
+import logging
+
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import counters, extraction, search
+from core.counters import adjust_dashboard_stats
+from core.events import batch_channel, user_channel
+from core.versions import bump_version_on_commit
+from student import visibility
+from .models import Batch, Upload
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Upload)
+def index_saved_upload(sender, instance, raw=False, **kwargs):
+    """Keep the full-text index in step with the upload row"""
+    if raw:
+        return
+    try:
+        search.index_upload(instance)
+    except Exception as e:
+        logger.error(f"Error indexing upload {instance.pk}: {str(e)}", exc_info=True)
+
+
+@receiver(post_save, sender=Upload)
+def count_saved_upload(sender, instance, created=False, raw=False, **kwargs):
+    """Keep Batch.upload_count and the dashboard total in step with uploads"""
+    if raw:
+        return
+    if created:
+        adjust_dashboard_stats(total_sent_files=1)
+        old_batch_id = None
+    elif hasattr(instance, '_loaded_batch_id'):
+        old_batch_id = instance._loaded_batch_id
+    else:
+        return  # Previous batch unknown; reconcile_counters will catch any drift
+    if old_batch_id != instance.batch_id:
+        counters.adjust_upload_count(old_batch_id, -1)
+        counters.adjust_upload_count(instance.batch_id, 1)
+    instance._loaded_batch_id = instance.batch_id
+
+
+@receiver(post_save, sender=Upload)
+def extract_saved_upload(sender, instance, created=False, raw=False, **kwargs):
+    """Pull text and page metadata from new or replaced files in the background"""
+    if raw:
+        return
+    file_name = instance.file.name if instance.file else None
+    if not created and getattr(instance, '_loaded_file_name', None) == file_name:
+        return
+    instance._loaded_file_name = file_name
+    extraction.schedule_extraction(instance)
+
+
+@receiver(post_delete, sender=Upload)
+def count_deleted_upload(sender, instance, **kwargs):
+    adjust_dashboard_stats(total_sent_files=-1)
+    counters.adjust_upload_count(getattr(instance, '_loaded_batch_id', instance.batch_id), -1)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def reindex_renamed_teacher(sender, instance, created=False, raw=False, **kwargs):
+    """Uploads are indexed under their teacher's name"""
+    if raw or created:
+        return
+    name = (instance.first_name, instance.last_name, instance.username)
+    if getattr(instance, '_loaded_name', None) == name:
+        return
+    instance._loaded_name = name
+    try:
+        search.reindex_teacher(instance.pk, instance.get_full_name() or instance.username)
+    except Exception as e:
+        logger.error(f"Error reindexing uploads of teacher {instance.pk}: {str(e)}", exc_info=True)
+
+
+@receiver(post_delete, sender=Upload)
+def unindex_deleted_upload(sender, instance, **kwargs):
+    try:
+        search.remove_upload(instance.pk)
+    except Exception as e:
+        logger.error(f"Error removing upload {instance.pk} from index: {str(e)}", exc_info=True)
+
+
+@receiver(pre_save, sender=Upload)
+def remember_visibility(sender, instance, raw=False, **kwargs):
+    # Captured before count_saved_upload moves _loaded_batch_id on
+    instance._batch_id_before_save = getattr(instance, '_loaded_batch_id', None)
+
+
+@receiver(post_save, sender=Upload)
+def push_saved_upload(sender, instance, created=False, raw=False, **kwargs):
+    """Tell the students who can see the upload that their file list changed"""
+    if raw:
+        return
+    channels = visibility.upload_channels(instance)
+    old_batch_id = getattr(instance, '_batch_id_before_save', None)
+    if old_batch_id and old_batch_id != instance.batch_id:
+        channels.append(batch_channel(old_batch_id))
+    visibility.notify_visibility_change(instance.pk, 'added' if created else 'updated', channels)
+
+
+@receiver(pre_delete, sender=Upload)
+def remember_deleted_upload_audience(sender, instance, **kwargs):
+    # shared_with rows are gone by post_delete
+    instance._visibility_channels = visibility.upload_channels(instance)
+
+
+@receiver(post_delete, sender=Upload)
+def push_deleted_upload(sender, instance, **kwargs):
+    channels = getattr(instance, '_visibility_channels', None)
+    if channels is None:
+        channels = [batch_channel(instance.batch_id)] if instance.batch_id else []
+    visibility.notify_visibility_change(instance.pk, 'removed', channels)
+
+
+@receiver(m2m_changed, sender=Upload.shared_with.through)
+def push_shared_with_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Individual shares and unshares reach only the students concerned"""
+    if action == 'pre_clear':
+        if reverse:
+            instance._cleared_upload_ids = list(instance.shared_uploads.values_list('id', flat=True))
+        else:
+            instance._cleared_channels = visibility.upload_channels(instance)
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    change = 'added' if action == 'post_add' else 'removed'
+    if reverse:
+        # student.shared_uploads.add(...): one student, several uploads
+        upload_ids = pk_set if action != 'post_clear' else getattr(instance, '_cleared_upload_ids', [])
+        if instance.user_id:
+            for upload_id in upload_ids:
+                visibility.notify_visibility_change(upload_id, change, [user_channel(instance.user_id)])
+    elif action == 'post_clear':
+        visibility.notify_visibility_change(instance.pk, change, getattr(instance, '_cleared_channels', []))
+    else:
+        visibility.notify_visibility_change(instance.pk, change, visibility.student_channels(pk_set))
+
+
+@receiver(post_save, sender=Batch)
+def count_saved_batch(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        adjust_dashboard_stats(total_batches=1)
+
+
+@receiver(post_delete, sender=Batch)
+def count_deleted_batch(sender, instance, **kwargs):
+    adjust_dashboard_stats(total_batches=-1)
+
+
+@receiver(post_save, sender=Batch)
+@receiver(post_delete, sender=Batch)
+def invalidate_batch_summary(sender, **kwargs):
+    bump_version_on_commit(counters.BATCH_SUMMARY_VERSION)
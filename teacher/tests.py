@@ -1,3 +1,482 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import Future
+from contextlib import contextmanager
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.contrib.admin.sites import site
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from core.models import Role, User
+from core.versions import get_version
+from core.writer import WriterBusy, write_transaction
+from student.models import Student
+
+from . import counters, extraction, search
+from .models import Batch, Upload, UploadDocument
+
+
+def _student(code, batch):
+    role, _ = Role.objects.get_or_create(role_name='Student')
+    user = User.objects.create_user(username=code, password='x', role=role, batch=batch)
+    return Student.objects.create(user=user, student_code=code, name=code, batch=batch)
+
+
+class BatchCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.a = Batch.objects.create(batch_code='A')
+        self.b = Batch.objects.create(batch_code='B')
+
+    def _counts(self, field):
+        return dict(Batch.objects.values_list('batch_code', field))
+
+    def test_student_signals_follow_create_transfer_delete(self):
+        student = _student('s1', self.a)
+        _student('s2', self.a)
+        self.assertEqual(self._counts('student_count'), {'A': 2, 'B': 0})
+
+        student = Student.objects.get(pk=student.pk)
+        student.batch = self.b
+        student.save()
+        self.assertEqual(self._counts('student_count'), {'A': 1, 'B': 1})
+
+        student.delete()
+        self.assertEqual(self._counts('student_count'), {'A': 1, 'B': 0})
+
+    def test_upload_signals_follow_batch_changes(self):
+        upload = Upload.objects.create(topic='T', subject='Maths', file='uploads/t.txt', batch=self.a)
+        Upload.objects.create(topic='U', subject='Maths', file='uploads/u.txt')
+        self.assertEqual(self._counts('upload_count'), {'A': 1, 'B': 0})
+
+        upload = Upload.objects.get(pk=upload.pk)
+        upload.batch = self.b
+        upload.save()
+        self.assertEqual(self._counts('upload_count'), {'A': 0, 'B': 1})
+
+        upload.delete()
+        self.assertEqual(self._counts('upload_count'), {'A': 0, 'B': 0})
+
+    def test_summary_version_is_bumped_on_commit(self):
+        before = get_version(counters.BATCH_SUMMARY_VERSION)
+        with self.captureOnCommitCallbacks() as callbacks:
+            counters.adjust_student_count(self.a.id, 1)
+            # Readers during the transaction still see the old version
+            self.assertEqual(get_version(counters.BATCH_SUMMARY_VERSION), before)
+        self.assertEqual(len(callbacks), 1)
+        for callback in callbacks:
+            callback()
+        self.assertGreater(get_version(counters.BATCH_SUMMARY_VERSION), before)
+
+    def test_no_bump_for_a_zero_delta(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            counters.adjust_upload_count(self.a.id, 0)
+            counters.adjust_upload_count(None, 1)
+        self.assertEqual(callbacks, [])
+
+    def test_reconcile_counters_fixes_drift(self):
+        _student('s1', self.a)
+        Upload.objects.create(topic='T', subject='Maths', file='uploads/t.txt', batch=self.b)
+        Batch.objects.filter(pk=self.a.pk).update(student_count=7)
+        Batch.objects.filter(pk=self.b.pk).update(upload_count=0, student_count=3)
+
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            call_command('reconcile_counters', stdout=out)
+        self.assertIn('Batch counters: 2 batch(es) corrected', out.getvalue())
+        self.assertTrue(callbacks)
+        self.assertEqual(self._counts('student_count'), {'A': 1, 'B': 0})
+        self.assertEqual(self._counts('upload_count'), {'A': 0, 'B': 1})
+
+        self.assertEqual(counters.reconcile_batch_counters(), 0)
+
+
+def _docx_bytes(text, title='Cells', pages=3):
+    w = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+    document = (
+        f'<w:document xmlns:w="{w}"><w:body>'
+        f'<w:p><w:r><w:t>{text}</w:t></w:r><w:r><w:t> continued</w:t></w:r></w:p>'
+        f'<w:sectPr><w:pgSz w:w="11906" w:h="16838"/></w:sectPr>'
+        f'</w:body></w:document>'
+    )
+    core = (
+        '<cp:coreProperties xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties" '
+        f'xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:title>{title}</dc:title></cp:coreProperties>'
+    )
+    app = (
+        '<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/extended-properties">'
+        f'<Pages>{pages}</Pages></Properties>'
+    )
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('word/document.xml', document)
+        archive.writestr('docProps/core.xml', core)
+        archive.writestr('docProps/app.xml', app)
+    return buffer.getvalue()
+
+
+def _pdf_bytes(text, rotate=0):
+    stream = f'BT /F1 24 Tf 72 720 Td ({text}) Tj ET'.encode()
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        (f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Rotate {rotate} '
+         f'/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>').encode(),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+        b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream',
+    ]
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+class ExtractDocumentTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def _write(self, name, data):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_docx(self):
+        path = self._write('cells.docx', _docx_bytes('The cell is the unit of life and of biology'))
+        result = extraction.extract_document(path)
+        self.assertEqual(result['status'], 'done')
+        self.assertEqual(result['text'], 'The cell is the unit of life and of biology continued')
+        self.assertEqual((result['title'], result['page_count'], result['language']), ('Cells', 3, 'en'))
+        self.assertEqual(result['page_sizes'], [{'width': 595.3, 'height': 841.9, 'pages': 1}])
+        self.assertEqual(result['content_hash'], extraction.hash_file(path))
+
+    def test_pdf(self):
+        path = self._write('leaf.pdf', _pdf_bytes('Photosynthesis in the leaf', rotate=90))
+        result = extraction.extract_document(path)
+        self.assertEqual(result['status'], 'done', result.get('error'))
+        self.assertIn('Photosynthesis in the leaf', result['text'])
+        self.assertEqual(result['page_count'], 1)
+        # A quarter turn swaps width and height
+        self.assertEqual(result['page_sizes'], [{'width': 842.0, 'height': 595.0, 'pages': 1}])
+
+    def test_unsupported_and_broken_files_do_not_raise(self):
+        self.assertEqual(extraction.extract_document(self._write('notes.txt', b'x'))['status'], 'unsupported')
+        result = extraction.extract_document(self._write('broken.docx', b'not a zip'))
+        self.assertEqual(result['status'], 'failed')
+        self.assertIn('BadZipFile', result['error'])
+
+
+@override_settings(DOCUMENT_EXTRACTION_ASYNC=False)
+class UploadExtractionTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        self.enterContext(override_settings(MEDIA_ROOT=media))
+
+    def _upload(self, name, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Upload.objects.create(topic='Cells', subject='Biology', file=SimpleUploadedFile(name, data))
+
+    def test_store_result(self):
+        upload = Upload.objects.create(topic='T', subject='Maths', file='uploads/t.docx')
+        document = extraction.store_result(upload.id, {
+            'content_hash': 'abc', 'status': 'done', 'page_count': 2, 'title': 'x' * 300, 'text': 'body',
+        })
+        self.assertEqual((document.status, document.page_count, len(document.title)), ('done', 2, 255))
+        failed = extraction.store_result(upload.id, {'content_hash': 'abc', 'status': 'failed', 'error': 'Boom'})
+        self.assertEqual(failed.pk, document.pk)
+        self.assertEqual((failed.status, failed.error, failed.text), ('failed', 'Boom', ''))
+        self.assertIsNone(extraction.store_result(upload.id + 100, {'status': 'done'}))
+
+    def test_upload_is_extracted_after_commit(self):
+        upload = self._upload('cells.docx', _docx_bytes('Mitochondria'))
+        document = UploadDocument.objects.get(upload=upload)
+        self.assertEqual(document.status, 'done')
+        self.assertIn('Mitochondria', document.text)
+
+    def test_identical_upload_reuses_the_earlier_result(self):
+        first = self._upload('cells.docx', _docx_bytes('Mitochondria'))
+        with mock.patch.object(extraction, 'extract_document', side_effect=AssertionError("re-extracted")):
+            second = self._upload('copy.docx', _docx_bytes('Mitochondria'))
+        document = UploadDocument.objects.get(upload=second)
+        self.assertEqual(document.status, 'done')
+        self.assertEqual(document.content_hash, first.document.content_hash)
+
+    def test_replaced_file_is_extracted_again(self):
+        upload = self._upload('cells.docx', _docx_bytes('Mitochondria'))
+        upload = Upload.objects.get(pk=upload.pk)
+        upload.file = SimpleUploadedFile('cells2.docx', _docx_bytes('Chloroplasts'))
+        with self.captureOnCommitCallbacks(execute=True):
+            upload.save()
+        document = UploadDocument.objects.get(upload=upload)
+        self.assertIn('Chloroplasts', document.text)
+        self.assertEqual(document.content_hash, extraction.hash_file(upload.file.path))
+
+    def test_other_edits_do_not_extract(self):
+        upload = self._upload('cells.docx', _docx_bytes('Mitochondria'))
+        upload = Upload.objects.get(pk=upload.pk)
+        upload.topic = 'Organelles'
+        with mock.patch.object(extraction, 'schedule_extraction') as schedule:
+            upload.save()
+        schedule.assert_not_called()
+
+
+def _busy_writes(times):
+    """A write_transaction that reports a busy queue ``times`` times before letting writes through"""
+    calls = []
+
+    @contextmanager
+    def busy_write_transaction(*args, **kwargs):
+        calls.append(1)
+        if len(calls) <= times:
+            raise WriterBusy(1)
+        with write_transaction(*args, **kwargs):
+            yield
+    return busy_write_transaction
+
+
+class ExtractionResultTests(TestCase):
+    def setUp(self):
+        self.upload = Upload.objects.create(topic='T', subject='Maths', file='uploads/t.docx')
+        UploadDocument.objects.create(upload=self.upload, status='pending')
+        self.result = {'content_hash': 'abc', 'status': 'done', 'page_count': 2, 'text': 'body'}
+        sleep = mock.patch.object(extraction.time, 'sleep')
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def _status(self):
+        return UploadDocument.objects.get(upload=self.upload).status
+
+    def test_busy_queue_is_retried(self):
+        with mock.patch.object(extraction, 'write_transaction', _busy_writes(2)):
+            document = extraction.store_result(self.upload.id, self.result, retries=2)
+        self.assertEqual(document.status, 'done')
+        self.assertEqual(self.sleep.call_args_list, [mock.call(1), mock.call(1)])
+
+    def test_result_stays_pending_when_the_queue_stays_busy(self):
+        writer = extraction.ResultWriter(retries=1)
+        with mock.patch.object(extraction, 'write_transaction', _busy_writes(2)), \
+                self.assertLogs('teacher.extraction', level='ERROR') as logs:
+            writer.write(self.upload.id, self.result)
+        self.assertIn('left pending', logs.output[0])
+        self.assertEqual(self._status(), 'pending')
+
+    def test_pool_callback_only_queues_the_result(self):
+        done, crashed = Future(), Future()
+        done.set_result(self.result)
+        crashed.set_exception(RuntimeError('cannot schedule new futures after shutdown'))
+        writer = mock.Mock()
+        with mock.patch.object(extraction, 'get_result_writer', return_value=writer), \
+                mock.patch.object(extraction, 'store_result') as store, \
+                self.assertLogs('teacher.extraction', level='ERROR'):
+            extraction._on_extracted(self.upload.id)(done)
+            extraction._on_extracted(self.upload.id)(crashed)
+        store.assert_not_called()
+        self.assertEqual(writer.put.call_args_list[0], mock.call(self.upload.id, self.result))
+        failed = writer.put.call_args_list[1].args[1]
+        self.assertEqual(failed['status'], 'failed')
+        self.assertIn('RuntimeError', failed['error'])
+
+    def test_writer_thread_stores_queued_results(self):
+        writer = extraction.ResultWriter()
+        with mock.patch.object(writer, 'write') as write:
+            writer.put(self.upload.id, self.result)
+            deadline = time.monotonic() + 5
+            while not write.called and time.monotonic() < deadline:
+                writer._thread.join(0.01)
+        write.assert_called_once_with(self.upload.id, self.result)
+
+    @override_settings(DOCUMENT_EXTRACTION_ASYNC=False)
+    def test_backfill_counts_busy_uploads_and_carries_on(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        with override_settings(MEDIA_ROOT=media):
+            with self.captureOnCommitCallbacks(execute=True):
+                first = Upload.objects.create(topic='A', subject='Biology', file=SimpleUploadedFile('a.docx', _docx_bytes('Cells')))
+            # Not extracted yet: its on_commit callback never ran
+            Upload.objects.create(topic='B', subject='Biology', file=SimpleUploadedFile('b.docx', _docx_bytes('Cells')))
+            out, err = StringIO(), StringIO()
+            with mock.patch.object(extraction, 'write_transaction', _busy_writes(extraction.RESULT_RETRIES + 1)):
+                call_command('extract_documents', stdout=out, stderr=err)
+        self.assertIn('reused=0', out.getvalue())
+        self.assertIn('busy=1', out.getvalue())
+        self.assertIn('write queue busy', err.getvalue())
+        self.assertEqual(first.document.status, 'done')
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        role = Role.objects.create(role_name='Teacher')
+        self.teacher = User.objects.create_user(username='ada', password='x', first_name='Ada', last_name='Lovelace', role=role)
+
+    def _upload(self, topic, description='', **kwargs):
+        return Upload.objects.create(
+            topic=topic, description=description, subject='Science', file='uploads/x.pdf', teacher=self.teacher, **kwargs
+        )
+
+    def _ids(self, text, **kwargs):
+        return [upload_id for upload_id, _ in search.ranked_upload_ids(text, **kwargs)]
+
+    def test_match_query_is_quoted_with_a_prefix_on_the_last_word(self):
+        self.assertEqual(search.build_match_query('cell "OR" divi'), '"cell" "OR" "divi"*')
+        self.assertEqual(search.build_match_query(' -- '), '')
+
+    def test_index_follows_save_and_delete(self):
+        self.assertTrue(search.fts_available())
+        upload = self._upload('Photosynthesis')
+        self.assertEqual(self._ids('photo'), [upload.id])
+
+        upload.topic = 'Respiration'
+        upload.save()
+        self.assertEqual(self._ids('photosynthesis'), [])
+        self.assertEqual(self._ids('respiration'), [upload.id])
+
+        upload_id = upload.id
+        upload.delete()
+        self.assertEqual(self._ids('respiration'), [])
+        self.assertEqual(search.rebuild_index(), 0)
+        self.assertNotIn(upload_id, self._ids('science'))
+
+    def test_topic_match_ranks_above_description(self):
+        in_description = self._upload('Plants', description='notes on mitosis and more')
+        in_topic = self._upload('Mitosis')
+        self.assertEqual(self._ids('mitosis'), [in_topic.id, in_description.id])
+
+    def test_visibility_filter_runs_before_the_limit(self):
+        hidden = [self._upload('Mitosis', is_active=False) for _ in range(3)]
+        visible = self._upload('Plants', description='mitosis')
+        self.assertEqual(self._ids('mitosis', limit=3), [upload.id for upload in hidden])
+        within = Upload.objects.filter(is_active=True)
+        self.assertEqual(self._ids('mitosis', limit=3, within=within), [visible.id])
+        self.assertEqual(search.search_uploads('mitosis', within, limit=1), [visible])
+
+    def test_teacher_rename_is_reindexed(self):
+        upload = self._upload('Cells')
+        self.assertEqual(self._ids('lovelace'), [upload.id])
+        teacher = User.objects.get(pk=self.teacher.pk)
+        teacher.last_name = 'Byron'
+        teacher.save()
+        self.assertEqual(self._ids('lovelace'), [])
+        self.assertEqual(self._ids('byron'), [upload.id])
+
+    def test_admin_search_keeps_rank_order(self):
+        in_description = self._upload('Plants', description='mitosis')
+        in_topic = self._upload('Mitosis')
+        admin = User.objects.create_superuser(username='root', password='x', role=self.teacher.role)
+        request = RequestFactory().get('/admin/teacher/upload/', {'q': 'mitosis'})
+        request.user = admin
+        changelist = site._registry[Upload].get_changelist_instance(request)
+        self.assertEqual(list(changelist.get_queryset(request)), [in_topic, in_description])
+
+        request = RequestFactory().get('/admin/teacher/upload/', {'q': 'mitosis', 'o': '-1'})
+        request.user = admin
+        changelist = site._registry[Upload].get_changelist_instance(request)
+        self.assertEqual(list(changelist.get_queryset(request)), [in_description, in_topic])
+
+
+class UploadOpensViewTests(TestCase):
+    def setUp(self):
+        roles = {name: Role.objects.create(role_name=name) for name in ('Admin', 'Teacher', 'Student')}
+        self.owner = User.objects.create_user(username='owner', password='x', role=roles['Teacher'])
+        self.other = User.objects.create_user(username='other', password='x', role=roles['Teacher'])
+        self.admin = User.objects.create_user(username='admin', password='x', role=roles['Admin'])
+        self.batch = Batch.objects.create(batch_code='B1')
+        self.student = _student('s1', self.batch)
+        self.upload = Upload.objects.create(topic='T', subject='Maths', file='uploads/t.pdf', teacher=self.owner, batch=self.batch)
+        self.url = f'/teacher/uploads/{self.upload.id}/opens/'
+
+    def _get(self, user, url=None):
+        self.client.force_login(user)
+        return self.client.get(url or self.url)
+
+    def test_owner_and_admin_see_the_summary(self):
+        from student.tracking import write_events
+
+        write_events([(self.upload.id, self.student.id, timezone.now())])
+        for user in (self.owner, self.admin):
+            response = self._get(user)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual((response.json()['opened'], response.json()['audience']), (1, 1))
+
+    def test_other_teachers_and_students_are_refused(self):
+        self.assertEqual(self._get(self.other).status_code, 403)
+        self.assertEqual(self._get(self.student.user).status_code, 403)
+
+    def test_missing_upload(self):
+        self.assertEqual(self._get(self.owner, f'/teacher/uploads/{self.upload.id + 100}/opens/').status_code, 404)
+
+
+@override_settings(DOCUMENT_EXTRACTION_ASYNC=False)
+class ShareFileViewTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        self.enterContext(override_settings(MEDIA_ROOT=media))
+        self.media = media
+        teacher = User.objects.create_user(username='ada', password='x', role=Role.objects.create(role_name='Teacher'))
+        self.batch = Batch.objects.create(batch_code='B1')
+        self.students = [_student('s1', self.batch), _student('s2', self.batch)]
+        self.client.force_login(teacher)
+
+    def _post(self, students=('0',)):
+        return self.client.post('/teacher/upload/', {
+            'teacherName': 'Ada', 'teacherCode': 'T1', 'subject': 'Biology', 'topic': 'Cells',
+            'batchCode': 'B1', 'batchStudents': list(students), 'fromDate': '2026-01-01', 'toDate': '2026-12-31',
+            'file': SimpleUploadedFile('cells.docx', _docx_bytes('Mitochondria')),
+        })
+
+    def _stored_files(self):
+        folder = os.path.join(self.media, 'uploads')
+        return os.listdir(folder) if os.path.isdir(folder) else []
+
+    def test_file_is_stored_and_hashed_outside_the_write_slot(self):
+        from core.writer import get_scheduler
+
+        held = []
+        real_hash_file = extraction.hash_file
+
+        def hash_file(path):
+            held.append((get_scheduler().holding(), os.path.exists(path)))
+            return real_hash_file(path)
+
+        with mock.patch('teacher.views.hash_file', side_effect=hash_file), \
+                mock.patch.object(extraction, 'hash_file', wraps=real_hash_file) as hashed_again, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self._post(students=['s2'])
+        self.assertRedirects(response, '/teacher/upload/', fetch_redirect_response=False)
+        self.assertEqual(held, [(False, True)])
+        # Only extract_document reads the file again; the commit hook reuses the hash
+        self.assertEqual(hashed_again.call_count, 1)
+        upload = Upload.objects.get()
+        self.assertEqual(list(upload.shared_with.all()), [self.students[1]])
+        self.assertEqual(upload.document.status, 'done')
+        self.assertIn('Mitochondria', upload.document.text)
+
+    def test_busy_write_slot_removes_the_stored_file(self):
+        with mock.patch('teacher.views.write_transaction', side_effect=WriterBusy(3)):
+            response = self._post()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '3')
+        self.assertFalse(Upload.objects.exists())
+        self.assertEqual(self._stored_files(), [])
+
+    def test_unknown_students_store_nothing(self):
+        response = self._post(students=['nobody'])
+        self.assertRedirects(response, '/teacher/upload/', fetch_redirect_response=False)
+        self.assertFalse(Upload.objects.exists())
+        self.assertEqual(self._stored_files(), [])
@@ -6,7 +6,11 @@ from django.http import JsonResponse
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from student.models import Student
+from student.tracking import open_summary
+from .extraction import hash_file
 from .models import Batch, Upload
+from core.decorators import atomic_view, autocommit_view, busy_response, read_only_view
+from core.writer import WriterBusy, write_transaction
 from core.models import Role
 import os
 import logging
@@ -20,6 +24,7 @@ User = get_user_model()
 logger = logging.getLogger(__name__)
 
 @login_required
+@autocommit_view  # The file is stored and hashed before the write slot is taken
 def share_file(request):
     if not request.user.is_authenticated:
         messages.error(request, "Please log in to share files.")
@@ -96,119 +101,107 @@ def share_file(request):
             messages.error(request, 'Invalid date format. Use YYYY-MM-DD.')
             return redirect('teacher:upload')
 
-        try:
-            # Get or create the default Student role
-            student_role, _ = Role.objects.get_or_create(role_name='Student')
-
-            # Get or create batch
+        # Resolve the recipients before anything is stored
+        batch = Batch.objects.filter(batch_code=batch_code).first()
+        if batch is None:
             try:
-                batch = Batch.objects.get(batch_code=batch_code)
-                logger.info(f"Found existing batch: {batch_code}")
-            except Batch.DoesNotExist:
-                batch = Batch.objects.create(batch_code=batch_code)
-                logger.info(f"Created new batch: {batch_code}")
-            
-            # Check if batch has students
-            student_count = Student.objects.filter(batch=batch).count()
-            logger.info(f"Batch {batch_code} has {student_count} students")
-            
-            if student_count == 0:
-                messages.warning(request, f"Batch {batch_code} has no students. Please add students to this batch first.")
+                with write_transaction():
+                    batch, _ = Batch.objects.get_or_create(batch_code=batch_code)
+            except WriterBusy as e:
+                return busy_response(request, e.retry_after, "The server is busy saving other changes.")
+            logger.info(f"Created new batch: {batch_code}")
+        else:
+            logger.info(f"Found existing batch: {batch_code}")
+
+        # Check if batch has students
+        student_count = batch.student_count
+        logger.info(f"Batch {batch_code} has {student_count} students")
+
+        if student_count == 0:
+            messages.warning(request, f"Batch {batch_code} has no students. Please add students to this batch first.")
+            return redirect('teacher:upload')
+
+        if not student_ids:
+            messages.error(request, 'No students selected.')
+            return redirect('teacher:upload')
+
+        logger.info(f"Processing student selection. Student IDs: {student_ids}")
+        students_to_add = None
+        if 'all' not in student_ids:
+            students_to_add = list(Student.objects.filter(student_code__in=student_ids, batch=batch))
+            if not students_to_add:
+                messages.error(request, 'No valid students selected.')
                 return redirect('teacher:upload')
 
-            # Create Upload instance
+        # Write the file to storage and hash it before taking the write slot;
+        # the transaction only records the upload
+        file_field = Upload._meta.get_field('file')
+        try:
+            stored_name = file_field.storage.save(file_field.generate_filename(None, uploaded_file.name), uploaded_file)
+            content_hash = hash_file(file_field.storage.path(stored_name))
+        except Exception as e:
+            logger.error(f"Error storing uploaded file: {str(e)}", exc_info=True)
+            messages.error(request, f"Error uploading file: {str(e)}")
+            return redirect('teacher:upload')
+        logger.info(f"File saved at: {file_field.storage.path(stored_name)}")
+
+        try:
             logger.info(f"Attempting to create Upload instance with:\n" +
                       f"Teacher: {request.user.get_full_name()} (ID: {request.user.id})\n" +
                       f"Batch: {batch_code}\n" +
                       f"Topic: {topic}")
 
-            upload = Upload(
-                teacher=request.user,
-                teacher_code=teacher_code,
-                subject=subject,
-                topic=topic,
-                sub_topic=sub_topic,
-                batch=batch,
-                file=uploaded_file,
-                from_date=from_date_obj,
-                to_date=to_date_obj,
-                is_active=True
-            )
-
-            try:
+            with write_transaction():
+                # Get or create the default Student role
+                student_role, _ = Role.objects.get_or_create(role_name='Student')
+
+                upload = Upload(
+                    teacher=request.user,
+                    teacher_code=teacher_code,
+                    subject=subject,
+                    topic=topic,
+                    sub_topic=sub_topic,
+                    batch=batch,
+                    file=stored_name,
+                    from_date=from_date_obj,
+                    to_date=to_date_obj,
+                    is_active=True
+                )
+                # Already hashed, so extraction does not read the file again
+                upload._content_hash = content_hash
                 upload.save()
                 logger.info(f"Successfully saved upload with ID: {upload.id}")
-                
-                # Verify file was saved
-                if upload.file:
-                    logger.info(f"File saved at: {upload.file.path}")
-                else:
-                    raise Exception("File was not saved correctly")
-                    
-            except Exception as e:
-                logger.error(f"Error creating upload: {str(e)}", exc_info=True)
-                messages.error(request, f"Error uploading file: {str(e)}")
-                return redirect('teacher:upload')
-            
-            # Handle student selection
-            if not student_ids:
-                messages.error(request, 'No students selected.')
-                if upload.id:
-                    upload.delete()
-                return redirect('teacher:upload')
 
-            try:
-                logger.info(f"Processing student selection. Student IDs: {student_ids}")
-                
-                if student_count == 0:
-                    logger.warning(f"Batch {batch_code} has no students!")
-                    messages.warning(request, f"Warning: Batch {batch_code} currently has no students.")
-                    if upload.id:
-                        upload.delete()
-                    return redirect('teacher:upload')
-                
-                if 'all' in student_ids:
+                if students_to_add is None:
                     # For "all students" option, don't add any specific students to shared_with
                     upload.shared_with.clear()
                     logger.info(f"Sharing file with ALL students in batch {batch_code}")
                     success_message = f'File shared successfully to all {student_count} students in batch {batch_code}.'
-                    logger.info(f"Batch {batch_code} has {student_count} students")
                 else:
-                    # Get the selected students
-                    students_to_add = Student.objects.filter(student_code__in=student_ids, batch=batch)
-                    if not students_to_add.exists():
-                        messages.error(request, 'No valid students selected.')
-                        upload.delete()
-                        return redirect('teacher:upload')
-                    
                     # Set specific students
                     upload.shared_with.set(students_to_add)
-                    student_names = ", ".join([student.name for student in students_to_add])
-                    success_message = f'File shared successfully to {students_to_add.count()} selected students in batch {batch_code}.'
-                    logger.info(f"Sharing file with {students_to_add.count()} students: {[s.student_code for s in students_to_add]}")
-
-            except Exception as e:
-                logger.error(f"Error sharing file: {str(e)}", exc_info=True)
-                if upload.id:
-                    upload.delete()
-                messages.error(request, 'Error sharing file. Please try again.')
-                return redirect('teacher:upload')
-
-            logger.info(f"Successfully shared file:\n" +
-                      f"File: {uploaded_file.name}\n" +
-                      f"Subject: {subject}\n" +
-                      f"Topic: {topic}\n" +
-                      f"Batch: {batch_code}\n" +
-                      f"Teacher: {teacher_name} ({teacher_code})")
-                      
-            messages.success(request, success_message)
-            return redirect('teacher:upload')
+                    success_message = f'File shared successfully to {len(students_to_add)} selected students in batch {batch_code}.'
+                    logger.info(f"Sharing file with {len(students_to_add)} students: {[s.student_code for s in students_to_add]}")
 
+        except WriterBusy as e:
+            file_field.storage.delete(stored_name)
+            return busy_response(request, e.retry_after, "The server is busy saving other changes.")
         except Exception as e:
-            logger.error(f"Unexpected error in share_file: {str(e)}", exc_info=True)
-            messages.error(request, 'An unexpected error occurred. Please try again.')
+            logger.error(f"Error sharing file: {str(e)}", exc_info=True)
+            file_field.storage.delete(stored_name)
+            messages.error(request, 'Error sharing file. Please try again.')
             return redirect('teacher:upload')
 
+        logger.info(f"Successfully shared file:\n" +
+                  f"File: {uploaded_file.name}\n" +
+                  f"Subject: {subject}\n" +
+                  f"Topic: {topic}\n" +
+                  f"Batch: {batch_code}\n" +
+                  f"Teacher: {teacher_name} ({teacher_code})")
+
+        messages.success(request, success_message)
+        return redirect('teacher:upload')
+
     # GET request: Render the form
     batches = Batch.objects.all()
 
@@ -221,6 +214,7 @@ def share_file(request):
     return render(request, 'teacher/upload.html', context)
 
 @login_required
+@read_only_view
 def get_students_by_batch(request):
     batch_code = request.GET.get('batchCode', '').strip()
     if not batch_code:
@@ -375,6 +369,7 @@ def manage_students(request):
     return render(request, 'teacher/manage_students.html', {'batches': batches})
 
 @login_required
+@read_only_view
 def get_batch_students(request, batch_id):
     try:
         batch = Batch.objects.get(id=batch_id)
@@ -384,4 +379,25 @@ def get_batch_students(request, batch_id):
     except Batch.DoesNotExist:
         return JsonResponse({'error': 'Batch not found'}, status=404)
     except Exception as e:
-        return JsonResponse({'error': str(e)}, status=500)
\ No newline at end of file
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@login_required
+@read_only_view
+def upload_opens(request, upload_id):
+    """Which of the students who can see an upload have opened it"""
+    user_role = request.user.role.role_name if hasattr(request.user, 'role') and request.user.role else None
+    if user_role not in ["Teacher", "Admin"]:
+        return JsonResponse({'status': 'error', 'message': 'Permission denied'}, status=403)
+    try:
+        upload = Upload.objects.get(id=upload_id)
+    except Upload.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Upload not found'}, status=404)
+    if user_role == "Teacher" and upload.teacher_id != request.user.id:
+        return JsonResponse({'status': 'error', 'message': 'Permission denied'}, status=403)
+
+    try:
+        return JsonResponse({'status': 'success', 'upload_id': upload.id, **open_summary(upload)})
+    except Exception as e:
+        logger.error(f"Error summarising opens of upload {upload_id}: {str(e)}", exc_info=True)
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)